@@ -1,5 +1,14 @@
-# This will make sure the app is always imported when
-# Django starts so that shared_task will use this app.
-from .celery import app as celery_app
+# The Celery app is loaded lazily: web workers and most manage.py commands
+# never touch it, so importing it here only slowed down every boot.
+# `celery -A my_todo` still finds my_todo.celery, and todo_app.tasks imports
+# it before any task is bound or sent.
 
-__all__ = ('celery_app',)
\ No newline at end of file
+
+def __getattr__(name):
+    if name == 'celery_app':
+        from .celery import app
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+__all__ = ('celery_app',)
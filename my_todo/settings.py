@@ -46,12 +46,16 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'todo_app.middleware.ApiTokenMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django_htmx.middleware.HtmxMiddleware',
 
     'allauth.account.middleware.AccountMiddleware',
     'todo_app.middleware.CsrfExemptForHtmx',
+    'todo_app.middleware.RateLimitMiddleware',
+    'todo_app.middleware.ProfilingMiddleware',
+    'todo_app.middleware.EventActorMiddleware',
 ]
 
 ROOT_URLCONF = 'my_todo.urls'
@@ -187,3 +191,84 @@ CELERY_RESULT_BACKEND = "redis://127.0.0.1:6379/0"
 
 CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
+# Periodic tasks (run with `celery -A my_todo beat`)
+CELERY_BEAT_SCHEDULE = {
+    'send-due-reminders': {
+        'task': 'todo_app.tasks.send_due_reminders',
+        'schedule': 60.0,
+    },
+    'materialize-recurring-todos': {
+        'task': 'todo_app.tasks.materialize_recurring_todos',
+        'schedule': 300.0,
+    },
+    'take-due-snapshots': {
+        'task': 'todo_app.tasks.take_due_snapshots',
+        'schedule': 300.0,
+    },
+    'purge-stale-uploads': {
+        'task': 'todo_app.tasks.purge_stale_uploads',
+        'schedule': 3600.0,
+    },
+}
+
+# Remind users about todos due within this many minutes
+TODO_REMINDER_LEAD_MINUTES = 60
+
+# Recurring todos exist as rows only this many days ahead
+TODO_RECURRENCE_HORIZON_DAYS = 7
+
+# History snapshots: "as of" / undo replay at most this many events
+TODO_SNAPSHOT_EVERY = 50
+
+# List pages send only this much of each description; the rest loads on expand
+TODO_DESCRIPTION_PREVIEW_CHARS = 200
+
+# Todo attachments (filesystem storage, content-addressed by SHA-256)
+TODO_ATTACHMENT_ROOT = BASE_DIR / 'attachments'
+TODO_ATTACHMENT_CHUNK_BYTES = 4 * 1024 * 1024
+TODO_ATTACHMENT_MAX_BYTES = 100 * 1024 * 1024
+TODO_ATTACHMENT_QUOTA_BYTES = 1024 * 1024 * 1024
+# Unfinished uploads idle this long are purged with their part files
+TODO_ATTACHMENT_UPLOAD_TTL_HOURS = 24
+# Internal location the web server serves TODO_ATTACHMENT_ROOT from, e.g.
+# '/protected-attachments/' for nginx X-Accel-Redirect; unset = Django sends
+TODO_ATTACHMENT_ACCEL_REDIRECT = os.getenv('TODO_ATTACHMENT_ACCEL_REDIRECT') or None
+
+# Report STARTED so the mail status fragment can show "running"
+CELERY_TASK_TRACK_STARTED = True
+
+# Shared cache, used to coalesce digest emails across web workers
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('CACHE_URL', 'redis://127.0.0.1:6379/1'),
+    }
+}
+
+# Clicks on "Mail My Todos" within this window attach to the queued digest
+TODO_MAIL_COALESCE_SECONDS = 300
+
+# Token buckets for todo_app POST/PUT/DELETE endpoints: url name -> (capacity, tokens/second).
+# Endpoints without an entry each get a bucket of the 'default' size.
+TODO_RATE_LIMITS = {
+    'default': (30, 1.0),
+    # One token per operation; a full batch (api.MAX_BATCH) must fit
+    'api_todo_batch': (200, 5.0),
+    'create': (10, 0.5),
+    'toggle': (20, 2.0),
+    'mail_todos': (5, 0.1),
+    # One token per chunk (TODO_ATTACHMENT_CHUNK_BYTES), about 40 MB/s sustained
+    'attachment_upload': (20, 10.0),
+}
+# Shared by all users; once empty, mutations are shed with 503
+TODO_RATE_LIMIT_GLOBAL = (1000, 200.0)
+
+# On-demand request profiles (staff + X-Todo-Profile header), see todo_profiles
+TODO_PROFILE_DIR = BASE_DIR / 'profiles'
+TODO_PROFILE_KEEP = 50
+TODO_PROFILE_INTERVAL = 0.005
+
+# How TodoEvents are written: 'signals' (Python, default) or 'triggers'
+# (PostgreSQL/SQLite triggers, also logs QuerySet.update()). Run
+# `manage.py migrate` after changing it to install or drop the triggers.
+TODO_EVENT_LOGGING = os.getenv('TODO_EVENT_LOGGING', 'signals')
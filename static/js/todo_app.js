@@ -26,10 +26,118 @@
                     // Show error toast
                     showToast('Error: ' + (evt.detail.xhr.responseText || 'Something went wrong'), 'danger');
                     evt.detail.shouldSwap = false;
+                } else if (evt.detail.xhr.status === 429 || evt.detail.xhr.status === 503) {
+                    // Rate limited or shed under load
+                    const retryAfter = evt.detail.xhr.getResponseHeader('Retry-After') || '1';
+                    showToast('Too many requests, try again in ' + retryAfter + 's', 'warning');
+                    evt.detail.shouldSwap = false;
+                } else if (evt.detail.xhr.status === 409) {
+                    // Changed in another tab: show the fresh item instead
+                    showToast('This todo was changed elsewhere, showing the latest version', 'warning');
+                    evt.detail.shouldSwap = true;
+                    evt.detail.isError = false;
                 }
             });
         });
         
+        // Drag-and-drop reordering: move the card locally, then tell the
+        // server its new neighbours so only the moved todo is re-ranked
+        let draggedCard = null;
+        
+        function neighbourId(card, direction) {
+            let sibling = card[direction];
+            while (sibling && !sibling.classList.contains('todo-card')) {
+                sibling = sibling[direction];
+            }
+            return sibling ? sibling.dataset.todoId : '';
+        }
+        
+        document.addEventListener('dragstart', function(evt) {
+            const card = evt.target.closest && evt.target.closest('#todo-items > .todo-card');
+            if (!card) return;
+            draggedCard = card;
+            evt.dataTransfer.effectAllowed = 'move';
+        });
+        
+        document.addEventListener('dragover', function(evt) {
+            if (!draggedCard) return;
+            const card = evt.target.closest('#todo-items > .todo-card');
+            if (!card || card === draggedCard) return;
+            evt.preventDefault();
+            const rect = card.getBoundingClientRect();
+            const below = evt.clientY > rect.top + rect.height / 2;
+            card.parentNode.insertBefore(draggedCard, below ? card.nextSibling : card);
+        });
+        
+        document.addEventListener('drop', function(evt) {
+            if (draggedCard) evt.preventDefault();
+        });
+        
+        document.addEventListener('dragend', function(evt) {
+            if (!draggedCard) return;
+            const card = draggedCard;
+            draggedCard = null;
+            htmx.ajax('POST', card.dataset.moveUrl, {
+                swap: 'none',
+                values: {
+                    after: neighbourId(card, 'previousElementSibling'),
+                    before: neighbourId(card, 'nextElementSibling'),
+                },
+            });
+        });
+        
+        // Attachments go up in chunks (PUT with Content-Range) so a dropped
+        // connection only costs the current chunk; the server says where to
+        // continue from after a conflict or a failed request.
+        document.addEventListener('change', async function(evt) {
+            const input = evt.target;
+            if (!input.dataset || !input.dataset.attachmentUpload || !input.files.length) return;
+            const file = input.files[0];
+            const progress = input.parentElement.querySelector('.progress');
+            const bar = progress.querySelector('.progress-bar');
+            const csrf = {'X-CSRFToken': input.dataset.csrf};
+            input.disabled = true;
+            progress.classList.remove('d-none');
+            
+            try {
+                const body = new FormData();
+                body.append('name', file.name);
+                body.append('size', file.size);
+                body.append('content_type', file.type);
+                let response = await fetch(input.dataset.attachmentUpload, {method: 'POST', headers: csrf, body: body});
+                let data = await response.json();
+                if (!response.ok) throw new Error(data.error);
+                const uploadUrl = data.upload_url;
+                let offset = data.offset;
+                let failures = 0;
+                
+                while (offset < file.size) {
+                    bar.style.width = Math.floor(offset * 100 / file.size) + '%';
+                    const end = Math.min(offset + data.chunk_size, file.size) - 1;
+                    try {
+                        response = await fetch(uploadUrl, {
+                            method: 'PUT',
+                            headers: {...csrf, 'Content-Range': `bytes ${offset}-${end}/${file.size}`},
+                            body: file.slice(offset, end + 1),
+                        });
+                    } catch (networkError) {
+                        if (++failures > 5) throw networkError;
+                        await new Promise(resolve => setTimeout(resolve, 1000 * failures));
+                        // Ask how far the server got before sending again
+                        response = await fetch(uploadUrl);
+                    }
+                    const result = await response.json();
+                    if (!response.ok && response.status !== 409) throw new Error(result.error);
+                    offset = result.offset;
+                }
+                htmx.ajax('GET', input.dataset.attachmentUpload, {target: input.dataset.attachmentTarget, swap: 'innerHTML'});
+            } catch (error) {
+                showToast('Upload failed: ' + (error.message || 'Something went wrong'), 'danger');
+                input.disabled = false;
+                progress.classList.add('d-none');
+            }
+        });
+        
         function showToast(message, type) {
             const toast = document.createElement('div');
             toast.className = `alert alert-${type} alert-dismissible fade show position-fixed`;
@@ -0,0 +1,62 @@
+# todo_app/access.py
+"""
+Cached list roles for shared todo lists.
+
+Views that work on a whole list (the list page, creating a todo in it)
+only need the user's role, so it is cached twice: on the request, so a
+request asks at most once per list, and in the shared cache per list,
+so most requests don't ask the database at all.
+
+Each list has a version number in the cache that is part of every role
+key. A membership change bumps it (see signals.invalidate_list_roles),
+which orphans all of the list's cached roles in one write instead of
+deleting one key per member.
+"""
+
+import time
+
+from django.core.cache import cache
+
+from .models import ListMembership
+
+ROLE_TIMEOUT = 300
+
+# Cached stand-in for "not a member", so outsiders are cached too
+NO_ROLE = ''
+
+
+def _version_key(todo_list_id):
+    return f'todo_app:list_roles:{todo_list_id}:version'
+
+
+def _role_key(todo_list_id, version, user_id):
+    return f'todo_app:list_roles:{todo_list_id}:v{version}:{user_id}'
+
+
+def list_role(request, todo_list_id):
+    """Return request.user's role on the list, or None if not a member."""
+    roles = request.__dict__.setdefault('_todo_list_roles', {})
+    if todo_list_id not in roles:
+        roles[todo_list_id] = cached_list_role(request.user.pk, todo_list_id)
+    return roles[todo_list_id]
+
+
+def cached_list_role(user_id, todo_list_id):
+    """Shared-cache wrapper around ListMembership.objects.role_of()."""
+    version = cache.get_or_set(_version_key(todo_list_id), 1, timeout=None)
+    key = _role_key(todo_list_id, version, user_id)
+    role = cache.get(key)
+    if role is None:
+        role = ListMembership.objects.role_of(user_id, todo_list_id) or NO_ROLE
+        cache.set(key, role, timeout=ROLE_TIMEOUT)
+    return role or None
+
+
+def invalidate_list_roles(todo_list_id):
+    """Drop every cached role for the list by moving it to a new version."""
+    try:
+        cache.incr(_version_key(todo_list_id))
+    except ValueError:
+        # The version was evicted, but roles cached under it may not have
+        # been; a fresh value (rather than the default 1 again) orphans them
+        cache.set(_version_key(todo_list_id), time.time_ns(), timeout=None)
@@ -1,3 +1,208 @@
-from django.contrib import admin
+# todo_app/admin.py
+"""
+Admin for the Todo and TodoEvent tables, which have millions of rows.
 
-# Register your models here.
+The stock ModelAdmin runs an exact COUNT(*) (twice) on every changelist,
+pages with OFFSET, renders <select>s of every user and loads foreign keys
+row by row. The admins here instead:
+
+- count with the planner's estimate (pg_class.reltuples) when unfiltered,
+  and with a capped COUNT otherwise (EstimatedCountPaginator);
+- page by primary key (?after=<pk>) instead of OFFSET (KeysetChangeList);
+- use raw id / autocomplete widgets and list_select_related;
+- soft delete and restore in bulk with one UPDATE each.
+"""
+
+from django.contrib import admin, messages
+from django.contrib.admin.views.main import ChangeList
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from .models import Todo, TodoEvent
+
+# Query parameter of the keyset cursor: show rows with pk below this
+CURSOR_VAR = 'after'
+
+# Filtered changelists count at most this many rows
+COUNT_CAP = 10000
+
+
+def estimated_count(queryset, cap=COUNT_CAP):
+    """
+    Return (count, kind) for a changelist queryset, where kind is 'estimate'
+    (from the table statistics), 'capped' (at least ``cap``) or 'exact'.
+
+    Only an unfiltered queryset can use the statistics; otherwise the
+    COUNT runs over at most ``cap`` rows, so it stays cheap either way.
+    """
+    connection = connections[queryset.db]
+    if not queryset.query.where and connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                [connection.ops.quote_name(queryset.model._meta.db_table)],
+            )
+            row = cursor.fetchone()
+        # -1 until the table has been vacuumed or analyzed
+        if row is not None and row[0] >= 0:
+            return row[0], 'estimate'
+    count = queryset.order_by()[:cap].count()
+    return count, 'capped' if count >= cap else 'exact'
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator whose count comes from estimated_count()."""
+
+    @cached_property
+    def count_and_kind(self):
+        return estimated_count(self.object_list)
+
+    @cached_property
+    def count(self):
+        return self.count_and_kind[0]
+
+
+class KeysetChangeList(ChangeList):
+    """
+    Changelist that pages by primary key, newest first, instead of OFFSET.
+
+    The admin has to order by -pk only (see KeysetPaginatedAdmin), so the
+    next page is simply the next rows below the last pk shown, and every
+    page costs the same however deep it is.
+    """
+
+    def get_results(self, request):
+        paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        count, kind = paginator.count_and_kind
+
+        queryset = self.queryset
+        cursor = getattr(request, '_admin_cursor', None)
+        if cursor is not None:
+            queryset = queryset.filter(pk__lt=cursor)
+        # One extra row tells us whether there is a next page
+        rows = list(queryset[:self.list_per_page + 1])
+
+        self.result_list = rows[:self.list_per_page]
+        self.result_count = count
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.can_show_all = False
+        self.multi_page = False
+        self.paginator = paginator
+
+        self.next_page_url = (
+            self.get_query_string({CURSOR_VAR: self.result_list[-1].pk})
+            if len(rows) > self.list_per_page else None
+        )
+        self.first_page_url = self.get_query_string() if cursor is not None else None
+        self.result_count_label = {
+            'estimate': f"about {count:,}",
+            'capped': f"{count:,}+",
+            'exact': f"{count:,}",
+        }[kind]
+
+
+class KeysetPaginatedAdmin(admin.ModelAdmin):
+    """
+    Base admin for very large tables: estimated counts, keyset pages.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    # Keyset paging needs one fixed order, so columns are not sortable
+    ordering = ('-pk',)
+    sortable_by = ()
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def changelist_view(self, request, extra_context=None):
+        # ChangeList treats unknown query parameters as field lookups, so
+        # take the cursor out before it gets there
+        if CURSOR_VAR in request.GET:
+            request.GET = request.GET.copy()
+            try:
+                request._admin_cursor = int(request.GET.pop(CURSOR_VAR)[-1])
+            except ValueError:
+                request._admin_cursor = None
+        return super().changelist_view(request, extra_context)
+
+
+@admin.register(Todo)
+class TodoAdmin(KeysetPaginatedAdmin):
+    list_display = ('id', 'title', 'user', 'todo_list', 'status', 'completed', 'is_deleted', 'created_at')
+    list_select_related = ('user', 'todo_list')
+    # Only filters with fixed choices; a user or list filter would load every row
+    list_filter = ('status', 'completed', 'is_deleted')
+    # Exact id, or a case-insensitive title prefix. That is
+    # UPPER(title) LIKE UPPER('prefix%') and no index covers it, so a title
+    # search scans the rows the filters leave
+    search_fields = ('=id', '^title')
+    autocomplete_fields = ('user',)
+    raw_id_fields = ('parent', 'todo_list')
+    readonly_fields = ('version', 'created_at', 'updated_at', 'deleted_at', 'reminder_sent_at')
+    actions = ('soft_delete_selected', 'restore_selected')
+
+    def get_actions(self, request):
+        # Bulk delete would collect every event of every todo into memory
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+    def get_deleted_objects(self, objs, request):
+        # The confirmation page would otherwise collect and list every event
+        return [str(obj) for obj in objs], {}, set(), []
+
+    def delete_model(self, request, obj):
+        # Batched raw event deletes plus a tombstone, as in the app
+        obj.hard_delete(user=request.user)
+
+    @admin.action(description="Soft delete selected todos (with subtasks)")
+    def soft_delete_selected(self, request, queryset):
+        """
+        One UPDATE for the selected todos and all their subtasks.
+
+        Like any bulk update this sends no signals, so no TodoEvents are
+        logged.
+        """
+        selected = queryset.values('pk')
+        updated = Todo.objects.filter(is_deleted=False).filter(
+            Q(pk__in=selected) | Q(ancestor_links__ancestor_id__in=selected)
+        ).update(is_deleted=True, deleted_at=timezone.now())
+        self.message_user(request, f"Soft deleted {updated} todos.", messages.SUCCESS)
+
+    @admin.action(description="Restore selected todos (with subtasks)")
+    def restore_selected(self, request, queryset):
+        """
+        One UPDATE for the selected todos and the subtasks that were deleted
+        together with them (same deleted_at), and one for their ancestors
+        still in the trash, as Todo.restore() does.
+        """
+        selected = list(queryset.filter(is_deleted=True).values_list('pk', flat=True))
+        # The closure join turns this into "pk IN (SELECT ...)", so the
+        # rows are picked before any ancestor's deleted_at is cleared
+        updated = Todo.objects.filter(is_deleted=True).filter(
+            Q(pk__in=selected)
+            | Q(ancestor_links__ancestor__in=selected, ancestor_links__ancestor__deleted_at=F('deleted_at'))
+        ).update(is_deleted=False, deleted_at=None)
+        updated += Todo.objects.filter(
+            is_deleted=True, descendant_links__descendant__in=selected
+        ).update(is_deleted=False, deleted_at=None)
+        self.message_user(request, f"Restored {updated} todos.", messages.SUCCESS)
+
+
+@admin.register(TodoEvent)
+class TodoEventAdmin(KeysetPaginatedAdmin):
+    list_display = ('id', 'event_type', 'todo_id', 'todo_title', 'user', 'timestamp')
+    list_select_related = ('todo', 'user')
+    list_filter = ('event_type',)
+    search_fields = ('=todo__id',)
+    raw_id_fields = ('todo', 'user')
+    readonly_fields = ('created_at', 'updated_at')
+
+    @admin.display(description="Todo")
+    def todo_title(self, event):
+        return event.todo.title
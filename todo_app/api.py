@@ -0,0 +1,161 @@
+# todo_app/api.py
+"""
+Serialization helpers for the JSON API (the Api*View classes in views.py).
+
+The API never builds model instances for reads: rows come straight from
+values() with only the columns the client asked for (?fields=), and are
+encoded with a compact json.dumps call whose only Python callback is the
+datetime conversion. Responses carry an ETag derived from the rows' ids,
+updated_at and rank, so a client polling an unchanged page gets a 304
+without the payload being encoded at all.
+"""
+
+import hashlib
+import json
+from datetime import date, datetime
+from functools import wraps
+
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+
+from .models import TodoTag
+
+# Fields a client may select with ?fields=, in output order
+TODO_FIELDS = (
+    'id', 'title', 'description', 'completed', 'status', 'due_at', 'rank',
+    'version', 'todo_list', 'parent', 'recurrence', 'created_at', 'updated_at', 'tags',
+)
+EVENT_FIELDS = ('id', 'todo', 'event_type', 'timestamp', 'details')
+
+# Columns every todo row is read with, for the ETag
+TODO_ETAG_FIELDS = ('id', 'updated_at', 'rank')
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+MAX_BATCH = 100
+
+
+class ApiError(Exception):
+    """A client error, returned as {"error": message} with ``status``."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def api_login_required(view):
+    """login_required for JSON clients: 401 instead of a redirect."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return json_response({'error': 'Authentication required'}, status=401)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dumps(payload):
+    """Compact JSON, without DjangoJSONEncoder's per-object dispatch."""
+    return json.dumps(payload, separators=(',', ':'), ensure_ascii=False,
+                      check_circular=False, default=_default)
+
+
+def json_response(payload, status=200, etag=None):
+    response = HttpResponse(dumps(payload), status=status, content_type='application/json')
+    if etag is not None:
+        response['ETag'] = etag
+    return response
+
+
+def parse_fields(request, available):
+    """The ?fields= selection (comma separated), defaulting to all fields."""
+    raw = request.GET.get('fields', '').strip()
+    if not raw:
+        return list(available)
+    fields = [name for name in dict.fromkeys(raw.split(',')) if name]
+    unknown = [name for name in fields if name not in available]
+    if unknown:
+        raise ApiError(f"Unknown fields: {', '.join(unknown)}")
+    # id is always included so rows can be told apart
+    return ['id'] + [name for name in fields if name != 'id']
+
+
+def parse_limit(request):
+    try:
+        return min(max(int(request.GET.get('limit', PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        return PAGE_SIZE
+
+
+def parse_ids(raw):
+    """A comma separated id list (at most MAX_BATCH ids), in request order."""
+    try:
+        ids = list(dict.fromkeys(int(pk) for pk in raw.split(',') if pk.strip()))
+    except ValueError:
+        raise ApiError("ids must be a comma separated list of integers")
+    if not ids:
+        raise ApiError("ids is required")
+    if len(ids) > MAX_BATCH:
+        raise ApiError(f"At most {MAX_BATCH} ids per request")
+    return ids
+
+
+def todo_values(queryset, fields):
+    """
+    ``queryset`` as a values() queryset of the requested columns plus the
+    ETag columns. Tags are not a column; see attach_tags().
+    """
+    columns = dict.fromkeys(name for name in fields if name != 'tags')
+    columns.update(dict.fromkeys(TODO_ETAG_FIELDS))
+    return queryset.values(*columns)
+
+
+def attach_tags(rows, fields):
+    """Add each row's tag names with one query for all rows, if requested."""
+    if 'tags' not in fields or not rows:
+        return
+    tags = {row['id']: [] for row in rows}
+    for todo_id, name in (
+        TodoTag.objects.filter(todo_id__in=tags).order_by('tag__name').values_list('todo_id', 'tag__name')
+    ):
+        tags[todo_id].append(name)
+    for row in rows:
+        row['tags'] = tags[row['id']]
+
+
+def todo_etag(rows, fields, extra=''):
+    """ETag of a todo page: which rows, their versions, which fields."""
+    digest = hashlib.md5(usedforsecurity=False)
+    digest.update(f"{','.join(fields)}|{extra}".encode())
+    for row in rows:
+        digest.update(f"|{row['id']}:{row['updated_at'].timestamp()}:{row['rank']}".encode())
+    return quote_etag(digest.hexdigest())
+
+
+def event_etag(rows, fields, extra=''):
+    """Events never change, so a page is identified by its ids."""
+    digest = hashlib.md5(usedforsecurity=False)
+    digest.update(f"{','.join(fields)}|{extra}|{','.join(str(row['id']) for row in rows)}".encode())
+    return quote_etag(digest.hexdigest())
+
+
+def trim(rows, fields):
+    """Drop the ETag-only columns the client did not ask for."""
+    extra = [name for name in TODO_ETAG_FIELDS if name not in fields]
+    if extra:
+        for row in rows:
+            for name in extra:
+                del row[name]
+    return rows
+
+
+def conditional(request, etag):
+    """The 304 response if the client already has ``etag``, else None."""
+    return get_conditional_response(request, etag=etag)
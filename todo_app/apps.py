@@ -1,4 +1,6 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
 
 
 class TodoAppConfig(AppConfig):
@@ -6,3 +8,9 @@ class TodoAppConfig(AppConfig):
 
     def ready(self):
         import todo_app.signals  # <--- Add this line!
+        from todo_app.triggers import register_sqlite_actor_function, sync_event_triggers
+
+        # Install or drop the event-logging triggers to match TODO_EVENT_LOGGING
+        post_migrate.connect(sync_event_triggers, sender=self)
+        # The SQLite triggers call todo_app_actor_id() on every todo write
+        connection_created.connect(register_sqlite_actor_function)
@@ -0,0 +1,244 @@
+# todo_app/attachments.py
+"""
+Storage of todo attachments on the filesystem storage backend.
+
+Uploads never go through request.FILES. The client creates an
+AttachmentUpload and sends the file in chunks (PUT with Content-Range),
+each streamed from the request straight into a part file at the upload's
+offset; a chunk only counts once the conditional UPDATE of
+``received`` from its start offset succeeds, so a retried or duplicated
+chunk cannot be appended twice. The full size is reserved in the
+uploader's StorageUsage when the upload starts (and refunded if it is
+discarded), so parallel uploads cannot promise more than the quota
+together. When the last chunk is in, finalize() hashes the part file in
+fixed-size reads and links the part file to its content-addressed blob,
+unless a blob with that hash already exists.
+
+Downloads are served from the blob by the views: FileResponse for whole
+files (wsgi.file_wrapper, i.e. sendfile where the server supports it),
+a streamed slice for Range requests, or an X-Accel-Redirect to the web
+server when TODO_ATTACHMENT_ACCEL_REDIRECT is set.
+"""
+
+import hashlib
+import os
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Attachment, AttachmentBlob, AttachmentUpload, StorageUsage
+
+# Bytes per read when copying request bodies and hashing files
+COPY_BUFFER = 64 * 1024
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+def attachment_storage():
+    return FileSystemStorage(location=getattr(settings, 'TODO_ATTACHMENT_ROOT', settings.BASE_DIR / 'attachments'))
+
+
+def chunk_size():
+    return getattr(settings, 'TODO_ATTACHMENT_CHUNK_BYTES', 4 * 1024 * 1024)
+
+
+def max_size():
+    return getattr(settings, 'TODO_ATTACHMENT_MAX_BYTES', 100 * 1024 * 1024)
+
+
+def quota():
+    return getattr(settings, 'TODO_ATTACHMENT_QUOTA_BYTES', 1024 * 1024 * 1024)
+
+
+def write_chunk(upload, offset, stream, length):
+    """
+    Copy ``length`` bytes from ``stream`` into the upload's part file at
+    ``offset`` and advance ``received``. Returns False if the stream ended
+    early or another request already moved the upload past ``offset``.
+    """
+    path = attachment_storage().path(upload.part_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    written = 0
+    with open(path, 'r+b' if os.path.exists(path) else 'wb') as part:
+        part.seek(offset)
+        while written < length:
+            data = stream.read(min(COPY_BUFFER, length - written))
+            if not data:
+                break
+            part.write(data)
+            written += len(data)
+    if written != length:
+        return False
+    updated = AttachmentUpload.objects.filter(pk=upload.pk, received=offset).update(
+        received=offset + length, updated_at=timezone.now(),
+    )
+    if updated:
+        upload.received = offset + length
+    return bool(updated)
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for data in iter(lambda: source.read(COPY_BUFFER * 16), b''):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def start_upload(todo, user, name, size, content_type):
+    """
+    Create the upload of a new file, reserving its full size in the user's
+    StorageUsage, or return the existing upload of the same file. Returns
+    (upload, created); raises QuotaExceeded if the file does not fit.
+    """
+    with transaction.atomic():
+        if not StorageUsage.objects.charge(user.pk, size, quota()):
+            raise QuotaExceeded()
+        # The unique constraint makes this safe against a parallel start
+        upload, created = AttachmentUpload.objects.get_or_create(
+            todo=todo, user=user, name=name, size=size,
+            defaults={'content_type': content_type},
+        )
+        if not created:
+            StorageUsage.objects.release(user.pk, size)
+    return upload, created
+
+
+def finalize(upload):
+    """
+    Turn a complete upload into an Attachment. Its size was reserved when
+    the upload started, so this never fails on the quota.
+    
+    The blob row is locked before the file is touched (see AttachmentBlob),
+    and the part file is hard-linked into place only after the rows are
+    written, so a failed save leaves the upload intact to be retried
+    rather than a blob no attachment refers to.
+    """
+    storage = attachment_storage()
+    part_name = upload.part_name
+    part_path = storage.path(part_name)
+    # One more read of the file: chunks arrive in separate requests, and
+    # hashlib state cannot be saved between them
+    sha256 = file_sha256(part_path)
+    attachment = Attachment(
+        todo_id=upload.todo_id, user_id=upload.user_id, name=upload.name,
+        content_type=upload.content_type, size=upload.size, sha256=sha256,
+    )
+    with transaction.atomic():
+        AttachmentBlob.objects.select_for_update().get_or_create(sha256=sha256, defaults={'size': upload.size})
+        attachment.save()
+        upload.delete()
+        blob_path = storage.path(attachment.blob_name)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        try:
+            os.link(part_path, blob_path)
+        except FileExistsError:
+            # Same content already stored
+            pass
+        transaction.on_commit(lambda: storage.delete(part_name))
+    return attachment
+
+
+def release_attachments(attachments):
+    """
+    Delete ``attachments``, refund their uploaders' quotas (one UPDATE per
+    user) and, after commit, remove blobs no other attachment uses.
+    """
+    rows = list(attachments.values_list('pk', 'user_id', 'size', 'sha256'))
+    if not rows:
+        return
+    refunds = {}
+    for _pk, user_id, size, _sha256 in rows:
+        refunds[user_id] = refunds.get(user_id, 0) + size
+    for user_id, size in refunds.items():
+        StorageUsage.objects.release(user_id, size)
+    Attachment.objects.filter(pk__in=[row[0] for row in rows]).delete()
+
+    hashes = {row[3] for row in rows}
+
+    def remove_unused_blobs():
+        storage = attachment_storage()
+        for sha256 in hashes:
+            # Under the blob's lock, so a finalize() of the same content
+            # either committed its attachment already or waits for us
+            with transaction.atomic():
+                blob = AttachmentBlob.objects.select_for_update().filter(sha256=sha256).first()
+                if blob is None or Attachment.objects.filter(sha256=sha256).exists():
+                    continue
+                blob.delete()
+                storage.delete(Attachment(sha256=sha256).blob_name)
+
+    transaction.on_commit(remove_unused_blobs)
+
+
+def discard_uploads(uploads):
+    """
+    Delete unfinished uploads, refund their reserved sizes (one UPDATE per
+    user) and, after commit, remove their part files.
+    """
+    rows = list(uploads.values_list('pk', 'user_id', 'size'))
+    if not rows:
+        return
+    refunds = {}
+    for _pk, user_id, size in rows:
+        refunds[user_id] = refunds.get(user_id, 0) + size
+    for user_id, size in refunds.items():
+        StorageUsage.objects.release(user_id, size)
+    AttachmentUpload.objects.filter(pk__in=[row[0] for row in rows]).delete()
+    names = [AttachmentUpload(pk=row[0]).part_name for row in rows]
+
+    def remove_parts():
+        storage = attachment_storage()
+        for name in names:
+            storage.delete(name)
+
+    transaction.on_commit(remove_parts)
+
+
+def usage_summary(user_id):
+    """(bytes used, quota) for the attachment panel; unfinished uploads count in full."""
+    return StorageUsage.objects.used(user_id), quota()
+
+
+def parse_range(header, size):
+    """
+    Parse a single-range ``Range: bytes=...`` header into (start, end),
+    inclusive. Returns None when the whole file should be sent (no header,
+    several ranges, or a syntax we ignore) and raises ValueError when the
+    range cannot be satisfied.
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    start, _, end = header[len('bytes='):].strip().partition('-')
+    try:
+        if start:
+            start = int(start)
+            end = min(int(end), size - 1) if end else size - 1
+        elif end:
+            # Suffix range: the last N bytes
+            start, end = max(size - int(end), 0), size - 1
+        else:
+            return None
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise ValueError("Unsatisfiable range")
+    return start, end
+
+
+def read_range(path, start, end):
+    """Yield bytes start..end (inclusive) of the file at ``path``."""
+    with open(path, 'rb') as source:
+        source.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            data = source.read(min(COPY_BUFFER, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
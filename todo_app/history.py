@@ -0,0 +1,170 @@
+# todo_app/history.py
+"""
+Point-in-time reconstruction of todos from their TodoEvent log.
+
+A todo's state is the dict built by current_state(): title, description,
+completed, is_deleted, due_at (ISO string) and tags (sorted names). Every
+event can be applied forwards (an update sets its "new" values) and
+reverted (an update restores its "old" values), so the state after any
+event can be rebuilt from any other known state of the same todo.
+
+Replaying the whole log on every "as of" request would cost one row per
+event, so TodoSnapshots store the state after every TODO_SNAPSHOT_EVERY-th
+event. They are written by take_snapshots() in the take_due_snapshots
+Celery beat task, for the todos that got events since its last run, so
+neither reads nor writes pay for them.
+state_as_of() starts from the nearest snapshot and replays fewer than
+TODO_SNAPSHOT_EVERY events once the task has caught up, and the whole
+log before that.
+
+Only what the log records can be rebuilt: the database triggers (see
+triggers.py) do not log tag changes, so in that mode tags keep their
+current value in every reconstructed state.
+"""
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Todo, TodoEvent, TodoSnapshot
+
+# Columns an undo may write back (tags and is_deleted are handled apart)
+UNDO_FIELDS = ('title', 'description', 'completed', 'due_at')
+
+
+def snapshot_every():
+    return max(getattr(settings, 'TODO_SNAPSHOT_EVERY', 50), 1)
+
+
+def current_state(todo):
+    """The state dict of ``todo`` as it is now (one query for the tags)."""
+    return {
+        'title': todo.title,
+        'description': todo.description,
+        'completed': todo.completed,
+        'is_deleted': todo.is_deleted,
+        'due_at': todo.due_at.isoformat() if todo.due_at else None,
+        'tags': sorted(tag.name for tag in todo.tags.all()),
+    }
+
+
+def apply_event(state, event_type, details):
+    """Move ``state`` forwards over one event, in place."""
+    details = details or {}
+    if event_type == TodoEvent.TODO_UPDATED:
+        state.update(details.get('new', {}))
+    elif event_type in (TodoEvent.TODO_CHECKED, TodoEvent.TODO_UNCHECKED):
+        state['completed'] = details.get('completed', event_type == TodoEvent.TODO_CHECKED)
+    elif event_type == TodoEvent.TODO_DELETED:
+        state['is_deleted'] = True
+    elif event_type == TodoEvent.TODO_RESTORED:
+        state['is_deleted'] = False
+
+
+def revert_event(state, event_type, details):
+    """Move ``state`` backwards over one event, in place."""
+    details = details or {}
+    if event_type == TodoEvent.TODO_UPDATED:
+        state.update(details.get('old', {}))
+    elif event_type in (TodoEvent.TODO_CHECKED, TodoEvent.TODO_UNCHECKED):
+        state['completed'] = not details.get('completed', event_type == TodoEvent.TODO_CHECKED)
+    elif event_type == TodoEvent.TODO_DELETED:
+        state['is_deleted'] = False
+    elif event_type == TodoEvent.TODO_RESTORED:
+        state['is_deleted'] = True
+
+
+def _events(todo):
+    return TodoEvent.objects.filter(todo=todo).values_list('pk', 'event_type', 'details', 'timestamp')
+
+
+def take_snapshots(todo):
+    """
+    Snapshot ``todo`` after every TODO_SNAPSHOT_EVERY-th event it has not
+    been snapshotted at yet. Returns the number of snapshots written.
+
+    With earlier snapshots this replays the events since the latest one;
+    the first time, it walks the whole log backwards from the current row,
+    holding the row lock so no write lands between reading the row and
+    reading the log.
+    """
+    every = snapshot_every()
+    latest = todo.snapshots.order_by('-seq').first()
+    snapshots = []
+
+    if latest is not None:
+        tail = list(_events(todo).filter(pk__gt=latest.event_id).order_by('pk'))
+        if len(tail) < every:
+            return 0
+        state = dict(latest.state)
+        for seq, (pk, event_type, details, timestamp) in enumerate(tail, latest.seq + 1):
+            apply_event(state, event_type, details)
+            if seq % every == 0:
+                snapshots.append(TodoSnapshot(
+                    todo=todo, seq=seq, event_id=pk, timestamp=timestamp, state=dict(state),
+                ))
+    else:
+        if not _events(todo).order_by('pk')[every - 1:every].exists():
+            return 0
+        with transaction.atomic():
+            row = Todo.objects.select_for_update().get(pk=todo.pk)
+            log = list(_events(todo).order_by('pk'))
+            if len(log) < every:
+                return 0
+            state = current_state(row)
+        for seq in range(len(log), 0, -1):
+            pk, event_type, details, timestamp = log[seq - 1]
+            if seq % every == 0:
+                snapshots.append(TodoSnapshot(
+                    todo=todo, seq=seq, event_id=pk, timestamp=timestamp, state=dict(state),
+                ))
+            revert_event(state, event_type, details)
+
+    # Two requests may snapshot the same todo at once; the rows are equal
+    TodoSnapshot.objects.bulk_create(snapshots, batch_size=500, ignore_conflicts=True)
+    return len(snapshots)
+
+
+def state_as_of(todo, event_id):
+    """
+    Return ``todo``'s state right after its event ``event_id``, or None if
+    that event is not in its log.
+
+    Replays forwards from the latest snapshot at or before the event, or,
+    if the event is older than every snapshot (or there are none yet),
+    backwards from the oldest snapshot after it (or from the current row).
+    Read only: snapshots are written by the take_due_snapshots task.
+    """
+    events = _events(todo)
+    if not events.filter(pk=event_id).exists():
+        return None
+
+    before = todo.snapshots.filter(event_id__lte=event_id).order_by('-seq').first()
+    if before is not None:
+        state = dict(before.state)
+        for _pk, event_type, details, _timestamp in events.filter(
+                pk__gt=before.event_id, pk__lte=event_id).order_by('pk'):
+            apply_event(state, event_type, details)
+        return state
+
+    after = todo.snapshots.order_by('seq').first()
+    if after is not None:
+        state = dict(after.state)
+        newer = events.filter(pk__gt=event_id, pk__lte=after.event_id)
+    else:
+        state = current_state(todo)
+        newer = events.filter(pk__gt=event_id)
+    for _pk, event_type, details, _timestamp in newer.order_by('-pk'):
+        revert_event(state, event_type, details)
+    return state
+
+
+def state_at(todo, when):
+    """
+    Return ``todo``'s state at the moment ``when``, or None if it did not
+    exist yet.
+    """
+    event_id = (
+        TodoEvent.objects.filter(todo=todo, timestamp__lte=when)
+        .order_by('-timestamp', '-pk').values_list('pk', flat=True).first()
+    )
+    return None if event_id is None else state_as_of(todo, event_id)
@@ -0,0 +1,78 @@
+# todo_app/management/commands/backfill_todo_stats.py
+"""
+Rebuild DailyTodoStats rollups from the historical TodoEvent stream.
+"""
+
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from todo_app.models import DailyTodoStats, TodoEvent, todo_stats_deltas
+
+
+class Command(BaseCommand):
+    help = "Rebuild daily productivity rollups from TodoEvent in primary-key batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help="Number of events to read per batch.")
+        parser.add_argument('--user', type=int, default=None,
+                            help="Only rebuild rollups for this user id.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        events = TodoEvent.objects.filter(todo__user__isnull=False)
+        stats = DailyTodoStats.objects.all()
+        if options['user'] is not None:
+            events = events.filter(todo__user_id=options['user'])
+            stats = stats.filter(user_id=options['user'])
+
+        # Clear and pin the high-water mark together: anything newer than
+        # last_id is counted by the live signal path, not by us.
+        with transaction.atomic():
+            stats.delete()
+            last_id = TodoEvent.objects.aggregate(last=Max('id'))['last'] or 0
+
+        cursor = 0
+        processed = 0
+        while cursor < last_id:
+            batch = list(
+                events.filter(id__gt=cursor, id__lte=last_id)
+                .order_by('id')
+                .values_list('id', 'todo_id', 'todo__user_id', 'event_type', 'timestamp', 'todo__created_at')[:batch_size]
+            )
+            if not batch:
+                break
+
+            # Todos of this batch that were already completed before it;
+            # only a todo's first completion is counted
+            completed = set(
+                TodoEvent.objects.filter(
+                    todo_id__in={row[1] for row in batch if row[3] == TodoEvent.TODO_CHECKED},
+                    event_type=TodoEvent.TODO_CHECKED, id__lte=cursor,
+                ).values_list('todo_id', flat=True)
+            )
+
+            # Fold the batch in memory so each (user, day) costs one upsert
+            totals = defaultdict(lambda: defaultdict(int))
+            for _, todo_id, user_id, event_type, timestamp, created_at in batch:
+                first_completion = True
+                if event_type == TodoEvent.TODO_CHECKED:
+                    first_completion = todo_id not in completed
+                    completed.add(todo_id)
+                deltas = todo_stats_deltas(event_type, timestamp, created_at, first_completion)
+                for field, value in deltas.items():
+                    totals[(user_id, timezone.localdate(timestamp))][field] += value
+
+            with transaction.atomic():
+                for (user_id, day), deltas in totals.items():
+                    DailyTodoStats.objects.increment(user_id, day, **deltas)
+
+            cursor = batch[-1][0]
+            processed += len(batch)
+            self.stdout.write(f"Processed {processed} events (up to id {cursor})")
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled rollups from {processed} events."))
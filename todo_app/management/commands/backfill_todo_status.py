@@ -0,0 +1,81 @@
+# todo_app/management/commands/backfill_todo_status.py
+"""
+Backfill Todo.status from Todo.completed on a live database.
+
+Migration 0002 added status with default 'pending', so older completed
+todos still say 'pending'. One UPDATE over the whole table would hold its
+row locks for minutes; this walks the table in primary-key ranges instead,
+one short UPDATE (and transaction) per range, sleeping in between so the
+load stays bounded.
+
+The data is its own checkpoint: only rows whose status disagrees with
+completed are written, and a run starts at the lowest such id, so an
+interrupted run resumes where it stopped without any state kept outside
+the table. Rows written after the run started are kept in sync by
+Todo.save() and compare_and_set, so the walk stops at the highest id
+present when it began.
+
+Each written row gets its version bumped and updated_at refreshed, as
+compare_and_set does, so API ETags and optimistic-locking clients see
+the change.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Case, F, Max, Min, Q, Value, When
+from django.utils import timezone
+
+from todo_app.models import Todo
+
+
+class Command(BaseCommand):
+    help = "Backfill Todo.status from completed in throttled primary-key ranges."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help="Width of each primary-key range.")
+        parser.add_argument('--sleep', type=float, default=0.2,
+                            help="Seconds to pause between ranges.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = Todo.objects.aggregate(last=Max('pk'))['last'] or 0
+
+        # Only rows whose status disagrees with completed are written
+        stale = Q(completed=True) & ~Q(status=Todo.STATUS_COMPLETED) | Q(completed=False, status=Todo.STATUS_COMPLETED)
+        first_stale = Todo.objects.filter(stale, pk__lte=last_id).aggregate(first=Min('pk'))['first']
+        if first_stale is None:
+            self.stdout.write(self.style.SUCCESS("No todos need a status backfill."))
+            return
+        cursor = first_stale - 1
+        if cursor:
+            self.stdout.write(f"Starting after id {cursor}, the last row already in sync")
+        new_status = Case(
+            When(completed=True, then=Value(Todo.STATUS_COMPLETED)),
+            default=Value(Todo.STATUS_PENDING),
+        )
+
+        started = time.monotonic()
+        scanned = updated = 0
+        while cursor < last_id:
+            upper = min(cursor + batch_size, last_id)
+            # A plain UPDATE: no signals, so no TodoEvents for a data fix
+            updated += Todo.objects.filter(stale, pk__gt=cursor, pk__lte=upper).update(
+                status=new_status, version=F('version') + 1, updated_at=timezone.now(),
+            )
+            scanned += upper - cursor
+            cursor = upper
+
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f"Up to id {cursor} of {last_id}: {updated} updated, "
+                f"{updated / elapsed if elapsed else 0:,.0f} rows/s"
+            )
+            if cursor < last_id and options['sleep']:
+                time.sleep(options['sleep'])
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Backfilled status of {updated} todos ({scanned} ids in {elapsed:.1f}s)."
+        ))
@@ -0,0 +1,113 @@
+# todo_app/management/commands/bench_api_serialization.py
+"""
+Benchmark the JSON API's serialization against rendering the same page of
+todos as HTMX fragments.
+
+Times one page (query included) rendered with partials/load_more_todos.html,
+serialized from model instances with JsonResponse, and serialized the API
+way (values() rows, api.dumps) with all fields and with a sparse ?fields=
+selection. Everything runs inside one transaction that is rolled back, so
+the bench data leaves no trace.
+"""
+
+import statistics
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.http import JsonResponse
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from todo_app import api
+from todo_app.models import Tag, Todo, TodoTag
+
+
+def _percentile(values, pct):
+    values = sorted(values)
+    return values[min(int(len(values) * pct), len(values) - 1)]
+
+
+class Command(BaseCommand):
+    help = "Benchmark JSON API serialization against template rendering."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--todos', type=int, default=1000)
+        parser.add_argument('--page-size', type=int, default=api.PAGE_SIZE)
+        parser.add_argument('--iterations', type=int, default=200,
+                            help="Pages to time per format.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self._bench(options)
+            transaction.set_rollback(True)
+
+    def _setup(self, todos):
+        prefix = f'bench-{uuid.uuid4().hex[:8]}'
+        user = get_user_model().objects.create(username=prefix)
+        tags = Tag.objects.bulk_create([Tag(user=user, name=f'{prefix}-{i}') for i in range(5)])
+        Todo.objects.bulk_create([
+            Todo(user=user, title=f'{prefix} {i}', description='x' * (i % 200), rank=i * Todo.RANK_STEP)
+            for i in range(todos)
+        ], batch_size=1000)
+        todo_ids = list(Todo.objects.filter(user=user).values_list('pk', flat=True))
+        TodoTag.objects.bulk_create([
+            TodoTag(todo_id=pk, tag=tags[pk % len(tags)]) for pk in todo_ids[::2]
+        ], batch_size=1000)
+        return user
+
+    def _time(self, label, iterations, fn):
+        timings = []
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(iterations):
+                t0 = time.perf_counter()
+                size = len(fn())
+                timings.append(time.perf_counter() - t0)
+        self.stdout.write(
+            f"  {label:<28} p50 {statistics.median(timings) * 1000:7.3f}ms  "
+            f"p95 {_percentile(timings, 0.95) * 1000:7.3f}ms  "
+            f"{size / 1024:7.1f} KiB  {len(queries.captured_queries) / iterations:.1f} queries"
+        )
+
+    def _bench(self, options):
+        user = self._setup(options['todos'])
+        page_size = options['page_size']
+        iterations = options['iterations']
+        todos = Todo.objects.active().top_level().filter(user=user, todo_list__isnull=True).order_by('rank', 'pk')
+
+        request = RequestFactory().get('/')
+        request.user = user
+
+        def template():
+            page = list(todos.prefetch_related('tags')[:page_size])
+            return render_to_string('partials/load_more_todos.html', {'todos': page, 'has_next': False}, request)
+
+        def instances():
+            page = todos.prefetch_related('tags')[:page_size]
+            return JsonResponse({'results': [
+                {
+                    'id': todo.pk, 'title': todo.title, 'description': todo.description,
+                    'completed': todo.completed, 'status': todo.status, 'due_at': todo.due_at,
+                    'rank': todo.rank, 'version': todo.version, 'todo_list': todo.todo_list_id,
+                    'parent': todo.parent_id, 'recurrence': todo.recurrence_id,
+                    'created_at': todo.created_at, 'updated_at': todo.updated_at,
+                    'tags': [tag.name for tag in todo.tags.all()],
+                }
+                for todo in page
+            ]}).content
+
+        def values(fields):
+            def serialize():
+                rows = list(api.todo_values(todos, fields)[:page_size])
+                api.attach_tags(rows, fields)
+                return api.dumps({'results': api.trim(rows, fields)})
+            return serialize
+
+        self.stdout.write(f"One page of {page_size} todos out of {options['todos']}:")
+        self._time('HTML fragment (template)', iterations, template)
+        self._time('JSON from model instances', iterations, instances)
+        self._time('JSON API, all fields', iterations, values(list(api.TODO_FIELDS)))
+        self._time('JSON API, sparse fields', iterations, values(['id', 'title', 'completed']))
@@ -0,0 +1,74 @@
+# todo_app/management/commands/bench_description_preview.py
+"""
+Measure what deferring descriptions saves on list pages.
+
+Builds todos whose descriptions range from empty to multi-kilobyte notes,
+then renders the same pages with the full description loaded (before) and
+with with_description_preview() (after), reporting description bytes read
+from the database, HTML bytes and time per page. Everything runs inside
+one transaction that is rolled back, so the bench data leaves no trace.
+"""
+
+import statistics
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+
+from todo_app.models import Todo
+
+
+class Command(BaseCommand):
+    help = "Compare list page size and time with full descriptions vs. previews."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--todos', type=int, default=500)
+        parser.add_argument('--page-size', type=int, default=5,
+                            help="Todos per page (the list views show 5).")
+        parser.add_argument('--max-description', type=int, default=8000,
+                            help="Longest description, in characters.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self._bench(options)
+            transaction.set_rollback(True)
+
+    def _bench(self, options):
+        prefix = f'bench-{uuid.uuid4().hex[:8]}'
+        user = get_user_model().objects.create(username=prefix)
+        longest = options['max_description']
+        Todo.objects.bulk_create([
+            # Every third todo has a long pasted note, the rest short or none
+            Todo(user=user, title=f'{prefix} {i}', rank=i * Todo.RANK_STEP,
+                 description=('note ' * (longest // 5))[:longest * (i % 7 + 1) // 7] if i % 3 == 0 else 'x' * (i % 80))
+            for i in range(options['todos'])
+        ], batch_size=1000)
+
+        request = RequestFactory().get('/')
+        request.user = user
+        todos = Todo.objects.active().top_level().filter(user=user).order_by('rank', '-created_at')
+        page_size = options['page_size']
+        offsets = range(0, options['todos'], page_size)
+
+        self.stdout.write(f"{len(offsets)} pages of {page_size} todos:")
+        for label, queryset in (
+            ('full description', todos),
+            ('preview', todos.with_description_preview()),
+        ):
+            timings, html_bytes, db_bytes = [], [], []
+            for offset in offsets:
+                t0 = time.perf_counter()
+                page = list(queryset.prefetch_related('tags')[offset:offset + page_size])
+                html = render_to_string('partials/load_more_todos.html', {'todos': page, 'has_next': False}, request)
+                timings.append(time.perf_counter() - t0)
+                html_bytes.append(len(html.encode()))
+                db_bytes.append(sum(len(todo.description_excerpt[0].encode()) for todo in page))
+            self.stdout.write(
+                f"  {label:<18} description {statistics.mean(db_bytes) / 1024:7.1f} KiB/page  "
+                f"HTML {statistics.mean(html_bytes) / 1024:7.1f} KiB/page  "
+                f"p50 {statistics.median(timings) * 1000:7.3f}ms"
+            )
@@ -0,0 +1,92 @@
+# todo_app/management/commands/bench_event_logging.py
+"""
+Compare mutation latency and throughput with signal vs trigger event logging.
+
+Everything runs inside one transaction that is rolled back, so the bench
+user, todos, events and any trigger changes leave no trace.
+"""
+
+import statistics
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import override_settings
+
+from todo_app.models import Todo, TodoEvent
+from todo_app.signals import log_todo_event
+from todo_app.triggers import install_event_triggers, remove_event_triggers
+
+MODES = ('signals', 'triggers')
+
+
+def _percentile(values, pct):
+    values = sorted(values)
+    return values[min(int(len(values) * pct), len(values) - 1)]
+
+
+class Command(BaseCommand):
+    help = "Benchmark todo mutations with TODO_EVENT_LOGGING='signals' vs 'triggers'."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200,
+                            help="Todos to create, toggle, edit and soft delete per mode.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            for mode in MODES:
+                self._bench(mode, options['iterations'])
+            transaction.set_rollback(True)
+
+    def _bench(self, mode, iterations):
+        with override_settings(TODO_EVENT_LOGGING=mode):
+            if mode == 'triggers':
+                install_event_triggers(connection)
+            else:
+                remove_event_triggers(connection)
+
+            user = get_user_model().objects.create(username=f'bench-{uuid.uuid4().hex[:12]}')
+            timings = {'create': [], 'toggle': [], 'edit': [], 'soft_delete': []}
+            started = time.perf_counter()
+
+            for i in range(iterations):
+                t0 = time.perf_counter()
+                todo = Todo.objects.create(user=user, title=f'bench {i}', description='')
+                t1 = time.perf_counter()
+
+                todo = Todo.objects.compare_and_set(todo.pk, user, version=todo.version, toggle_completed=True)
+                log_todo_event(todo, TodoEvent.TODO_CHECKED, {'completed': True, 'title': todo.title}, user=user)
+                t2 = time.perf_counter()
+
+                old = {'title': todo.title, 'description': todo.description}
+                todo = Todo.objects.compare_and_set(
+                    todo.pk, user, version=todo.version, title=f'bench {i} edited', description='edited'
+                )
+                log_todo_event(todo, TodoEvent.TODO_UPDATED, {
+                    'old': old, 'new': {'title': todo.title, 'description': todo.description}
+                }, user=user)
+                t3 = time.perf_counter()
+
+                todo.soft_delete()
+                t4 = time.perf_counter()
+
+                timings['create'].append(t1 - t0)
+                timings['toggle'].append(t2 - t1)
+                timings['edit'].append(t3 - t2)
+                timings['soft_delete'].append(t4 - t3)
+
+            elapsed = time.perf_counter() - started
+            events = TodoEvent.objects.filter(todo__user=user).count()
+            remove_event_triggers(connection)
+
+        self.stdout.write(
+            f"{mode}: {iterations * 4 / elapsed:.0f} mutations/s, "
+            f"{events} events for {iterations * 4} mutations"
+        )
+        for op, values in timings.items():
+            self.stdout.write(
+                f"  {op:<12} p50 {statistics.median(values) * 1000:7.3f}ms  "
+                f"p95 {_percentile(values, 0.95) * 1000:7.3f}ms"
+            )
@@ -0,0 +1,127 @@
+# todo_app/management/commands/bench_list_access.py
+"""
+Benchmark shared-list authorization on a large list.
+
+Builds one list with hundreds of members and ~100k todos, then times the
+per-todo membership probe (visible_to / compare_and_set) and the cached
+list-role lookup used by the list page. Everything runs inside one
+transaction that is rolled back, so the bench data leaves no trace.
+"""
+
+import random
+import statistics
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from todo_app.access import cached_list_role, invalidate_list_roles
+from todo_app.models import ListMembership, Todo, TodoList
+
+
+def _percentile(values, pct):
+    values = sorted(values)
+    return values[min(int(len(values) * pct), len(values) - 1)]
+
+
+class Command(BaseCommand):
+    help = "Benchmark membership checks on a list with many members and todos."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--members', type=int, default=300)
+        parser.add_argument('--todos', type=int, default=100_000)
+        parser.add_argument('--iterations', type=int, default=500,
+                            help="Lookups to time per operation.")
+        parser.add_argument('--explain', action='store_true',
+                            help="Print the query plan of the per-todo access check.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self._bench(options)
+            transaction.set_rollback(True)
+
+    def _setup(self, members, todos):
+        User = get_user_model()
+        prefix = f'bench-{uuid.uuid4().hex[:8]}'
+        User.objects.bulk_create([User(username=f'{prefix}-{i}') for i in range(members + 1)])
+        users = list(User.objects.filter(username__startswith=prefix).order_by('pk'))
+        outsider, users = users[-1], users[:-1]
+
+        todo_list = TodoList.objects.create_for(users[0], prefix)
+        ListMembership.objects.bulk_create([
+            ListMembership(
+                todo_list=todo_list, user=user,
+                role=ListMembership.ROLE_EDITOR if i % 2 else ListMembership.ROLE_VIEWER,
+            )
+            for i, user in enumerate(users[1:], 1)
+        ])
+
+        batch_size = 5000
+        for start in range(0, todos, batch_size):
+            Todo.objects.bulk_create([
+                Todo(
+                    user=users[i % len(users)], todo_list=todo_list,
+                    title=f'{prefix} {i}', rank=i * Todo.RANK_STEP,
+                )
+                for i in range(start, min(start + batch_size, todos))
+            ])
+        todo_ids = list(Todo.objects.filter(todo_list=todo_list).values_list('pk', flat=True))
+        return todo_list, users, outsider, todo_ids
+
+    def _time(self, label, iterations, fn):
+        timings = []
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(iterations):
+                t0 = time.perf_counter()
+                fn()
+                timings.append(time.perf_counter() - t0)
+        self.stdout.write(
+            f"  {label:<28} p50 {statistics.median(timings) * 1000:7.3f}ms  "
+            f"p95 {_percentile(timings, 0.95) * 1000:7.3f}ms  "
+            f"{len(queries.captured_queries) / iterations:.1f} queries"
+        )
+
+    def _bench(self, options):
+        started = time.perf_counter()
+        todo_list, users, outsider, todo_ids = self._setup(options['members'], options['todos'])
+        self.stdout.write(
+            f"Setup: {len(users)} members, {len(todo_ids)} todos "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
+
+        iterations = options['iterations']
+        owner, editor, viewer = users[0], users[1], users[2]
+        write = ListMembership.WRITE_ROLES
+
+        self.stdout.write("Per-todo checks (one EXISTS probe on the membership index):")
+        self._time('read as viewer', iterations, lambda: (
+            Todo.objects.active().visible_to(viewer).filter(pk=random.choice(todo_ids)).first()
+        ))
+        self._time('write denied to viewer', iterations, lambda: (
+            Todo.objects.active().visible_to(viewer, write).filter(pk=random.choice(todo_ids)).first()
+        ))
+        self._time('read denied to outsider', iterations, lambda: (
+            Todo.objects.active().visible_to(outsider).filter(pk=random.choice(todo_ids)).first()
+        ))
+        self._time('compare_and_set as editor', iterations, lambda: (
+            Todo.objects.compare_and_set(random.choice(todo_ids), editor, toggle_completed=True)
+        ))
+
+        self.stdout.write("List page (role from the cache, then no membership join):")
+
+        def cold_role():
+            invalidate_list_roles(todo_list.pk)
+            cached_list_role(owner.pk, todo_list.pk)
+
+        self._time('list role, cold cache', iterations, cold_role)
+        self._time('list role, warm cache', iterations, lambda: cached_list_role(owner.pk, todo_list.pk))
+        self._time('first page of 5', iterations, lambda: list(
+            Todo.objects.active().top_level().filter(todo_list=todo_list).order_by('rank', '-created_at')[:5]
+        ))
+
+        if options['explain']:
+            query = Todo.objects.active().visible_to(viewer).filter(pk=todo_ids[0])
+            self.stdout.write(query.explain())
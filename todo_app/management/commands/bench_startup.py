@@ -0,0 +1,104 @@
+# todo_app/management/commands/bench_startup.py
+"""
+Measure web worker cold start: `-X importtime` totals and time to first request.
+
+Each run is a fresh interpreter, so nothing is shared with this process.
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Boot the way a WSGI worker does, then load the URLconf (and so every view)
+IMPORT_SCRIPT = """
+import django
+django.setup()
+import {urlconf}
+"""
+
+# Time from interpreter start to the first response of a WSGI app
+FIRST_REQUEST_SCRIPT = """
+import time
+t0 = time.perf_counter()
+from wsgiref.util import setup_testing_defaults
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+t1 = time.perf_counter()
+environ = {{'PATH_INFO': {path!r}, 'HTTP_HOST': {host!r}}}
+setup_testing_defaults(environ)
+status = []
+body = b''.join(application(environ, lambda s, h, *a: status.append(s)))
+t2 = time.perf_counter()
+print(f"{{(t1 - t0) * 1000:.3f}} {{(t2 - t0) * 1000:.3f}} {{status[0].split()[0]}}")
+"""
+
+
+def parse_importtime(stderr):
+    """Return {module: (self_us, cumulative_us)} from `-X importtime` output."""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+class Command(BaseCommand):
+    help = "Report import time and time-to-first-request for a cold web worker."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--top', type=int, default=15,
+                            help="Show the N slowest top-level packages by cumulative import time.")
+        parser.add_argument('--path', default='/')
+        parser.add_argument('--host', default='localhost')
+
+    def _run(self, *args):
+        result = subprocess.run(
+            [sys.executable, *args], capture_output=True, text=True,
+            env=dict(os.environ), cwd=settings.BASE_DIR,
+        )
+        if result.returncode != 0:
+            raise CommandError(result.stderr.strip().splitlines()[-1])
+        return result
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        script = IMPORT_SCRIPT.format(urlconf=settings.ROOT_URLCONF)
+
+        totals, runs = [], []
+        for _ in range(repeat):
+            modules = parse_importtime(self._run('-X', 'importtime', '-c', script).stderr)
+            totals.append(sum(self_us for self_us, _ in modules.values()) / 1000)
+            runs.append(modules)
+
+        self.stdout.write(
+            f"Import time (django.setup() + {settings.ROOT_URLCONF}): "
+            f"median {statistics.median(totals):.1f}ms over {repeat} runs, "
+            f"{len(runs[-1])} modules"
+        )
+        # Cumulative time of top-level packages, from the last run
+        top_level = {
+            name: cumulative for name, (_, cumulative) in runs[-1].items() if '.' not in name
+        }
+        for name, cumulative in sorted(top_level.items(), key=lambda i: i[1], reverse=True)[:options['top']]:
+            self.stdout.write(f"  {cumulative / 1000:8.1f}ms  {name}")
+        celery_loaded = any(name.split('.')[0] in ('celery', 'kombu') for name in runs[-1])
+        self.stdout.write(f"  celery/kombu imported at boot: {'yes' if celery_loaded else 'no'}")
+
+        boots, firsts, status = [], [], None
+        script = FIRST_REQUEST_SCRIPT.format(path=options['path'], host=options['host'])
+        for _ in range(repeat):
+            boot_ms, first_ms, status = self._run('-c', script).stdout.split()
+            boots.append(float(boot_ms))
+            firsts.append(float(first_ms))
+
+        self.stdout.write(
+            f"WSGI boot: median {statistics.median(boots):.1f}ms, "
+            f"first request ({options['path']} -> {status}): median {statistics.median(firsts):.1f}ms"
+        )
@@ -0,0 +1,27 @@
+# todo_app/management/commands/create_api_token.py
+"""
+Create a bearer token for a JSON API client (see ApiTokenMiddleware).
+"""
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from todo_app.models import ApiToken
+
+
+class Command(BaseCommand):
+    help = "Create a JSON API token for a user and print its key (shown only once)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--name', default='cli',
+                            help="Label for the token, e.g. the client it is for.")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['username']!r}")
+        token, key = ApiToken.objects.create_token(user, options['name'])
+        self.stdout.write(key)
+        self.stderr.write(f"Created token {token.pk} ({token.name}) for {user}; the key is not stored.")
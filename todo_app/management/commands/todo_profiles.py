@@ -0,0 +1,96 @@
+# todo_app/management/commands/todo_profiles.py
+"""
+Inspect request profiles captured by ProfilingMiddleware.
+
+    manage.py todo_profiles list
+    manage.py todo_profiles show <id>
+    manage.py todo_profiles collapsed <id> > out.folded   # flamegraph.pl / speedscope
+    manage.py todo_profiles diff <before> <after>         # difffolded format
+"""
+
+from collections import Counter
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from todo_app.profiling import ProfileStore
+
+
+class Command(BaseCommand):
+    help = "List, summarize and diff captured request profiles."
+
+    def add_arguments(self, parser):
+        subparsers = parser.add_subparsers(dest='action', required=True)
+        subparsers.add_parser('list', help="List stored profiles, newest first.")
+
+        show = subparsers.add_parser('show', help="Summarize one profile.")
+        show.add_argument('profile_id')
+        show.add_argument('--top', type=int, default=15)
+
+        collapsed = subparsers.add_parser('collapsed', help="Print collapsed stacks.")
+        collapsed.add_argument('profile_id')
+
+        diff = subparsers.add_parser('diff', help="Print 'stack before after' lines for two profiles.")
+        diff.add_argument('before')
+        diff.add_argument('after')
+
+    def handle(self, *args, **options):
+        self.store = ProfileStore()
+        getattr(self, f"handle_{options['action']}")(options)
+
+    def _load(self, profile_id):
+        try:
+            return self.store.load(profile_id)
+        except KeyError:
+            raise CommandError(f"No profile with id {profile_id!r}")
+
+    def handle_list(self, options):
+        for profile in self.store.list():
+            started = datetime.fromtimestamp(profile['started']).strftime('%Y-%m-%d %H:%M:%S')
+            self.stdout.write(
+                f"{profile['id']}  {started}  {profile['duration_ms']:>9.1f}ms  "
+                f"{len(profile['sql']):>4} queries  {profile['method']} {profile['path']}"
+            )
+
+    def handle_show(self, options):
+        profile = self._load(options['profile_id'])
+        samples = Counter(profile['samples'])
+        total = sum(samples.values()) or 1
+
+        # Self time is the leaf of each stack, inclusive time any frame in it
+        own, inclusive = Counter(), Counter()
+        for stack, count in samples.items():
+            frames = stack.split(';')
+            own[frames[-1]] += count
+            for frame in set(frames):
+                inclusive[frame] += count
+
+        sql = profile['sql']
+        sql_ms = sum(q['duration_ms'] for q in sql)
+        self.stdout.write(f"{profile['method']} {profile['path']} -> {profile['status']} ({profile['view']})")
+        self.stdout.write(
+            f"Wall time {profile['duration_ms']:.1f}ms, {total} samples, "
+            f"{len(sql)} queries in {sql_ms:.1f}ms"
+        )
+
+        self.stdout.write("\nTop frames by self samples:")
+        for frame, count in own.most_common(options['top']):
+            self.stdout.write(f"  {count / total:6.1%}  {frame}")
+        self.stdout.write("\nTop frames by inclusive samples:")
+        for frame, count in inclusive.most_common(options['top']):
+            self.stdout.write(f"  {count / total:6.1%}  {frame}")
+
+        self.stdout.write("\nSlowest queries:")
+        for query in sorted(sql, key=lambda q: q['duration_ms'], reverse=True)[:options['top']]:
+            self.stdout.write(f"  {query['duration_ms']:8.2f}ms  {query['sql'][:160]}")
+
+    def handle_collapsed(self, options):
+        profile = self._load(options['profile_id'])
+        for stack, count in sorted(profile['samples'].items()):
+            self.stdout.write(f"{stack} {count}")
+
+    def handle_diff(self, options):
+        before = self._load(options['before'])['samples']
+        after = self._load(options['after'])['samples']
+        for stack in sorted(set(before) | set(after)):
+            self.stdout.write(f"{stack} {before.get(stack, 0)} {after.get(stack, 0)}")
@@ -3,7 +3,14 @@
 Custom QuerySet managers for Todo application.
 """
 
-from django.db import models
+import hashlib
+import secrets
+
+from django.conf import settings
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models import Count, Exists, F, Min, OuterRef, Q
+from django.db.models.functions import Greatest, Length, Substr
+from django.db.models.lookups import GreaterThan
 from django.utils import timezone
 
 
@@ -18,6 +25,13 @@ class TodoQuerySet(models.QuerySet):
         """Return only soft-deleted todos."""
         return self.filter(is_deleted=True)
     
+    def deleted_roots(self):
+        """
+        Return soft-deleted todos whose parent is not deleted too: what the
+        trash lists. Subtasks that went with their parent come back with it.
+        """
+        return self.deleted().exclude(parent__is_deleted=True)
+    
     def completed(self):
         """Return only completed todos."""
         return self.filter(completed=True)
@@ -26,6 +40,223 @@ class TodoQuerySet(models.QuerySet):
         """Return only pending todos."""
         return self.filter(completed=False)
     
+    def visible_to(self, user, roles=None):
+        """
+        Return todos ``user`` may access with one of ``roles`` (default: any
+        list role): their own personal todos, plus todos of lists where
+        their membership has one of the roles.
+        
+        The membership check is a correlated EXISTS on the (user, todo_list)
+        unique index, one index probe per todo however many members the
+        list has, and is evaluated inside the same query as the rest of the
+        filter.
+        """
+        from .models import ListMembership
+        return self.filter(
+            Q(todo_list__isnull=True, user=user)
+            | Exists(ListMembership.objects.filter(
+                user=user, todo_list=OuterRef('todo_list'),
+                role__in=roles or ListMembership.READ_ROLES,
+            ))
+        )
+    
+    def with_status(self, status):
+        """Return todos in the given status (pending, in_progress, completed)."""
+        return self.filter(status=status)
+    
+    def status_counts(self):
+        """
+        Return {status: count} for every status choice in a single query.
+        
+        Uses conditional aggregation (COUNT(*) FILTER (WHERE ...)) so the
+        facet counts cost one scan instead of one query per status.
+        """
+        choices = [value for value, _ in self.model.STATUS_CHOICES]
+        counts = self.aggregate(**{
+            value: Count('pk', filter=Q(status=value)) for value in choices
+        })
+        counts['all'] = sum(counts.values())
+        return counts
+    
+    def compare_and_set(self, pk, user, version=None, toggle_completed=False, **values):
+        """
+        Update one active todo in a single conditional UPDATE statement.
+        
+        The row only changes if ``user`` may still edit it (see visible_to)
+        and, when
+        ``version`` is given, is still at that version, so a concurrent edit
+        from another tab cannot be silently overwritten. ``toggle_completed``
+        flips the flag in the database (SET completed = NOT completed) and
+        ``values`` are plain column assignments. The version is bumped and
+        updated_at refreshed on every write, and status follows any change
+        to completed.
+        
+        Only the listed columns are written, and on backends that support
+        UPDATE ... RETURNING the new row comes back in the same statement.
+        Returns the updated instance, or None if nothing matched.
+        """
+        model = self.model
+        opts = model._meta
+        connection = connections[self.db]
+        qn = connection.ops.quote_name
+        
+        version_col = qn(opts.get_field('version').column)
+        updated_at = opts.get_field('updated_at')
+        assignments = [
+            f'{version_col} = {version_col} + 1',
+            f'{qn(updated_at.column)} = %s',
+        ]
+        params = [updated_at.get_db_prep_save(timezone.now(), connection)]
+        completed_col = qn(opts.get_field('completed').column)
+        status_col = qn(opts.get_field('status').column)
+        if toggle_completed:
+            assignments.append(f'{completed_col} = NOT {completed_col}')
+            # The right-hand side still sees the old completed value
+            assignments.append(f'{status_col} = CASE WHEN {completed_col} THEN %s ELSE %s END')
+            params += [model.STATUS_PENDING, model.STATUS_COMPLETED]
+        for name, value in values.items():
+            field = opts.get_field(name)
+            assignments.append(f'{qn(field.column)} = %s')
+            params.append(field.get_db_prep_save(value, connection))
+        if 'completed' in values and 'status' not in values:
+            # Keep status in step, as Todo.save() does
+            assignments.append(
+                f'{status_col} = CASE WHEN %s THEN %s WHEN {status_col} = %s THEN %s ELSE {status_col} END'
+            )
+            params += [
+                bool(values['completed']), model.STATUS_COMPLETED,
+                model.STATUS_COMPLETED, model.STATUS_PENDING,
+            ]
+        
+        access_sql, access_params = self._write_access_sql(connection, user)
+        conditions = [
+            f'{qn(opts.pk.column)} = %s',
+            f'{qn(opts.get_field("is_deleted").column)} = %s',
+            access_sql,
+        ]
+        params += [pk, False, *access_params]
+        if version is not None:
+            conditions.append(f'{version_col} = %s')
+            params.append(version)
+        
+        sql = 'UPDATE {} SET {} WHERE {}'.format(
+            qn(opts.db_table), ', '.join(assignments), ' AND '.join(conditions)
+        )
+        fields = opts.concrete_fields
+        returning = connection.vendor in ('postgresql', 'sqlite')
+        if returning:
+            sql += ' RETURNING ' + ', '.join(qn(f.column) for f in fields)
+        
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            if not returning:
+                return self.filter(pk=pk).first() if cursor.rowcount else None
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        
+        # Run the values through the backend converters, as a SELECT would
+        converted = []
+        for field, value in zip(fields, row):
+            col = field.get_col(opts.db_table)
+            for converter in connection.ops.get_db_converters(col) + col.get_db_converters(connection):
+                value = converter(value, col, connection)
+            converted.append(value)
+        return model.from_db(self.db, [f.attname for f in fields], converted)
+    
+    def _write_access_sql(self, connection, user):
+        """
+        visible_to(user, WRITE_ROLES) as a raw WHERE fragment for
+        compare_and_set: the same EXISTS probe on the membership index.
+        """
+        from .models import ListMembership
+        qn = connection.ops.quote_name
+        opts = self.model._meta
+        membership = ListMembership._meta
+        table = qn(opts.db_table)
+        list_col = qn(opts.get_field('todo_list').column)
+        m_list_col = qn(membership.get_field('todo_list').column)
+        m_user_col = qn(membership.get_field('user').column)
+        m_role_col = qn(membership.get_field('role').column)
+        roles = ListMembership.WRITE_ROLES
+        sql = (
+            f"(({table}.{list_col} IS NULL AND {table}.{qn(opts.get_field('user').column)} = %s) "
+            f"OR EXISTS (SELECT 1 FROM {qn(membership.db_table)} "
+            f"WHERE {m_user_col} = %s AND {m_list_col} = {table}.{list_col} "
+            f"AND {m_role_col} IN ({', '.join(['%s'] * len(roles))})))"
+        )
+        return sql, [user.pk, user.pk, *roles]
+    
+    def due_for_reminder(self, before):
+        """
+        Return pending, active todos due before ``before`` that have not had
+        a reminder yet. Matches the partial todo_reminder_due_idx exactly.
+        """
+        return self.filter(
+            is_deleted=False, completed=False,
+            due_at__isnull=False, due_at__lte=before,
+            reminder_sent_at__isnull=True,
+        )
+    
+    def top_level(self):
+        """Return only todos that are not subtasks."""
+        return self.filter(parent__isnull=True)
+    
+    def top_rank(self, user, todo_list=None):
+        """
+        Return the rank for a new todo at the top of the user's personal list
+        (or of ``todo_list``): one step above the current top, read from the
+        (user, rank) or (todo_list, rank) index.
+        """
+        if todo_list is None:
+            scope = self.filter(user=user, todo_list__isnull=True)
+        else:
+            scope = self.filter(todo_list=todo_list)
+        top = scope.active().top_level().aggregate(top=Min('rank'))['top']
+        return 0.0 if top is None else top - self.model.RANK_STEP
+    
+    def subtree(self, todo):
+        """
+        Return every descendant of ``todo`` (not the todo itself) in one
+        query, annotated with its depth below ``todo``.
+        """
+        return self.filter(ancestor_links__ancestor=todo).annotate(
+            depth=F('ancestor_links__depth')
+        )
+    
+    def subtree_progress(self, todo_ids):
+        """
+        Return {todo_id: (descendants, completed descendants)} for the given
+        todos, counting active subtasks at every depth, in one query.
+        """
+        from .models import TodoClosure
+        rows = (
+            TodoClosure.objects.filter(ancestor_id__in=todo_ids, descendant__is_deleted=False)
+            .values('ancestor_id')
+            .annotate(
+                total=Count('pk'),
+                done=Count('pk', filter=Q(descendant__completed=True)),
+            )
+        )
+        return {row['ancestor_id']: (row['total'], row['done']) for row in rows}
+    
+    def with_description_preview(self, length=None):
+        """
+        Defer description and fetch only its first ``length`` characters
+        (TODO_DESCRIPTION_PREVIEW_CHARS) as description_preview, plus a
+        description_has_more flag, both computed by the database. Multi-
+        kilobyte notes then never leave the database for a list page; see
+        Todo.description_excerpt for rendering.
+        """
+        if length is None:
+            length = getattr(settings, 'TODO_DESCRIPTION_PREVIEW_CHARS', 200)
+        return self.defer('description').annotate(
+            description_preview=Substr('description', 1, length),
+            # One character past the preview is enough to know, and lets
+            # the database stop reading the value early
+            description_has_more=GreaterThan(Length(Substr('description', 1, length + 1)), length),
+        )
+    
     def created_today(self):
         """Return todos created today."""
         today = timezone.now().date()
@@ -53,8 +284,211 @@ class TodoManager(models.Manager):
     def deleted(self):
         return self.get_queryset().deleted()
     
+    def deleted_roots(self):
+        return self.get_queryset().deleted_roots()
+    
     def completed(self):
         return self.get_queryset().completed()
     
     def pending(self):
-        return self.get_queryset().pending()
\ No newline at end of file
+        return self.get_queryset().pending()
+    
+    def compare_and_set(self, *args, **kwargs):
+        return self.get_queryset().compare_and_set(*args, **kwargs)
+    
+    def due_for_reminder(self, before):
+        return self.get_queryset().due_for_reminder(before)
+    
+    def top_level(self):
+        return self.get_queryset().top_level()
+    
+    def top_rank(self, user, todo_list=None):
+        return self.get_queryset().top_rank(user, todo_list)
+    
+    def visible_to(self, user, roles=None):
+        return self.get_queryset().visible_to(user, roles)
+    
+    def subtree(self, todo):
+        return self.get_queryset().subtree(todo)
+    
+    def subtree_progress(self, todo_ids):
+        return self.get_queryset().subtree_progress(todo_ids)
+    
+    def with_description_preview(self, length=None):
+        return self.get_queryset().with_description_preview(length)
+
+
+class DailyTodoStatsManager(models.Manager):
+    """Manager for the per-user daily productivity rollups."""
+    
+    def increment(self, user_id, day, **deltas):
+        """
+        Add deltas to the (user, day) rollup row, creating it if needed.
+        
+        Runs as a single UPDATE ... SET col = col + n in the common case, so
+        concurrent events for the same day never overwrite each other.
+        """
+        updates = {field: F(field) + value for field, value in deltas.items()}
+        if self.filter(user_id=user_id, day=day).update(**updates):
+            return
+        try:
+            with transaction.atomic():
+                self.create(user_id=user_id, day=day, **deltas)
+        except IntegrityError:
+            # Another worker created the row first
+            self.filter(user_id=user_id, day=day).update(**updates)
+    
+    def for_user(self, user, days=30):
+        """Return the user's rollups for the last N days, newest first."""
+        since = timezone.localdate() - timezone.timedelta(days=days - 1)
+        return self.filter(user=user, day__gte=since).order_by('-day')
+
+
+
+class StorageUsageManager(models.Manager):
+    """Manager for the per-user attachment storage counters."""
+    
+    def charge(self, user_id, size, limit):
+        """
+        Add ``size`` bytes to the user's usage unless that would take it
+        past ``limit``. Returns whether it was charged.
+        
+        The check and the increment are one conditional UPDATE, so two
+        concurrent uploads cannot both squeeze under the limit.
+        """
+        if size > limit:
+            return False
+        if self.filter(user_id=user_id, bytes_used__lte=limit - size).update(bytes_used=F('bytes_used') + size):
+            return True
+        if self.filter(user_id=user_id).exists():
+            return False
+        try:
+            with transaction.atomic():
+                self.create(user_id=user_id, bytes_used=size)
+            return True
+        except IntegrityError:
+            # Another worker created the row first
+            return bool(self.filter(user_id=user_id, bytes_used__lte=limit - size).update(
+                bytes_used=F('bytes_used') + size
+            ))
+    
+    def release(self, user_id, size):
+        """Give ``size`` bytes back to the user."""
+        self.filter(user_id=user_id).update(bytes_used=Greatest(F('bytes_used') - size, 0))
+    
+    def used(self, user_id):
+        return self.filter(user_id=user_id).values_list('bytes_used', flat=True).first() or 0
+
+
+class ApiTokenManager(models.Manager):
+    """Manager for JSON API bearer tokens."""
+    
+    @staticmethod
+    def hash_key(key):
+        return hashlib.sha256(key.encode()).hexdigest()
+    
+    def create_token(self, user, name):
+        """Create a token for ``user``. Returns (token, key); only the hash is stored."""
+        key = secrets.token_urlsafe(32)
+        return self.create(user=user, name=name, key_hash=self.hash_key(key)), key
+    
+    def authenticate(self, key):
+        """
+        Return the active user the key belongs to, or None. last_used_at is
+        refreshed at most hourly, so API traffic does not write on every call.
+        """
+        token = self.select_related('user').filter(key_hash=self.hash_key(key)).first()
+        if token is None or not token.user.is_active:
+            return None
+        now = timezone.now()
+        if token.last_used_at is None or token.last_used_at < now - timezone.timedelta(hours=1):
+            self.filter(pk=token.pk).update(last_used_at=now)
+        return token.user
+
+
+class TagManager(models.Manager):
+    """Manager for Tag model."""
+    
+    def for_names(self, user, names):
+        """
+        Return the user's tags with the given names, creating missing ones.
+        
+        Two queries at most besides the insert: existing tags are fetched in
+        one go and the missing ones bulk-created.
+        """
+        if not names:
+            return []
+        existing = {tag.name: tag for tag in self.filter(user=user, name__in=names)}
+        missing = [name for name in names if name not in existing]
+        if missing:
+            self.bulk_create(
+                [self.model(user=user, name=name) for name in missing],
+                ignore_conflicts=True,
+            )
+            existing.update({
+                tag.name: tag for tag in self.filter(user=user, name__in=missing)
+            })
+        return [existing[name] for name in names if name in existing]
+
+
+
+class TodoClosureManager(models.Manager):
+    """Manager for the subtask closure table."""
+    
+    def link(self, todo):
+        """
+        Add the closure rows for a newly created subtask in one statement:
+        (parent, todo, 1) plus (ancestor, todo, depth + 1) for every
+        ancestor of the parent.
+        """
+        if todo.parent_id is None:
+            return
+        opts = self.model._meta
+        connection = connections[self.db]
+        qn = connection.ops.quote_name
+        table = qn(opts.db_table)
+        ancestor = qn(opts.get_field('ancestor').column)
+        descendant = qn(opts.get_field('descendant').column)
+        depth = qn(opts.get_field('depth').column)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} ({ancestor}, {descendant}, {depth}) "
+                f"SELECT {ancestor}, %s, {depth} + 1 FROM {table} WHERE {descendant} = %s "
+                f"UNION ALL SELECT %s, %s, 1",
+                [todo.pk, todo.parent_id, todo.parent_id, todo.pk],
+            )
+
+
+class TodoListManager(models.Manager):
+    """Manager for shared todo lists."""
+    
+    def for_user(self, user):
+        """Return the user's lists, each annotated with their role on it."""
+        return self.filter(memberships__user=user).annotate(role=F('memberships__role'))
+    
+    def create_for(self, owner, name):
+        """Create a list with ``owner`` as its first owner member."""
+        from .models import ListMembership
+        with transaction.atomic():
+            todo_list = self.create(owner=owner, name=name)
+            ListMembership.objects.create(todo_list=todo_list, user=owner, role=ListMembership.ROLE_OWNER)
+        return todo_list
+
+
+class ListMembershipManager(models.Manager):
+    """Manager for list memberships."""
+    
+    def role_of(self, user_id, todo_list_id):
+        """Return the user's role on the list, or None. One index lookup."""
+        return self.filter(user_id=user_id, todo_list_id=todo_list_id).values_list('role', flat=True).first()
+
+
+class RecurrenceRuleManager(models.Manager):
+    """Manager for recurring todo rules."""
+    
+    def due(self, horizon):
+        """
+        Active rules with an occurrence to materialize before ``horizon``.
+        Matches the partial recurrence_due_idx.
+        """
+        return self.filter(is_active=True, next_occurrence_at__isnull=False, next_occurrence_at__lte=horizon)
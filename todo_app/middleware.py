@@ -1,4 +1,17 @@
 # todo_app/middleware.py
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.http import JsonResponse
+from django.urls import Resolver404, resolve
+
+from .models import ApiToken
+from .profiling import ProfileStore, SqlTrace, StackSampler
+from .ratelimit import TokenBucket
+from .triggers import event_triggers_enabled, set_event_actor
+
 class CsrfExemptForHtmx:
     """
     Middleware to exempt CSRF for HTMX requests if needed.
@@ -11,4 +24,198 @@ class CsrfExemptForHtmx:
         # Skip CSRF for HTMX delete if still having issues
         if request.htmx and request.method == 'POST':
             setattr(request, '_dont_enforce_csrf_checks', True)
-        return self.get_response(request)
\ No newline at end of file
+        return self.get_response(request)
+
+
+class ApiTokenMiddleware:
+    """
+    Authenticate JSON API requests that carry "Authorization: Bearer <key>"
+    (see ApiToken), for clients without a browser session. A bearer token
+    cannot be sent by a cross-site form, so these requests skip the CSRF
+    check; an unknown key gives 401 rather than falling back to the
+    session. Must come after AuthenticationMiddleware.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        scheme, _, key = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() != 'bearer' or not self._is_api(request):
+            return self.get_response(request)
+        user = ApiToken.objects.authenticate(key.strip())
+        if user is None:
+            return JsonResponse({'error': 'Invalid API token'}, status=401)
+        request.user = user
+        request._dont_enforce_csrf_checks = True
+        return self.get_response(request)
+
+    @staticmethod
+    def _is_api(request):
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return False
+        return match.namespace == 'todo_app' and (match.url_name or '').startswith('api_')
+
+
+class EventActorMiddleware:
+    """
+    With TODO_EVENT_LOGGING = 'triggers', tell the database triggers which
+    user is making a change, so events on shared lists name the editor
+    rather than the todo owner. Only unsafe methods can change todos, so
+    GET requests are left alone.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if (
+            request.method in ('GET', 'HEAD', 'OPTIONS')
+            or not event_triggers_enabled()
+            or not request.user.is_authenticated
+        ):
+            return self.get_response(request)
+        with set_event_actor(request.user.pk):
+            return self.get_response(request)
+
+
+class RateLimitMiddleware:
+    """
+    Throttle todo_app mutations with token buckets in the shared cache.
+    
+    Every POST, PUT, PATCH or DELETE to a todo_app view (e.g. attachment
+    chunks) takes a token from the caller's bucket for that endpoint:
+    TODO_RATE_LIMITS entries are keyed by URL name, and endpoints without
+    one get their own bucket of the 'default' size. Every request also
+    takes a token from one global bucket (TODO_RATE_LIMIT_GLOBAL). An empty
+    user bucket gives 429, an empty global bucket sheds the request with
+    503; both carry Retry-After and are handled by the HTMX toast code.
+    Views that do several writes per request charge the rest with charge().
+    """
+    SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        limits = getattr(settings, 'TODO_RATE_LIMITS', {'default': (30, 1.0)})
+        self.buckets = {
+            name: TokenBucket(f'endpoint:{name}', capacity, rate)
+            for name, (capacity, rate) in limits.items()
+        }
+        global_limit = getattr(settings, 'TODO_RATE_LIMIT_GLOBAL', None)
+        self.global_bucket = TokenBucket('global', *global_limit) if global_limit else None
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        if request.method in self.SAFE_METHODS or match is None or match.namespace != 'todo_app':
+            return None
+
+        if request.user.is_authenticated:
+            identity = f'user:{request.user.pk}'
+        else:
+            identity = f"ip:{request.META.get('REMOTE_ADDR', '')}"
+        bucket = self.buckets.get(match.url_name)
+        if bucket is None:
+            # Same size as 'default', but each endpoint has its own tokens
+            bucket = self.buckets.get('default')
+            identity = f'{match.url_name}:{identity}'
+        request._rate_limits = (self, bucket, identity)
+        return self._consume(bucket, identity, 1)
+
+    @staticmethod
+    def charge(request, tokens):
+        """
+        Take ``tokens`` more tokens for the current request, e.g. one per
+        operation of a batch. Returns the 429/503 response if the buckets
+        cannot cover them, else None.
+        """
+        limits = getattr(request, '_rate_limits', None)
+        if limits is None or tokens <= 0:
+            return None
+        middleware, bucket, identity = limits
+        return middleware._consume(bucket, identity, tokens)
+
+    def _consume(self, bucket, identity, tokens):
+        if bucket is not None:
+            allowed, retry_after = bucket.consume(identity, tokens)
+            if not allowed:
+                return self._reject('Too many requests, please slow down', 429, retry_after)
+
+        if self.global_bucket is not None:
+            allowed, retry_after = self.global_bucket.consume('all', tokens)
+            if not allowed:
+                return self._reject('Server is busy, please retry shortly', 503, retry_after)
+        return None
+
+    def _reject(self, message, status, retry_after):
+        response = JsonResponse({'error': message, 'retry_after': retry_after}, status=status)
+        response['Retry-After'] = str(max(retry_after, 1))
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Profile a single todo_app request on demand.
+    
+    Staff users opt a request in with the X-Todo-Profile header (or
+    ?_profile=1). The view and template rendering run under a sampling
+    stack profiler and a SQL trace, and the result is written to the
+    rotating ProfileStore for the todo_profiles management command.
+    Other requests pay nothing beyond the header check.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.interval = getattr(settings, 'TODO_PROFILE_INTERVAL', 0.005)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        capture = getattr(request, '_todo_profile', None)
+        if capture is not None:
+            self._finish(request, response, capture)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        if match is None or match.namespace != 'todo_app':
+            return None
+        if not (request.headers.get('X-Todo-Profile') or request.GET.get('_profile')):
+            return None
+        if not (request.user.is_authenticated and request.user.is_staff):
+            return None
+
+        sql_trace = SqlTrace()
+        wrapper = connection.execute_wrapper(sql_trace)
+        wrapper.__enter__()
+        sampler = StackSampler(threading.get_ident(), self.interval)
+        sampler.start()
+        request._todo_profile = {
+            'sampler': sampler,
+            'sql_trace': sql_trace,
+            'wrapper': wrapper,
+            'view': match.view_name,
+            'started': time.time(),
+            'start': time.perf_counter(),
+        }
+        return None
+
+    def _finish(self, request, response, capture):
+        # Rendered by now, so template time is included in the profile
+        duration = time.perf_counter() - capture['start']
+        capture['sampler'].stop()
+        capture['wrapper'].__exit__(None, None, None)
+
+        profile_id = ProfileStore().save({
+            'path': request.get_full_path(),
+            'method': request.method,
+            'view': capture['view'],
+            'user_id': request.user.pk,
+            'status': response.status_code,
+            'started': capture['started'],
+            'duration_ms': round(duration * 1000, 3),
+            'interval': self.interval,
+            'samples': dict(capture['sampler'].samples),
+            'sql': capture['sql_trace'].queries,
+        })
+        response['X-Todo-Profile-Id'] = profile_id
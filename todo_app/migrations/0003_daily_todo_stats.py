@@ -0,0 +1,34 @@
+# Generated by Django 6.0.1 on 2026-10-19 16:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo_app', '0002_add_status_field'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyTodoStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='Day')),
+                ('created_count', models.PositiveIntegerField(default=0, verbose_name='Created')),
+                ('completed_count', models.PositiveIntegerField(default=0, verbose_name='Completed')),
+                ('uncompleted_count', models.PositiveIntegerField(default=0, verbose_name='Uncompleted')),
+                ('completion_seconds', models.BigIntegerField(default=0, verbose_name='Completion Seconds')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_todo_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Daily Todo Stats',
+                'verbose_name_plural': 'Daily Todo Stats',
+                'ordering': ['-day'],
+                'constraints': [models.UniqueConstraint(fields=('user', 'day'), name='unique_daily_todo_stats_user_day')],
+            },
+        ),
+    ]
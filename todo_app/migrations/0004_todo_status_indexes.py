@@ -0,0 +1,23 @@
+# Generated by Django 6.0.1 on 2026-10-19 16:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo_app', '0003_daily_todo_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='todo',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['user', '-created_at'], name='todo_active_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='todo',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['user', 'status', '-created_at'], name='todo_active_status_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 6.0.1 on 2026-10-19 16:11
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo_app', '0005_todo_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TodoTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('todo_id', models.BigIntegerField(db_index=True, verbose_name='Todo ID')),
+                ('title', models.CharField(max_length=200, verbose_name='Title')),
+                ('todo_created_at', models.DateTimeField(verbose_name='Todo Created At')),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Deleted At')),
+                ('event_count', models.PositiveIntegerField(default=0, verbose_name='Event Count')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='todo_tombstones', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Todo Tombstone',
+                'verbose_name_plural': 'Todo Tombstones',
+                'ordering': ['-deleted_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.0.1 on 2026-10-19 16:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo_app', '0006_todo_tombstone'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='todoevent',
+            index=models.Index(fields=['user', '-timestamp', '-id'], name='todoevent_user_feed_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 6.0.1 on 2026-10-19 16:17
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo_app', '0007_todoevent_user_feed_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='todo',
+            name='due_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Due At'),
+        ),
+        migrations.AddField(
+            model_name='todo',
+            name='reminder_sent_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Reminder Sent At'),
+        ),
+        migrations.AddIndex(
+            model_name='todo',
+            index=models.Index(condition=models.Q(('completed', False), ('due_at__isnull', False), ('is_deleted', False), ('reminder_sent_at__isnull', True)), fields=['due_at'], name='todo_reminder_due_idx'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 6.0.1 on 2026-10-19 16:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo_app', '0009_tags'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TodoClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField(verbose_name='Depth')),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='todo',
+            name='todo_active_user_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='todo',
+            name='todo_active_status_idx',
+        ),
+        migrations.AddField(
+            model_name='todo',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='children', to='todo_app.todo'),
+        ),
+        migrations.AddIndex(
+            model_name='todo',
+            index=models.Index(condition=models.Q(('is_deleted', False), ('parent__isnull', True)), fields=['user', '-created_at'], name='todo_active_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='todo',
+            index=models.Index(condition=models.Q(('is_deleted', False), ('parent__isnull', True)), fields=['user', 'status', '-created_at'], name='todo_active_status_idx'),
+        ),
+        migrations.AddField(
+            model_name='todoclosure',
+            name='ancestor',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='todo_app.todo'),
+        ),
+        migrations.AddField(
+            model_name='todoclosure',
+            name='descendant',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='todo_app.todo'),
+        ),
+        migrations.AddConstraint(
+            model_name='todoclosure',
+            constraint=models.UniqueConstraint(fields=('ancestor', 'descendant'), name='unique_todoclosure_pair'),
+        ),
+    ]
@@ -0,0 +1,114 @@
+# Generated by Django 6.0.1 on 2026-10-19 16:23
+
+from django.conf import settings
+from django.db import migrations, models, transaction
+
+RANK_STEP = 1024.0
+BATCH_SIZE = 1000
+
+
+class AddIndexConcurrently(migrations.AddIndex):
+    """
+    CREATE INDEX CONCURRENTLY on PostgreSQL, so building the index does not
+    block writes to the todo table; a plain AddIndex on other databases.
+    
+    Same as django.contrib.postgres.operations.AddIndexConcurrently, which
+    cannot be imported without a PostgreSQL driver.
+    """
+    
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.add_index(model, self.index, concurrently=True)
+    
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_backwards(app_label, schema_editor, from_state, to_state)
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.remove_index(model, self.index, concurrently=True)
+
+
+class RemoveIndexConcurrently(migrations.RemoveIndex):
+    """DROP INDEX CONCURRENTLY on PostgreSQL; a plain RemoveIndex elsewhere."""
+    
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            index = from_state.models[app_label, self.model_name_lower].get_index_by_name(self.name)
+            schema_editor.remove_index(model, index, concurrently=True)
+    
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_backwards(app_label, schema_editor, from_state, to_state)
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            index = to_state.models[app_label, self.model_name_lower].get_index_by_name(self.name)
+            schema_editor.add_index(model, index, concurrently=True)
+
+
+def backfill_ranks(apps, schema_editor):
+    """
+    Rank existing todos in their old newest-first order, per user.
+    
+    Runs user by user, committing every BATCH_SIZE rows, so no lock on the
+    todo table is held for longer than one small UPDATE batch.
+    """
+    Todo = apps.get_model('todo_app', 'Todo')
+    user_ids = Todo.objects.order_by('user_id').values_list('user_id', flat=True).distinct()
+    for user_id in user_ids.iterator():
+        todo_ids = list(
+            Todo.objects.filter(user_id=user_id).order_by('-created_at', '-id').values_list('id', flat=True)
+        )
+        for start in range(0, len(todo_ids), BATCH_SIZE):
+            batch = [
+                Todo(id=pk, rank=(start + offset) * RANK_STEP)
+                for offset, pk in enumerate(todo_ids[start:start + BATCH_SIZE])
+            ]
+            with transaction.atomic():
+                Todo.objects.bulk_update(batch, ['rank'])
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('todo_app', '0010_subtasks'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='todo',
+            options={'ordering': ['rank', '-created_at'], 'verbose_name': 'Todo', 'verbose_name_plural': 'Todos'},
+        ),
+        # The (user, [status,] created_at) indexes of 0004/0010 give way
+        # to rank-ordered ones; both swaps avoid locking out writes
+        RemoveIndexConcurrently(
+            model_name='todo',
+            name='todo_active_user_created_idx',
+        ),
+        RemoveIndexConcurrently(
+            model_name='todo',
+            name='todo_active_status_idx',
+        ),
+        migrations.AddField(
+            model_name='todo',
+            name='rank',
+            field=models.FloatField(default=0.0, verbose_name='Rank'),
+        ),
+        migrations.RunPython(backfill_ranks, migrations.RunPython.noop),
+        AddIndexConcurrently(
+            model_name='todo',
+            index=models.Index(condition=models.Q(('is_deleted', False), ('parent__isnull', True)), fields=['user', 'rank'], name='todo_active_user_rank_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='todo',
+            index=models.Index(condition=models.Q(('is_deleted', False), ('parent__isnull', True)), fields=['user', 'status', 'rank'], name='todo_active_status_idx'),
+        ),
+    ]
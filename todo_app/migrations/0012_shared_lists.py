@@ -0,0 +1,59 @@
+# Generated by Django 6.0.1 on 2026-10-19 16:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo_app', '0011_todo_rank'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TodoList',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created At')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Updated At')),
+                ('name', models.CharField(max_length=100, verbose_name='Name')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='owned_todo_lists', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Todo List',
+                'verbose_name_plural': 'Todo Lists',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ListMembership',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created At')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Updated At')),
+                ('role', models.CharField(choices=[('viewer', 'Viewer'), ('editor', 'Editor'), ('owner', 'Owner')], default='viewer', max_length=10)),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='list_memberships', to=settings.AUTH_USER_MODEL)),
+                ('todo_list', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='todo_app.todolist')),
+            ],
+            options={
+                'verbose_name': 'List Membership',
+                'verbose_name_plural': 'List Memberships',
+            },
+        ),
+        migrations.AddField(
+            model_name='todo',
+            name='todo_list',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='todos', to='todo_app.todolist'),
+        ),
+        migrations.AddIndex(
+            model_name='todo',
+            index=models.Index(condition=models.Q(('is_deleted', False), ('parent__isnull', True), ('todo_list__isnull', False)), fields=['todo_list', 'rank'], name='todo_active_list_rank_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='listmembership',
+            constraint=models.UniqueConstraint(fields=('user', 'todo_list'), name='unique_listmembership_user_list'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 6.0.1 on 2026-10-19 16:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo_app', '0012_shared_lists'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='todo',
+            name='occurrence_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Occurrence At'),
+        ),
+        migrations.CreateModel(
+            name='RecurrenceRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created At')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Updated At')),
+                ('title', models.CharField(max_length=200, verbose_name='Title')),
+                ('description', models.TextField(blank=True, verbose_name='Description')),
+                ('frequency', models.CharField(choices=[('daily', 'Daily'), ('weekly', 'Weekly')], default='daily', max_length=10)),
+                ('interval', models.PositiveSmallIntegerField(default=1, verbose_name='Interval')),
+                ('starts_at', models.DateTimeField(verbose_name='Starts At')),
+                ('ends_at', models.DateTimeField(blank=True, null=True, verbose_name='Ends At')),
+                ('next_occurrence_at', models.DateTimeField(blank=True, null=True, verbose_name='Next Occurrence At')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Is Active')),
+                ('todo_list', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='recurrence_rules', to='todo_app.todolist')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recurrence_rules', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Recurrence Rule',
+                'verbose_name_plural': 'Recurrence Rules',
+            },
+        ),
+        migrations.AddField(
+            model_name='todo',
+            name='recurrence',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='occurrences', to='todo_app.recurrencerule'),
+        ),
+        migrations.AddConstraint(
+            model_name='todo',
+            constraint=models.UniqueConstraint(fields=('recurrence', 'occurrence_at'), name='unique_todo_recurrence_occurrence'),
+        ),
+        migrations.AddIndex(
+            model_name='recurrencerule',
+            index=models.Index(condition=models.Q(('is_active', True), ('next_occurrence_at__isnull', False)), fields=['next_occurrence_at'], name='recurrence_due_idx'),
+        ),
+    ]
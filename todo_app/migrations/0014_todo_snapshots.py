@@ -0,0 +1,30 @@
+# Generated by Django 6.0.1 on 2026-10-19 16:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo_app', '0013_recurrence_rules'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TodoSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.PositiveIntegerField(verbose_name='Event Number')),
+                ('event_id', models.BigIntegerField(verbose_name='Event ID')),
+                ('timestamp', models.DateTimeField(verbose_name='Timestamp')),
+                ('state', models.JSONField(verbose_name='State')),
+                ('todo', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='todo_app.todo')),
+            ],
+            options={
+                'verbose_name': 'Todo Snapshot',
+                'verbose_name_plural': 'Todo Snapshots',
+                'constraints': [models.UniqueConstraint(fields=('todo', 'seq'), name='unique_todosnapshot_seq')],
+            },
+        ),
+    ]
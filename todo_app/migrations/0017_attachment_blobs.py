@@ -0,0 +1,62 @@
+# Generated by Django 6.0.1 on 2026-10-19 17:04
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def drop_duplicate_uploads(apps, schema_editor):
+    """Keep the furthest-along upload of each file, so the constraint can be added."""
+    AttachmentUpload = apps.get_model('todo_app', 'AttachmentUpload')
+    duplicates = (
+        AttachmentUpload.objects.values('todo_id', 'user_id', 'name', 'size')
+        .annotate(received=Max('received'), count=models.Count('pk')).filter(count__gt=1)
+    )
+    for row in duplicates:
+        uploads = AttachmentUpload.objects.filter(
+            todo_id=row['todo_id'], user_id=row['user_id'], name=row['name'], size=row['size'],
+        )
+        keep = uploads.filter(received=row['received']).values_list('pk', flat=True)[:1]
+        # Their part files are left to the storage; nothing refers to them any more
+        uploads.exclude(pk__in=list(keep)).delete()
+
+
+def create_blobs(apps, schema_editor):
+    """One AttachmentBlob per content hash already stored."""
+    Attachment = apps.get_model('todo_app', 'Attachment')
+    AttachmentBlob = apps.get_model('todo_app', 'AttachmentBlob')
+    AttachmentBlob.objects.bulk_create(
+        [
+            AttachmentBlob(sha256=sha256, size=size)
+            for sha256, size in Attachment.objects.values_list('sha256', 'size').distinct()
+        ],
+        batch_size=1000, ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo_app', '0016_apitoken'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttachmentBlob',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='SHA-256')),
+                ('size', models.PositiveBigIntegerField(verbose_name='Size')),
+            ],
+            options={
+                'verbose_name': 'Attachment Blob',
+                'verbose_name_plural': 'Attachment Blobs',
+            },
+        ),
+        migrations.RunPython(create_blobs, migrations.RunPython.noop),
+        migrations.RunPython(drop_duplicate_uploads, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='attachmentupload',
+            constraint=models.UniqueConstraint(fields=('todo', 'user', 'name', 'size'), name='attachment_upload_unique_file'),
+        ),
+    ]
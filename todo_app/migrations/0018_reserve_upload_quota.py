@@ -0,0 +1,34 @@
+# Generated by Django 6.0.1 on 2026-10-19 17:30
+
+from django.db import migrations
+from django.db.models import F, Sum
+
+
+def reserve_unfinished_uploads(apps, schema_editor):
+    """Charge uploads started before sizes were reserved up front."""
+    AttachmentUpload = apps.get_model('todo_app', 'AttachmentUpload')
+    StorageUsage = apps.get_model('todo_app', 'StorageUsage')
+    for row in AttachmentUpload.objects.values('user_id').annotate(total=Sum('size')).order_by():
+        if not StorageUsage.objects.filter(user_id=row['user_id']).update(bytes_used=F('bytes_used') + row['total']):
+            StorageUsage.objects.create(user_id=row['user_id'], bytes_used=row['total'])
+
+
+def release_unfinished_uploads(apps, schema_editor):
+    AttachmentUpload = apps.get_model('todo_app', 'AttachmentUpload')
+    StorageUsage = apps.get_model('todo_app', 'StorageUsage')
+    for row in AttachmentUpload.objects.values('user_id').annotate(total=Sum('size')).order_by():
+        usage = StorageUsage.objects.filter(user_id=row['user_id']).first()
+        if usage is not None:
+            usage.bytes_used = max(usage.bytes_used - row['total'], 0)
+            usage.save(update_fields=['bytes_used'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo_app', '0017_attachment_blobs'),
+    ]
+
+    operations = [
+        migrations.RunPython(reserve_unfinished_uploads, release_unfinished_uploads),
+    ]
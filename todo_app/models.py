@@ -3,11 +3,16 @@
 Models for Todo application with abstract base models and soft delete functionality.
 """
 
-from django.db import models
+import uuid
+
+from django.db import models, transaction
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth.models import User  # ADD THIS IMPORT
-from .managers import TodoManager
+from .managers import (
+    ApiTokenManager, DailyTodoStatsManager, ListMembershipManager, RecurrenceRuleManager, StorageUsageManager,
+    TagManager, TodoClosureManager, TodoListManager, TodoManager,
+)
 
 
 class TimeStampedModel(models.Model):
@@ -28,22 +33,190 @@ class SoftDeleteModel(models.Model):
     is_deleted = models.BooleanField(default=False, verbose_name=_("Is Deleted"))
     deleted_at = models.DateTimeField(null=True, blank=True, verbose_name=_("Deleted At"))
     
+    def soft_delete_descendants(self):
+        """
+        Return a queryset of rows that should be soft deleted and restored
+        along with this one, or None. Subclasses with a hierarchy override it.
+        """
+        return None
+    
     def soft_delete(self):
         """Mark the instance as deleted without removing it from database."""
         self.is_deleted = True
         self.deleted_at = timezone.now()
         self.save(update_fields=['is_deleted', 'deleted_at'])
+        
+        descendants = self.soft_delete_descendants()
+        if descendants is not None:
+            # One UPDATE for the whole subtree; the shared deleted_at marks
+            # which rows this delete took with it
+            descendants.filter(is_deleted=False).update(is_deleted=True, deleted_at=self.deleted_at)
     
     def restore(self):
         """Restore a soft-deleted instance."""
+        deleted_at = self.deleted_at
         self.is_deleted = False
         self.deleted_at = None
         self.save(update_fields=['is_deleted', 'deleted_at'])
+        
+        descendants = self.soft_delete_descendants()
+        if descendants is not None and deleted_at is not None:
+            # Bring back only what was deleted together with this row
+            descendants.filter(is_deleted=True, deleted_at=deleted_at).update(is_deleted=False, deleted_at=None)
     
     class Meta:
         abstract = True
 
 
+class Tag(models.Model):
+    """
+    A user's label for todos.
+    
+    todo_count is maintained incrementally (see signals.update_tag_counts),
+    so listing tags with counts never needs a GROUP BY over TodoTag. It
+    counts every todo carrying the tag, trashed ones included: soft delete
+    and restore leave it alone, only a hard delete takes the todo out.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='tags')
+    name = models.CharField(max_length=50, verbose_name=_("Name"))
+    todo_count = models.PositiveIntegerField(default=0, verbose_name=_("Todo Count"))
+    
+    objects = TagManager()
+    
+    def __str__(self):
+        return self.name
+    
+    class Meta:
+        ordering = ['name']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'name'], name='unique_tag_user_name'),
+        ]
+        verbose_name = _("Tag")
+        verbose_name_plural = _("Tags")
+
+
+class TodoList(TimeStampedModel):
+    """
+    A todo list shared between its members.
+    
+    Access is decided by ListMembership alone; owner is just who created it.
+    Todos without a list are the owner's personal todos.
+    """
+    name = models.CharField(max_length=100, verbose_name=_("Name"))
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='owned_todo_lists')
+    
+    objects = TodoListManager()
+    
+    def __str__(self):
+        return self.name
+    
+    class Meta:
+        ordering = ['name']
+        verbose_name = _("Todo List")
+        verbose_name_plural = _("Todo Lists")
+
+
+class ListMembership(TimeStampedModel):
+    """
+    A user's role on a TodoList.
+    
+    The (user, todo_list) unique index is what every access check probes,
+    so checking access to a todo is one index lookup, never a scan of the
+    list's members.
+    """
+    ROLE_VIEWER = 'viewer'
+    ROLE_EDITOR = 'editor'
+    ROLE_OWNER = 'owner'
+    
+    ROLE_CHOICES = [
+        (ROLE_VIEWER, 'Viewer'),
+        (ROLE_EDITOR, 'Editor'),
+        (ROLE_OWNER, 'Owner'),
+    ]
+    
+    # Roles allowed to read, change todos, and manage the list and its members
+    READ_ROLES = (ROLE_VIEWER, ROLE_EDITOR, ROLE_OWNER)
+    WRITE_ROLES = (ROLE_EDITOR, ROLE_OWNER)
+    MANAGE_ROLES = (ROLE_OWNER,)
+    
+    todo_list = models.ForeignKey(TodoList, on_delete=models.CASCADE, related_name='memberships')
+    # Leading column of the unique index below, so no separate index
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='list_memberships', db_index=False)
+    role = models.CharField(max_length=10, choices=ROLE_CHOICES, default=ROLE_VIEWER)
+    
+    objects = ListMembershipManager()
+    
+    def __str__(self):
+        return f"{self.user} ({self.role}) on {self.todo_list}"
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'todo_list'], name='unique_listmembership_user_list'),
+        ]
+        verbose_name = _("List Membership")
+        verbose_name_plural = _("List Memberships")
+
+
+class RecurrenceRule(TimeStampedModel):
+    """
+    A repeating todo, materialized lazily.
+    
+    Only occurrences inside a rolling horizon exist as Todo rows (see
+    todo_app.recurrence). next_occurrence_at is the first occurrence not
+    materialized yet, so finding the rules that need work is a range scan
+    on the partial index below, however many rules there are.
+    """
+    FREQUENCY_DAILY = 'daily'
+    FREQUENCY_WEEKLY = 'weekly'
+    
+    FREQUENCY_CHOICES = [
+        (FREQUENCY_DAILY, 'Daily'),
+        (FREQUENCY_WEEKLY, 'Weekly'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recurrence_rules')
+    todo_list = models.ForeignKey(TodoList, on_delete=models.CASCADE, related_name='recurrence_rules', null=True, blank=True)
+    title = models.CharField(max_length=200, verbose_name=_("Title"))
+    description = models.TextField(blank=True, verbose_name=_("Description"))
+    frequency = models.CharField(max_length=10, choices=FREQUENCY_CHOICES, default=FREQUENCY_DAILY)
+    interval = models.PositiveSmallIntegerField(default=1, verbose_name=_("Interval"))
+    starts_at = models.DateTimeField(verbose_name=_("Starts At"))
+    ends_at = models.DateTimeField(null=True, blank=True, verbose_name=_("Ends At"))
+    next_occurrence_at = models.DateTimeField(null=True, blank=True, verbose_name=_("Next Occurrence At"))
+    is_active = models.BooleanField(default=True, verbose_name=_("Is Active"))
+    
+    objects = RecurrenceRuleManager()
+    
+    def __str__(self):
+        return f"{self.title} ({self.get_frequency_display()})"
+    
+    def save(self, *args, **kwargs):
+        if self._state.adding and self.next_occurrence_at is None:
+            self.next_occurrence_at = self.starts_at
+        super().save(*args, **kwargs)
+    
+    def next_after(self, occurrence):
+        """
+        The occurrence after ``occurrence``, stepping in local time so a
+        9:00 todo stays at 9:00 across DST changes.
+        """
+        days = self.interval * (7 if self.frequency == self.FREQUENCY_WEEKLY else 1)
+        local = timezone.localtime(occurrence).replace(tzinfo=None) + timezone.timedelta(days=days)
+        return timezone.make_aware(local)
+    
+    class Meta:
+        indexes = [
+            # Scheduler scan: active rules whose next occurrence enters the horizon
+            models.Index(
+                fields=['next_occurrence_at'],
+                condition=models.Q(is_active=True, next_occurrence_at__isnull=False),
+                name='recurrence_due_idx',
+            ),
+        ]
+        verbose_name = _("Recurrence Rule")
+        verbose_name_plural = _("Recurrence Rules")
+
+
 class Todo(TimeStampedModel, SoftDeleteModel):
     """
     Todo item model with soft delete functionality.
@@ -54,16 +227,56 @@ class Todo(TimeStampedModel, SoftDeleteModel):
     description = models.TextField(blank=True, verbose_name=_("Description"))
     completed = models.BooleanField(default=False, verbose_name=_("Completed"))
 
+    STATUS_PENDING = 'pending'
+    STATUS_IN_PROGRESS = 'in_progress'
+    STATUS_COMPLETED = 'completed'
+    
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_IN_PROGRESS, 'In Progress'),
+        (STATUS_COMPLETED, 'Completed')
+    ]
+
     # YOU MUST HAVE THIS BLOCK IN MODELS.PY:
     status = models.CharField(
         max_length=20,
-        choices=[
-            ('pending', 'Pending'),
-            ('in_progress', 'In Progress'),
-            ('completed', 'Completed')
-        ],
-        default='pending'
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING
+    )
+    
+    # Shared list this todo belongs to; None for the user's personal todos
+    todo_list = models.ForeignKey(TodoList, on_delete=models.CASCADE, related_name='todos', null=True, blank=True)
+    
+    # Set on todos materialized from a RecurrenceRule, one per occurrence
+    recurrence = models.ForeignKey(
+        RecurrenceRule, on_delete=models.SET_NULL, related_name='occurrences', null=True, blank=True,
+        db_index=False,
     )
+    occurrence_at = models.DateTimeField(null=True, blank=True, verbose_name=_("Occurrence At"))
+    
+    # Subtasks; the full ancestry is kept in TodoClosure for one-query subtrees
+    parent = models.ForeignKey('self', on_delete=models.CASCADE, related_name='children', null=True, blank=True)
+    
+    tags = models.ManyToManyField(Tag, through='TodoTag', related_name='todos', blank=True)
+    
+    # Optional deadline; reminder_sent_at is set once the reminder email is claimed
+    due_at = models.DateTimeField(null=True, blank=True, verbose_name=_("Due At"))
+    reminder_sent_at = models.DateTimeField(null=True, blank=True, verbose_name=_("Reminder Sent At"))
+    
+    # Optimistic concurrency token for toggle/edit. Bumped by
+    # Todo.objects.compare_and_set (every content edit), by moves and by the
+    # backfill_todo_status command. Trash/restore, subtree updates, rank
+    # respacing and the admin bulk actions leave it alone; a write there
+    # does not make a client's pending edit conflict.
+    version = models.PositiveIntegerField(default=0, verbose_name=_("Version"))
+    
+    # Manual list order (ascending). A move writes the midpoint of its new
+    # neighbours, so only the moved row changes; new todos go RANK_STEP
+    # above the current top.
+    RANK_STEP = 1024.0
+    # Neighbours closer than this get the user's ranks respaced in the background
+    RANK_MIN_GAP = 1e-3
+    rank = models.FloatField(default=0.0, verbose_name=_("Rank"))
     
     # Custom manager
     objects = TodoManager()
@@ -71,12 +284,185 @@ class Todo(TimeStampedModel, SoftDeleteModel):
     def __str__(self):
         return f"{self.title} ({'Completed' if self.completed else 'Pending'})"
     
+    def save(self, *args, **kwargs):
+        self.sync_status()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'completed' in update_fields and 'status' not in update_fields:
+            kwargs['update_fields'] = [*update_fields, 'status']
+        super().save(*args, **kwargs)
+    
+    def sync_status(self):
+        """
+        Derive status from completed, which is what the checkbox writes:
+        completed todos are STATUS_COMPLETED, and unchecking one sends it
+        back to pending (an in-progress todo stays in progress).
+        """
+        if self.completed:
+            self.status = self.STATUS_COMPLETED
+        elif self.status == self.STATUS_COMPLETED:
+            self.status = self.STATUS_PENDING
+    
+    @property
+    def description_excerpt(self):
+        """
+        (text, has_more) for rendering a list item: the database-side
+        preview when description was deferred by with_description_preview(),
+        otherwise the full description.
+        """
+        if 'description' in self.get_deferred_fields():
+            return self.description_preview, self.description_has_more
+        return self.description, False
+    
+    @property
+    def is_overdue(self):
+        return bool(self.due_at and not self.completed and self.due_at < timezone.now())
+    
+    def soft_delete_descendants(self):
+        return Todo.objects.filter(ancestor_links__ancestor_id=self.pk)
+    
+    def restore(self):
+        """
+        Restore the todo and the subtasks deleted with it. Ancestors still
+        in the trash are restored first (just those rows), so a subtask is
+        never back under a deleted parent where nothing would show it.
+        """
+        with transaction.atomic():
+            for ancestor in Todo.objects.deleted().filter(descendant_links__descendant_id=self.pk):
+                ancestor.is_deleted = False
+                ancestor.deleted_at = None
+                if hasattr(self, '_current_user'):
+                    ancestor._current_user = self._current_user
+                ancestor.save(update_fields=['is_deleted', 'deleted_at'])
+            super().restore()
+    
+    def hard_delete(self, user=None, batch_size=1000):
+        """
+        Permanently delete the todo, its subtasks and their events, leaving a
+        TodoTombstone.
+        
+        Events are removed with plain DELETEs in primary-key batches rather
+        than through the todo's cascade, which would load every event into
+        memory first. The final delete() then only has the todo rows
+        themselves (and small relations like tags and closure rows) left to
+        collect.
+        """
+        from .attachments import discard_uploads, release_attachments
+        
+        with transaction.atomic():
+            todo_ids = [self.pk] + list(
+                TodoClosure.objects.filter(ancestor_id=self.pk).values_list('descendant_id', flat=True)
+            )
+            
+            # The TodoTag rows go with the todos, without sending m2m_changed
+            Tag.objects.filter(todotag__todo_id__in=todo_ids).update(
+                todo_count=models.F('todo_count') - models.Subquery(
+                    TodoTag.objects.filter(tag=models.OuterRef('pk'), todo_id__in=todo_ids)
+                    .values('tag').annotate(n=models.Count('pk')).values('n')
+                )
+            )
+            
+            events = TodoEvent.objects.filter(todo_id__in=todo_ids)
+            event_count = 0
+            while True:
+                ids = list(events.order_by('pk').values_list('pk', flat=True)[:batch_size])
+                if not ids:
+                    break
+                # Nothing references TodoEvent and no delete signals are
+                # connected, so this is a single fast DELETE, no collection
+                event_count += TodoEvent.objects.filter(pk__in=ids).delete()[0]
+            
+            tombstone = TodoTombstone.objects.create(
+                todo_id=self.pk,
+                user=user if user is not None else self.user,
+                title=self.title,
+                todo_created_at=self.created_at,
+                event_count=event_count,
+            )
+            # Refund quotas and drop files the cascade would leave behind
+            release_attachments(Attachment.objects.filter(todo_id__in=todo_ids))
+            discard_uploads(AttachmentUpload.objects.filter(todo_id__in=todo_ids))
+            Todo.objects.filter(pk__in=todo_ids).delete()
+        return tombstone
+    
     class Meta:
-        ordering = ['-created_at']
+        ordering = ['rank', '-created_at']
+        indexes = [
+            # Infinite scroll over a user's active top-level todos in manual
+            # order, optionally by status
+            models.Index(
+                fields=['user', 'rank'],
+                condition=models.Q(is_deleted=False, parent__isnull=True),
+                name='todo_active_user_rank_idx',
+            ),
+            models.Index(
+                fields=['user', 'status', 'rank'],
+                condition=models.Q(is_deleted=False, parent__isnull=True),
+                name='todo_active_status_idx',
+            ),
+            # Same for shared lists, which are scoped by list instead of user
+            models.Index(
+                fields=['todo_list', 'rank'],
+                condition=models.Q(is_deleted=False, parent__isnull=True, todo_list__isnull=False),
+                name='todo_active_list_rank_idx',
+            ),
+            # Due-soon scan for reminders: only rows still waiting for one
+            models.Index(
+                fields=['due_at'],
+                condition=models.Q(
+                    is_deleted=False, completed=False,
+                    due_at__isnull=False, reminder_sent_at__isnull=True,
+                ),
+                name='todo_reminder_due_idx',
+            ),
+        ]
+        constraints = [
+            # One todo per occurrence, so overlapping scheduler runs cannot
+            # materialize the same occurrence twice
+            models.UniqueConstraint(
+                fields=['recurrence', 'occurrence_at'], name='unique_todo_recurrence_occurrence',
+            ),
+        ]
         verbose_name = _("Todo")
         verbose_name_plural = _("Todos")
 
 
+class TodoTag(models.Model):
+    """
+    Through table for Todo.tags.
+    
+    The (tag, todo) unique index serves tag-filtered list queries, which
+    join from the tag side.
+    """
+    todo = models.ForeignKey(Todo, on_delete=models.CASCADE)
+    # Leading column of the unique index below, so no separate index
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, db_index=False)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['tag', 'todo'], name='unique_todotag_tag_todo'),
+        ]
+
+
+class TodoClosure(models.Model):
+    """
+    Closure table for subtasks: one row per (ancestor, descendant) pair at
+    any depth, so a whole subtree or its progress is a single join.
+    
+    Top-level todos without subtasks have no rows at all.
+    """
+    # Leading column of the unique index below, so no separate index
+    ancestor = models.ForeignKey(Todo, on_delete=models.CASCADE, related_name='descendant_links', db_index=False)
+    descendant = models.ForeignKey(Todo, on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.PositiveIntegerField(verbose_name=_("Depth"))
+    
+    objects = TodoClosureManager()
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['ancestor', 'descendant'], name='unique_todoclosure_pair'),
+        ]
+
+
 class TodoEvent(TimeStampedModel):
     """
     Event log for tracking todo item changes.
@@ -111,6 +497,241 @@ class TodoEvent(TimeStampedModel):
     
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            # User-wide activity feed, keyset-paged on (timestamp, id)
+            models.Index(fields=['user', '-timestamp', '-id'], name='todoevent_user_feed_idx'),
+        ]
         verbose_name = _("Todo Event")
         verbose_name_plural = _("Todo Events")
 
+
+class TodoSnapshot(models.Model):
+    """
+    A todo's reconstructed state right after its ``seq``-th event.
+
+    Written every TODO_SNAPSHOT_EVERY events (see history.py), so rebuilding
+    the todo as of any event replays at most that many events instead of
+    the whole log.
+    """
+    todo = models.ForeignKey(Todo, on_delete=models.CASCADE, related_name='snapshots', db_index=False)
+    # Position of the event in the todo's log (1 = created) and its id.
+    # Not a foreign key: hard_delete() removes events with raw DELETEs.
+    seq = models.PositiveIntegerField(verbose_name=_("Event Number"))
+    event_id = models.BigIntegerField(verbose_name=_("Event ID"))
+    timestamp = models.DateTimeField(verbose_name=_("Timestamp"))
+    state = models.JSONField(verbose_name=_("State"))
+
+    def __str__(self):
+        return f"Todo {self.todo_id} after event #{self.seq}"
+
+    class Meta:
+        constraints = [
+            # Also the index for "latest snapshot of this todo"
+            models.UniqueConstraint(fields=['todo', 'seq'], name='unique_todosnapshot_seq'),
+        ]
+        verbose_name = _("Todo Snapshot")
+        verbose_name_plural = _("Todo Snapshots")
+
+
+
+class TodoTombstone(models.Model):
+    """
+    Audit record of a permanently deleted todo.
+    
+    Kept in its own table (no FK to Todo) so it survives the hard delete,
+    unlike a 'permanently_deleted' TodoEvent which would be cascaded away.
+    """
+    todo_id = models.BigIntegerField(db_index=True, verbose_name=_("Todo ID"))
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='todo_tombstones', null=True, blank=True)
+    title = models.CharField(max_length=200, verbose_name=_("Title"))
+    todo_created_at = models.DateTimeField(verbose_name=_("Todo Created At"))
+    deleted_at = models.DateTimeField(default=timezone.now, verbose_name=_("Deleted At"))
+    event_count = models.PositiveIntegerField(default=0, verbose_name=_("Event Count"))
+    
+    def __str__(self):
+        return f"{self.title} - permanently deleted at {self.deleted_at}"
+    
+    class Meta:
+        ordering = ['-deleted_at']
+        verbose_name = _("Todo Tombstone")
+        verbose_name_plural = _("Todo Tombstones")
+
+
+class DailyTodoStats(models.Model):
+    """
+    Per-user daily productivity rollup, maintained incrementally from TodoEvents.
+    
+    Rows are bumped by log_todo_save as events are written, and rebuilt by the
+    backfill_todo_stats management command, so dashboards never scan TodoEvent.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_todo_stats')
+    day = models.DateField(verbose_name=_("Day"))
+    
+    created_count = models.PositiveIntegerField(default=0, verbose_name=_("Created"))
+    completed_count = models.PositiveIntegerField(default=0, verbose_name=_("Completed"))
+    uncompleted_count = models.PositiveIntegerField(default=0, verbose_name=_("Uncompleted"))
+    # Sum of (checked at - created at) for every completion, for averages
+    completion_seconds = models.BigIntegerField(default=0, verbose_name=_("Completion Seconds"))
+    
+    objects = DailyTodoStatsManager()
+    
+    @property
+    def avg_completion_hours(self):
+        if not self.completed_count:
+            return None
+        return self.completion_seconds / self.completed_count / 3600
+    
+    def __str__(self):
+        return f"{self.user} - {self.day}"
+    
+    class Meta:
+        ordering = ['-day']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day'], name='unique_daily_todo_stats_user_day'),
+        ]
+        verbose_name = _("Daily Todo Stats")
+        verbose_name_plural = _("Daily Todo Stats")
+
+
+class Attachment(TimeStampedModel):
+    """
+    A file attached to a todo.
+    
+    Files are stored once per content: the blob's name is derived from its
+    SHA-256 (see attachments.py), so uploading the same file twice adds a
+    row but no bytes on disk. The uploader is charged the full size in
+    their StorageUsage either way.
+    """
+    todo = models.ForeignKey(Todo, on_delete=models.CASCADE, related_name='attachments')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='todo_attachments')
+    name = models.CharField(max_length=255, verbose_name=_("Name"))
+    content_type = models.CharField(max_length=100, verbose_name=_("Content Type"))
+    size = models.PositiveBigIntegerField(verbose_name=_("Size"))
+    sha256 = models.CharField(max_length=64, db_index=True, verbose_name=_("SHA-256"))
+    
+    def __str__(self):
+        return self.name
+    
+    @property
+    def blob_name(self):
+        """Storage name of the file, shared by every attachment with this content."""
+        return f'blobs/{self.sha256[:2]}/{self.sha256}'
+    
+    class Meta:
+        ordering = ['created_at']
+        verbose_name = _("Attachment")
+        verbose_name_plural = _("Attachments")
+
+
+class AttachmentUpload(TimeStampedModel):
+    """
+    An attachment upload in progress.
+    
+    Chunks are appended to a part file at ``received``; an interrupted
+    upload is resumed from there. Once all ``size`` bytes are in, the part
+    file becomes an Attachment and this row is deleted.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    todo = models.ForeignKey(Todo, on_delete=models.CASCADE, related_name='attachment_uploads')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='attachment_uploads')
+    name = models.CharField(max_length=255, verbose_name=_("Name"))
+    content_type = models.CharField(max_length=100, verbose_name=_("Content Type"))
+    size = models.PositiveBigIntegerField(verbose_name=_("Size"))
+    received = models.PositiveBigIntegerField(default=0, verbose_name=_("Received"))
+    
+    def __str__(self):
+        return f"{self.name} ({self.received}/{self.size})"
+    
+    @property
+    def part_name(self):
+        return f'uploads/{self.pk}.part'
+    
+    class Meta:
+        constraints = [
+            # One upload per file, so starting the same file again resumes it
+            models.UniqueConstraint(fields=['todo', 'user', 'name', 'size'], name='attachment_upload_unique_file'),
+        ]
+        verbose_name = _("Attachment Upload")
+        verbose_name_plural = _("Attachment Uploads")
+
+
+class AttachmentBlob(models.Model):
+    """
+    One stored file, shared by every Attachment with its SHA-256.
+    
+    The row is the lock that serializes storing and removing a blob:
+    finalize() and the cleanup in release_attachments() both lock it with
+    SELECT FOR UPDATE before touching the file, so a blob cannot be
+    removed while an upload of the same content is being attached.
+    """
+    sha256 = models.CharField(max_length=64, primary_key=True, verbose_name=_("SHA-256"))
+    size = models.PositiveBigIntegerField(verbose_name=_("Size"))
+    
+    def __str__(self):
+        return self.sha256
+    
+    class Meta:
+        verbose_name = _("Attachment Blob")
+        verbose_name_plural = _("Attachment Blobs")
+
+
+class StorageUsage(models.Model):
+    """
+    Bytes of attachments each user has uploaded, plus the full size of
+    their unfinished uploads, kept as a counter so the quota check never
+    sums the attachment or upload tables.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='storage_usage')
+    bytes_used = models.PositiveBigIntegerField(default=0, verbose_name=_("Bytes Used"))
+    
+    objects = StorageUsageManager()
+    
+    def __str__(self):
+        return f"{self.user} - {self.bytes_used} bytes"
+    
+    class Meta:
+        verbose_name = _("Storage Usage")
+        verbose_name_plural = _("Storage Usage")
+
+
+class ApiToken(TimeStampedModel):
+    """
+    A bearer token for JSON API clients that have no browser session.
+    
+    Only the SHA-256 of the key is stored; the key itself is shown once,
+    by the create_api_token command.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='api_tokens')
+    name = models.CharField(max_length=100, verbose_name=_("Name"))
+    key_hash = models.CharField(max_length=64, unique=True, verbose_name=_("Key Hash"))
+    last_used_at = models.DateTimeField(null=True, blank=True, verbose_name=_("Last Used At"))
+    
+    objects = ApiTokenManager()
+    
+    def __str__(self):
+        return f"{self.user} - {self.name}"
+    
+    class Meta:
+        verbose_name = _("API Token")
+        verbose_name_plural = _("API Tokens")
+
+
+def todo_stats_deltas(event_type, timestamp, todo_created_at, first_completion=True):
+    """
+    Map one TodoEvent to the DailyTodoStats counters it contributes to.
+    
+    Shared by the live signal path and the backfill so both count the same way.
+    Only a todo's first completion counts towards completed_count and
+    completion_seconds; checking it again after an uncheck would otherwise
+    add its whole age to the average a second time.
+    """
+    if event_type == TodoEvent.TODO_CREATED:
+        return {'created_count': 1}
+    if event_type == TodoEvent.TODO_CHECKED:
+        if not first_completion:
+            return {}
+        seconds = max(int((timestamp - todo_created_at).total_seconds()), 0)
+        return {'completed_count': 1, 'completion_seconds': seconds}
+    if event_type == TodoEvent.TODO_UNCHECKED:
+        return {'uncompleted_count': 1}
+    return {}
@@ -0,0 +1,75 @@
+# todo_app/pagination.py
+"""
+Keyset (cursor) pagination helpers.
+
+Unlike Paginator, keyset paging never runs COUNT(*) or OFFSET: each page is
+"rows strictly after the last row of the previous page" in a fixed
+(sort key, id) order, which stays a single index range scan however deep
+the user scrolls.
+"""
+
+import base64
+import binascii
+from datetime import datetime
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+def encode_cursor(value, pk):
+    """
+    Encode the (sort value, pk) of the last row on a page as an opaque
+    token. The sort value is a datetime or a number (e.g. Todo.rank).
+    """
+    value = value.isoformat() if isinstance(value, datetime) else repr(float(value))
+    raw = f"{value}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Decode a cursor token into (sort value, pk), or None if it is invalid."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        value, pk = raw.rsplit('|', 1)
+        value = parse_datetime(value) or float(value)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    return value, pk
+
+
+def keyset_page(queryset, field, cursor, limit, descending=True):
+    """
+    Return (rows, next_cursor) for one page ordered by -field, -pk (or by
+    field, pk when ``descending`` is False).
+    
+    ``cursor`` is a token from a previous call (or None for the first page).
+    One extra row is fetched to tell whether another page exists, so a page
+    costs exactly one query. ``queryset`` may also be a values() queryset,
+    as long as it selects ``field`` and 'id'.
+    """
+    if descending:
+        queryset = queryset.order_by(f'-{field}', '-pk')
+        after = 'lt'
+    else:
+        queryset = queryset.order_by(field, 'pk')
+        after = 'gt'
+    position = decode_cursor(cursor)
+    if position is not None:
+        value, pk = position
+        queryset = queryset.filter(
+            Q(**{f'{field}__{after}': value}) | Q(**{field: value, f'pk__{after}': pk})
+        )
+    
+    rows = list(queryset[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        if isinstance(last, dict):
+            next_cursor = encode_cursor(last[field], last['id'])
+        else:
+            next_cursor = encode_cursor(getattr(last, field), last.pk)
+    return rows, next_cursor
@@ -0,0 +1,77 @@
+# todo_app/ratelimit.py
+"""
+Token-bucket rate limiting on top of the shared Django cache.
+"""
+
+import math
+import time
+
+from django.core.cache import cache
+
+
+class TokenBucket:
+    """
+    A token bucket of ``capacity`` tokens refilled at ``rate`` tokens/second.
+    
+    Stored as two cache keys per identity: when the bucket was last empty
+    (``start``), and how many tokens were taken since, in a counter named
+    after that start. Taking tokens is one atomic incr(), so concurrent
+    web workers sharing the cache never double-spend; the tokens left are
+    ``capacity - (used - elapsed * rate)``. Both keys are only ever created
+    with add(), so concurrent first requests cannot reset each other's
+    counts, and every consume refreshes their expiry, so they only expire
+    once the bucket has been idle long enough to be full anyway. Only the
+    cache operations supported by every backend are used, so the locmem
+    cache works in tests.
+    """
+    
+    def __init__(self, name, capacity, rate, cache=cache):
+        self.name = name
+        self.capacity = capacity
+        self.rate = rate
+        self.cache = cache
+        # Idle buckets refill completely long before the keys expire
+        self.timeout = max(int(math.ceil(capacity / rate)) * 2, 60)
+    
+    def _start_key(self, identity):
+        return f'todo_app:ratelimit:{self.name}:{identity}:start'
+    
+    def _used_key(self, identity, start):
+        return f'todo_app:ratelimit:{self.name}:{identity}:used:{start!r}'
+    
+    def _take(self, used_key, tokens):
+        try:
+            return self.cache.incr(used_key, tokens)
+        except ValueError:
+            # First take since this start (or the counter was evicted)
+            self.cache.add(used_key, 0, self.timeout)
+            return self.cache.incr(used_key, tokens)
+    
+    def consume(self, identity, tokens=1):
+        """
+        Take ``tokens`` tokens. Returns (allowed, retry_after_seconds).
+        """
+        start_key = self._start_key(identity)
+        now = time.time()
+        
+        self.cache.add(start_key, now, self.timeout)
+        start = self.cache.get(start_key, now)
+        used_key = self._used_key(identity, start)
+        used = self._take(used_key, tokens)
+        self.cache.touch(start_key, self.timeout)
+        self.cache.touch(used_key, self.timeout)
+        
+        level = used - (now - start) * self.rate
+        if level <= tokens:
+            # The bucket drained completely since the last request: rebase
+            # so idle time never accumulates more than capacity tokens.
+            # The new counter exists before the new start points at it.
+            if self.cache.add(self._used_key(identity, now), tokens, self.timeout):
+                self.cache.set(start_key, now, self.timeout)
+            return True, 0
+        
+        if level > self.capacity:
+            # Give the tokens back; we did not use them
+            self.cache.decr(used_key, tokens)
+            return False, int(math.ceil((level - self.capacity) / self.rate))
+        return True, 0
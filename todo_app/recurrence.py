@@ -0,0 +1,129 @@
+# todo_app/recurrence.py
+"""
+Lazy materialization of recurring todos.
+
+A RecurrenceRule only turns into Todo rows for the occurrences that fall
+inside a rolling horizon (TODO_RECURRENCE_HORIZON_DAYS ahead of now). The
+scheduler task (tasks.materialize_recurring_todos) claims due rules in
+batches and calls materialize(), which writes each batch with one
+bulk_create for the todos, one for their events and one bulk_update for
+the rules' next_occurrence_at.
+"""
+
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Min
+from django.utils import timezone
+
+from .models import DailyTodoStats, RecurrenceRule, Todo, TodoEvent
+from .triggers import event_triggers_enabled
+
+
+def recurrence_horizon():
+    """Materialize occurrences up to this point in time."""
+    days = getattr(settings, 'TODO_RECURRENCE_HORIZON_DAYS', 7)
+    return timezone.now() + timezone.timedelta(days=days)
+
+
+def _assign_ranks(todos):
+    """
+    Put new occurrences on top of their list, earliest first, reading each
+    list's current top rank with at most two GROUP BY queries.
+    """
+    user_ids = {todo.user_id for todo in todos if todo.todo_list_id is None}
+    list_ids = {todo.todo_list_id for todo in todos if todo.todo_list_id is not None}
+    active = Todo.objects.active().top_level()
+    tops = {}
+    if user_ids:
+        tops.update(
+            (('user', user_id), top) for user_id, top in
+            active.filter(todo_list__isnull=True, user_id__in=user_ids)
+            .values('user_id').annotate(top=Min('rank')).values_list('user_id', 'top')
+        )
+    if list_ids:
+        tops.update(
+            (('list', list_id), top) for list_id, top in
+            active.filter(todo_list_id__in=list_ids)
+            .values('todo_list_id').annotate(top=Min('rank')).values_list('todo_list_id', 'top')
+        )
+
+    # Latest first, so the earliest occurrence ends up with the lowest rank
+    for todo in sorted(todos, key=lambda todo: todo.occurrence_at, reverse=True):
+        scope = ('user', todo.user_id) if todo.todo_list_id is None else ('list', todo.todo_list_id)
+        top = tops.get(scope)
+        todo.rank = tops[scope] = 0.0 if top is None else top - Todo.RANK_STEP
+
+
+def _log_created(todos):
+    """
+    Bulk version of log_todo_event(TODO_CREATED) for materialized todos:
+    one INSERT for all events and one rollup increment per owner.
+
+    bulk_create sends no post_save, so nothing else logs them. In trigger
+    mode the database already did.
+    """
+    if not todos or event_triggers_enabled():
+        return
+    now = timezone.now()
+    TodoEvent.objects.bulk_create([
+        TodoEvent(
+            user_id=todo.user_id, todo_id=todo.pk, event_type=TodoEvent.TODO_CREATED,
+            timestamp=now, details={'title': todo.title, 'recurrence': todo.recurrence_id},
+        )
+        for todo in todos
+    ], batch_size=1000)
+    for user_id, count in Counter(todo.user_id for todo in todos).items():
+        DailyTodoStats.objects.increment(user_id, timezone.localdate(now), created_count=count)
+
+
+def materialize(rules, until):
+    """
+    Create todos for every occurrence of ``rules`` up to ``until`` and move
+    each rule's next_occurrence_at past it.
+
+    Occurrences already in the past are skipped rather than created late
+    (the scheduler was down, or the rule started in the past). The caller
+    must hold the rules locked, or have just created them, inside a
+    transaction; the unique (recurrence, occurrence_at) constraint rejects
+    the batch if another run got there first. Returns the created todos.
+    """
+    now = timezone.now()
+    todos = []
+    for rule in rules:
+        occurrence = rule.next_occurrence_at
+        while occurrence is not None and occurrence <= until:
+            if rule.ends_at is not None and occurrence > rule.ends_at:
+                occurrence = None
+                break
+            if occurrence >= now:
+                todos.append(Todo(
+                    user_id=rule.user_id,
+                    todo_list_id=rule.todo_list_id,
+                    title=rule.title,
+                    description=rule.description,
+                    status=Todo.STATUS_PENDING,
+                    due_at=occurrence,
+                    recurrence=rule,
+                    occurrence_at=occurrence,
+                ))
+            occurrence = rule.next_after(occurrence)
+        if occurrence is not None and rule.ends_at is not None and occurrence > rule.ends_at:
+            occurrence = None
+        rule.next_occurrence_at = occurrence
+
+    _assign_ranks(todos)
+    Todo.objects.bulk_create(todos, batch_size=1000)
+    if todos and not connection.features.can_return_rows_from_bulk_insert:
+        # No RETURNING: look the new ids up by their unique key
+        ids = dict(
+            ((recurrence_id, occurrence_at), pk) for pk, recurrence_id, occurrence_at in
+            Todo.objects.filter(recurrence__in=rules, occurrence_at__gte=now)
+            .values_list('pk', 'recurrence_id', 'occurrence_at')
+        )
+        for todo in todos:
+            todo.pk = ids[(todo.recurrence_id, todo.occurrence_at)]
+    RecurrenceRule.objects.bulk_update(rules, ['next_occurrence_at'], batch_size=1000)
+    _log_created(todos)
+    return todos
@@ -1,13 +1,21 @@
 # todo_app/signals.py
-from django.db.models.signals import post_save, post_delete, pre_save
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_save
 from django.dispatch import receiver
-from .models import Todo, TodoEvent
+from django.utils import timezone
+from .access import invalidate_list_roles
+from .models import DailyTodoStats, ListMembership, Tag, Todo, TodoClosure, TodoEvent, TodoTag, todo_stats_deltas
+from .triggers import event_triggers_enabled
 
 @receiver(pre_save, sender=Todo)
 def track_state_changes(sender, instance, **kwargs):
     """
     Before saving, capture the old state of the object so we can compare later.
     """
+    if event_triggers_enabled():
+        # The database triggers log events; skip the extra SELECT
+        return
     if instance.pk:
         try:
             old_instance = Todo.objects.get(pk=instance.pk)
@@ -27,6 +35,9 @@ def log_todo_save(sender, instance, created, **kwargs):
     """
     After saving, check what changed and create the appropriate event.
     """
+    if event_triggers_enabled():
+        # The trigger logged an event (if anything changed)
+        return
     # 1. Try to get the user who triggered this (see Step C)
     # If no user was attached (e.g., admin panel or shell), fall back to the Todo owner or None
     user = getattr(instance, '_current_user', instance.user)
@@ -64,12 +75,103 @@ def log_todo_save(sender, instance, created, **kwargs):
 
     # Only create event if we identified a type
     if event_type:
-        TodoEvent.objects.create(
-            user=user,
-            todo=instance,
-            event_type=event_type,
-            details=details
+        log_todo_event(instance, event_type, details, user=user)
+
+
+def log_todo_event(todo, event_type, details, user=None):
+    """
+    Write a TodoEvent and bump the owner's productivity rollup.
+    
+    Used by log_todo_save and by views that change todos with a direct
+    UPDATE (which does not send post_save). A no-op when the database
+    triggers are logging events, since they already saw the change.
+    """
+    if event_triggers_enabled():
+        return None
+    
+    event = TodoEvent.objects.create(
+        user=user if user is not None else todo.user,
+        todo=todo,
+        event_type=event_type,
+        details=details
+    )
+    
+    # Keep the productivity rollups current (owner's dashboard)
+    first_completion = event_type != TodoEvent.TODO_CHECKED or not TodoEvent.objects.filter(
+        todo=todo, event_type=TodoEvent.TODO_CHECKED, pk__lt=event.pk
+    ).exists()
+    deltas = todo_stats_deltas(event_type, event.timestamp, todo.created_at, first_completion)
+    if deltas and todo.user_id:
+        DailyTodoStats.objects.increment(
+            todo.user_id, timezone.localdate(event.timestamp), **deltas
         )
+    return event
+
+@receiver(post_save, sender=Todo)
+def link_subtask(sender, instance, created, **kwargs):
+    """
+    Record a new subtask's ancestry in the closure table.
+    
+    Runs in both event logging modes; the closure is not an event.
+    """
+    if created and instance.parent_id:
+        TodoClosure.objects.link(instance)
+
+
+@receiver(post_save, sender=ListMembership)
+@receiver(post_delete, sender=ListMembership)
+def invalidate_membership_cache(sender, instance, **kwargs):
+    """
+    Drop the list's cached roles once the membership change is committed,
+    so no request can cache the old role in between.
+    
+    Bulk queryset updates and deletes send no signals; call
+    access.invalidate_list_roles() after those.
+    """
+    todo_list_id = instance.todo_list_id
+    # robust: a cache outage must not fail a membership change that has
+    # already committed; the roles then expire after ROLE_TIMEOUT
+    transaction.on_commit(lambda: invalidate_list_roles(todo_list_id), robust=True)
+
+
+@receiver(m2m_changed, sender=TodoTag)
+def update_tag_counts(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Keep Tag.todo_count in step with Todo.tags adds and removes.
+    
+    Each change is one UPDATE ... SET todo_count = todo_count +/- n, so
+    the tag list never has to count TodoTag rows.
+    """
+    if action in ('pre_clear', 'pre_remove'):
+        # pk_set is not given for clear(), and for remove() it holds what was
+        # asked for, not what is attached; count the rows about to go
+        links = TodoTag.objects.filter(tag=instance) if reverse else TodoTag.objects.filter(todo=instance)
+        if action == 'pre_remove':
+            links = links.filter(**{'todo_id__in' if reverse else 'tag_id__in': pk_set})
+        if reverse:
+            instance._removed_tag_ids = [instance.pk]
+            instance._removed_count = links.count()
+        else:
+            instance._removed_tag_ids = list(links.values_list('tag_id', flat=True))
+            instance._removed_count = 1
+        return
+    
+    if action in ('post_clear', 'post_remove'):
+        tag_ids, delta = getattr(instance, '_removed_tag_ids', []), -getattr(instance, '_removed_count', 0)
+    elif action == 'post_add' and pk_set:
+        # add() leaves out what is already attached before sending this
+        if reverse:
+            # tag.todos.add(...): one tag, len(pk_set) todos
+            tag_ids, delta = [instance.pk], len(pk_set)
+        else:
+            # todo.tags.add(...): each tag gains one todo
+            tag_ids, delta = pk_set, 1
+    else:
+        return
+    
+    if tag_ids and delta:
+        Tag.objects.filter(pk__in=tag_ids).update(todo_count=F('todo_count') + delta)
+
 
 # @receiver(post_delete, sender=Todo)
 # def log_todo_hard_delete(sender, instance, **kwargs):
@@ -1,11 +1,101 @@
+# Only imported on first use (views import it lazily), so the Celery
+# machinery stays out of the web worker boot path
 from celery import shared_task
-from django.core.mail import send_mail
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection, send_mail
+from django.db import IntegrityError, transaction
+from django.db.models import Max
+from django.utils import timezone
 from django.contrib.auth import get_user_model
-from .models import Todo
+from .attachments import discard_uploads
+from .history import take_snapshots
+from .models import AttachmentUpload, RecurrenceRule, Todo, TodoEvent
+from .recurrence import materialize, recurrence_horizon
+import logging
 import time
+import uuid
+
+# Configure the project Celery app before shared_task binds to current_app
+from my_todo.celery import app as celery_app  # noqa: F401
 
 User = get_user_model()
 
+logger = logging.getLogger(__name__)
+
+# Celery state -> what we show to the user in the mail status fragment
+MAIL_STATUS_QUEUED = 'queued'
+MAIL_STATUS_RUNNING = 'running'
+MAIL_STATUS_SENT = 'sent'
+MAIL_STATUS_FAILED = 'failed'
+
+MAIL_STATUS_BY_STATE = {
+    'PENDING': MAIL_STATUS_QUEUED,
+    'RECEIVED': MAIL_STATUS_QUEUED,
+    'RETRY': MAIL_STATUS_QUEUED,
+    'STARTED': MAIL_STATUS_RUNNING,
+    'SUCCESS': MAIL_STATUS_SENT,
+    'FAILURE': MAIL_STATUS_FAILED,
+    'REVOKED': MAIL_STATUS_FAILED,
+}
+
+
+def _mail_task_key(user_id):
+    return f'todo_app:mail_todos:{user_id}'
+
+
+def mail_task_status(task_id):
+    """Map the Celery state of a digest task to queued/running/sent/failed."""
+    return MAIL_STATUS_BY_STATE.get(send_todos_email.AsyncResult(task_id).state, MAIL_STATUS_QUEUED)
+
+
+def get_todos_email_task(user_id):
+    """Return (task_id, status) of the user's current digest, or (None, None)."""
+    task_id = cache.get(_mail_task_key(user_id))
+    if task_id is None:
+        return None, None
+    return task_id, mail_task_status(task_id)
+
+
+def enqueue_todos_email(user_id):
+    """
+    Submit send_todos_email for a user at most once per coalescing window.
+
+    The task id is reserved in the shared cache with add(), which is atomic,
+    so concurrent clicks race for one slot and the losers attach to the
+    winner's task instead of enqueueing another one. Only a queued or
+    running digest is attached to: once it was sent or failed, the next
+    click replaces it. Replacing is claimed with another add(), keyed by
+    the digest being replaced, so concurrent retries still enqueue once.
+
+    Returns (task_id, status, created).
+    """
+    key = _mail_task_key(user_id)
+    window = getattr(settings, 'TODO_MAIL_COALESCE_SECONDS', 300)
+
+    task_id = str(uuid.uuid4())
+    for _ in range(3):
+        if cache.add(key, task_id, timeout=window):
+            break
+        existing_id, status = get_todos_email_task(user_id)
+        if existing_id is None:
+            # Expired between add and get: race for the slot again
+            continue
+        if status in (MAIL_STATUS_QUEUED, MAIL_STATUS_RUNNING):
+            return existing_id, status, False
+        # Sent or failed: one click gets to replace it, the others attach
+        # to the replacement
+        if not cache.add(f'{key}:replaces:{existing_id}', task_id, timeout=window):
+            return cache.get(f'{key}:replaces:{existing_id}', existing_id), MAIL_STATUS_QUEUED, False
+        cache.set(key, task_id, timeout=window)
+        break
+    else:
+        return get_todos_email_task(user_id) + (False,)
+
+    send_todos_email.apply_async(args=[user_id], task_id=task_id)
+    return task_id, MAIL_STATUS_QUEUED, True
+
+
 @shared_task
 def send_todos_email(user_id):
     time.sleep(20) # Simulate a delay for demonstration purposes
@@ -23,3 +113,245 @@ def send_todos_email(user_id):
         from_email="noreply@todoapp.com",
         recipient_list=[user.email],
     )
+
+
+def claim_due_reminders(batch_size, lead):
+    """
+    Claim up to ``batch_size`` todos due within ``lead`` and mark them sent.
+    
+    The rows are locked with SKIP LOCKED, so overlapping beat runs or
+    several workers each get a disjoint batch instead of waiting on each
+    other, and one UPDATE marks the whole batch. Returns the claimed
+    (id, user_id, title, due_at) rows.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        rows = list(
+            Todo.objects.due_for_reminder(now + lead)
+            .order_by('due_at')
+            .select_for_update(skip_locked=True)
+            .values_list('id', 'user_id', 'title', 'due_at')[:batch_size]
+        )
+        if rows:
+            Todo.objects.filter(id__in=[row[0] for row in rows]).update(reminder_sent_at=now)
+    return rows
+
+
+@shared_task
+def send_due_reminders(batch_size=500, max_batches=20):
+    """
+    Celery beat task: email every user one reminder listing their todos
+    that are due soon.
+    
+    Todos are claimed in batches, but the messages are only built once all
+    batches are in, so a user whose todos span several batches still gets
+    a single email per run. Reminders are marked sent when claimed, so a
+    failed send is not retried (at most once delivery rather than
+    duplicate emails).
+    """
+    lead = timezone.timedelta(minutes=getattr(settings, 'TODO_REMINDER_LEAD_MINUTES', 60))
+    
+    by_user = {}
+    for _ in range(max_batches):
+        rows = claim_due_reminders(batch_size, lead)
+        for _, user_id, title, due_at in rows:
+            by_user.setdefault(user_id, []).append((title, due_at))
+        if len(rows) < batch_size:
+            break
+    if not by_user:
+        return 0
+    
+    emails = dict(
+        User.objects.filter(id__in=by_user).exclude(email='').values_list('id', 'email')
+    )
+    # One SMTP connection for all the messages of this run
+    with get_connection() as connection:
+        messages = []
+        for user_id, todos in by_user.items():
+            if user_id not in emails:
+                continue
+            body = "\n".join(
+                f"- {title} (due {timezone.localtime(due_at):%b %d, %Y %H:%M})"
+                for title, due_at in sorted(todos, key=lambda todo: todo[1])
+            )
+            messages.append(EmailMessage(
+                subject="Todos due soon ⏰",
+                body=body,
+                from_email="noreply@todoapp.com",
+                to=[emails[user_id]],
+                connection=connection,
+            ))
+        return connection.send_messages(messages) or 0
+
+
+def _rebalance_key(user_id, todo_list_id=None):
+    if todo_list_id is not None:
+        return f'todo_app:rebalance_ranks:list:{todo_list_id}'
+    return f'todo_app:rebalance_ranks:{user_id}'
+
+
+def enqueue_rank_rebalance(user_id, todo_list_id=None):
+    """
+    Schedule rebalance_todo_ranks for a user's personal todos (or a shared
+    list) once per minute at most.
+    
+    Moves that run out of room keep working (there is plenty of float
+    precision left below RANK_MIN_GAP), so a burst of them only needs one
+    rebalance, reserved with cache.add like the mail digest.
+    """
+    if cache.add(_rebalance_key(user_id, todo_list_id), True, timeout=60):
+        rebalance_todo_ranks.delay(user_id, todo_list_id=todo_list_id)
+
+
+@shared_task
+def rebalance_todo_ranks(user_id, batch_size=500, todo_list_id=None):
+    """
+    Respace the ranks of a user's personal todos, or of a shared list's
+    todos, to RANK_STEP apart, keeping the current order.
+    
+    Ranks are rewritten in batches, each its own short transaction with one
+    bulk UPDATE, so a long list never holds locks for the whole pass. The
+    new ranks all lie below the current top rank and are handed out from
+    the top of the list down, so the order is the same after every batch
+    and a move made mid-pass lands between consistent neighbours.
+    
+    Each batch is locked and checked against the ranks read at the start;
+    if a move got in between, the pass stops rather than overwrite it, and
+    is tried again a minute later. Returns the number of todos respaced.
+    """
+    if todo_list_id is None:
+        todos = Todo.objects.filter(user_id=user_id, todo_list__isnull=True)
+    else:
+        todos = Todo.objects.filter(todo_list_id=todo_list_id)
+    rows = list(
+        todos.active().top_level().order_by('rank', '-created_at').values_list('id', 'rank')
+    )
+    if not rows:
+        cache.delete(_rebalance_key(user_id, todo_list_id))
+        return 0
+    base = rows[0][1] - len(rows) * Todo.RANK_STEP
+    for start in range(0, len(rows), batch_size):
+        chunk = rows[start:start + batch_size]
+        with transaction.atomic():
+            current = dict(
+                Todo.objects.select_for_update().filter(pk__in=[pk for pk, _rank in chunk]).values_list('id', 'rank')
+            )
+            if any(current.get(pk) != rank for pk, rank in chunk):
+                # Keep the coalescing key so moves don't enqueue another run
+                cache.set(_rebalance_key(user_id, todo_list_id), True, timeout=60)
+                rebalance_todo_ranks.apply_async(
+                    (user_id,), {'batch_size': batch_size, 'todo_list_id': todo_list_id}, countdown=60,
+                )
+                return start
+            Todo.objects.bulk_update([
+                Todo(id=pk, rank=base + position * Todo.RANK_STEP)
+                for position, (pk, _rank) in enumerate(chunk, start)
+            ], ['rank'])
+    cache.delete(_rebalance_key(user_id, todo_list_id))
+    return len(rows)
+
+
+SNAPSHOTS_CURSOR_KEY = 'todo_app:take_due_snapshots:last_event_id'
+
+
+@shared_task
+def take_due_snapshots():
+    """
+    Celery beat task: write the history snapshots due for every todo that
+    got an event since the last run (see history.take_snapshots), so "as
+    of" reads never write and the write path does nothing extra.
+    
+    Where the last run stopped is kept in the cache. If it is lost, the
+    run starts from the newest event; todos still short of a snapshot get
+    it with their next event, and until then as-of reads replay more.
+    """
+    last_id = cache.get(SNAPSHOTS_CURSOR_KEY)
+    high = TodoEvent.objects.aggregate(high=Max('pk'))['high'] or 0
+    written = 0
+    if last_id is not None:
+        todo_ids = TodoEvent.objects.filter(pk__gt=last_id, pk__lte=high).values_list('todo_id', flat=True).distinct()
+        for todo in Todo.objects.filter(pk__in=todo_ids).iterator():
+            written += take_snapshots(todo)
+    cache.set(SNAPSHOTS_CURSOR_KEY, high, timeout=None)
+    return written
+
+
+def claim_due_recurrences(batch_size, until):
+    """
+    Claim up to ``batch_size`` rules with occurrences before ``until`` and
+    materialize them. Returns (rules claimed, todos created).
+    
+    Like claim_due_reminders, rows are locked with SKIP LOCKED, so
+    overlapping beat runs take disjoint batches, and each batch commits
+    together with the rules' advanced next_occurrence_at. Where SKIP
+    LOCKED is not available, another run may have materialized some of the
+    rules already; the unique (recurrence, occurrence_at) constraint then
+    rejects the batch, and it is redone rule by rule, each in its own
+    savepoint, so only the conflicting rules are skipped.
+    """
+    with transaction.atomic():
+        rules = list(
+            RecurrenceRule.objects.due(until)
+            .order_by('next_occurrence_at')
+            .select_for_update(skip_locked=True)[:batch_size]
+        )
+        if not rules:
+            return 0, 0
+        starts = [rule.next_occurrence_at for rule in rules]
+        try:
+            with transaction.atomic():
+                return len(rules), len(materialize(rules, until))
+        except IntegrityError:
+            logger.warning("Recurrence batch of %d rules conflicted with another run; retrying rule by rule", len(rules))
+        
+        created = 0
+        for rule, start in zip(rules, starts):
+            # materialize() advanced it before the batch was rolled back
+            rule.next_occurrence_at = start
+            try:
+                with transaction.atomic():
+                    created += len(materialize([rule], until))
+            except IntegrityError:
+                logger.warning("Recurrence rule %s was already materialized by another run; skipped", rule.pk)
+        return len(rules), created
+
+
+@shared_task
+def materialize_recurring_todos(batch_size=1000, max_batches=50):
+    """
+    Celery beat task: create the todos of recurring rules whose next
+    occurrence is inside the horizon.
+    
+    Each rule is touched about once per occurrence, and only through the
+    partial recurrence_due_idx, so a run costs the same with millions of
+    idle rules. Safe to overlap: SKIP LOCKED keeps runs apart where the
+    database supports it, and claim_due_recurrences skips the rules
+    another run got to first everywhere else.
+    """
+    until = recurrence_horizon()
+    created = 0
+    for _ in range(max_batches):
+        claimed, todos = claim_due_recurrences(batch_size, until)
+        created += todos
+        if claimed < batch_size:
+            break
+    return created
+
+
+@shared_task
+def purge_stale_uploads(batch_size=500):
+    """
+    Celery beat task: drop attachment uploads nobody has added a chunk to
+    for TODO_ATTACHMENT_UPLOAD_TTL_HOURS, with their part files.
+    """
+    cutoff = timezone.now() - timezone.timedelta(hours=getattr(settings, 'TODO_ATTACHMENT_UPLOAD_TTL_HOURS', 24))
+    purged = 0
+    while True:
+        with transaction.atomic():
+            ids = list(
+                AttachmentUpload.objects.filter(updated_at__lt=cutoff).values_list('pk', flat=True)[:batch_size]
+            )
+            discard_uploads(AttachmentUpload.objects.filter(pk__in=ids))
+        purged += len(ids)
+        if len(ids) < batch_size:
+            return purged
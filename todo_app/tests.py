@@ -1,3 +1,908 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .access import cached_list_role
+from .admin import estimated_count
+from .attachments import attachment_storage, finalize, release_attachments, write_chunk
+from .history import state_as_of
+from .pagination import encode_cursor, keyset_page
+from .models import (
+    ApiToken, Attachment, AttachmentBlob, AttachmentUpload, DailyTodoStats, ListMembership, RecurrenceRule, StorageUsage,
+    Tag, Todo, TodoEvent, TodoList, TodoSnapshot,
+)
+from .ratelimit import TokenBucket
+from .signals import log_todo_event
+from .triggers import install_event_triggers, remove_event_triggers
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class MailCoalescingTests(TestCase):
+    def setUp(self):
+        from . import tasks
+        self.tasks = tasks
+        cache.clear()
+        self.statuses = {}
+        self.sent = []
+        patches = [
+            mock.patch.object(tasks, 'mail_task_status', lambda task_id: self.statuses.get(task_id, tasks.MAIL_STATUS_QUEUED)),
+            mock.patch.object(tasks.send_todos_email, 'apply_async',
+                              lambda args, task_id: self.sent.append(task_id)),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_clicks_attach_to_queued_digest(self):
+        first = self.tasks.enqueue_todos_email(1)
+        second = self.tasks.enqueue_todos_email(1)
+        self.assertTrue(first[2])
+        self.assertEqual(second, (first[0], self.tasks.MAIL_STATUS_QUEUED, False))
+        self.assertEqual(self.sent, [first[0]])
+
+    def test_sent_digest_is_replaced(self):
+        first_id = self.tasks.enqueue_todos_email(1)[0]
+        self.statuses[first_id] = self.tasks.MAIL_STATUS_SENT
+        second_id, status, created = self.tasks.enqueue_todos_email(1)
+        self.assertTrue(created)
+        self.assertNotEqual(second_id, first_id)
+        self.assertEqual(self.tasks.get_todos_email_task(1)[0], second_id)
+
+    def test_concurrent_retries_after_failure_enqueue_once(self):
+        first_id = self.tasks.enqueue_todos_email(1)[0]
+        self.statuses[first_id] = self.tasks.MAIL_STATUS_FAILED
+        # Both retries read the failed digest before either replaced it
+        with mock.patch.object(self.tasks, 'get_todos_email_task',
+                               return_value=(first_id, self.tasks.MAIL_STATUS_FAILED)):
+            winner = self.tasks.enqueue_todos_email(1)
+            loser = self.tasks.enqueue_todos_email(1)
+        self.assertTrue(winner[2])
+        self.assertFalse(loser[2])
+        self.assertEqual(loser[0], winner[0])
+        self.assertEqual(self.sent, [first_id, winner[0]])
+
+
+@override_settings(CACHES=LOCMEM_CACHE, TODO_RATE_LIMITS={}, TODO_RATE_LIMIT_GLOBAL=None)
+class DailyStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='stats')
+        self.client.force_login(self.user)
+        self.todo = Todo.objects.create(user=self.user, title='Write report')
+
+    def toggle(self):
+        self.todo.refresh_from_db()
+        response = self.client.post(reverse('todo_app:toggle', args=[self.todo.pk]), {'version': self.todo.version})
+        self.assertEqual(response.status_code, 200)
+
+    def test_only_first_completion_counts(self):
+        self.toggle()
+        self.toggle()
+        self.toggle()
+        stats = DailyTodoStats.objects.get(user=self.user)
+        self.assertEqual(
+            (stats.created_count, stats.completed_count, stats.uncompleted_count), (1, 1, 1)
+        )
+
+    def test_backfill_counts_like_live_path(self):
+        self.toggle()
+        self.toggle()
+        self.toggle()
+        live = DailyTodoStats.objects.values('created_count', 'completed_count', 'uncompleted_count').get()
+        call_command('backfill_todo_stats', batch_size=1, stdout=StringIO())
+        rebuilt = DailyTodoStats.objects.values('created_count', 'completed_count', 'uncompleted_count').get()
+        self.assertEqual(rebuilt, live)
+
+
+@override_settings(CACHES=LOCMEM_CACHE, TODO_RATE_LIMITS={}, TODO_RATE_LIMIT_GLOBAL=None)
+class TodoStatusTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='status')
+        self.client.force_login(self.user)
+        self.todo = Todo.objects.create(user=self.user, title='Plan trip')
+
+    def set_status(self, status):
+        return self.client.post(reverse('todo_app:set_status', args=[self.todo.pk]), {'status': status})
+
+    def test_start_pause_and_complete(self):
+        self.assertEqual(self.set_status(Todo.STATUS_IN_PROGRESS).status_code, 200)
+        self.assertEqual(Todo.objects.active().with_status(Todo.STATUS_IN_PROGRESS).get(), self.todo)
+        self.assertEqual(Todo.objects.filter(user=self.user).status_counts()[Todo.STATUS_IN_PROGRESS], 1)
+
+        self.todo.refresh_from_db()
+        self.client.post(reverse('todo_app:toggle', args=[self.todo.pk]), {'version': self.todo.version})
+        self.todo.refresh_from_db()
+        self.assertEqual(self.todo.status, Todo.STATUS_COMPLETED)
+        self.assertEqual(self.set_status(Todo.STATUS_IN_PROGRESS).status_code, 400)
+
+    def test_stale_version_conflicts(self):
+        response = self.client.post(
+            reverse('todo_app:set_status', args=[self.todo.pk]),
+            {'status': Todo.STATUS_IN_PROGRESS, 'version': self.todo.version - 1},
+        )
+        self.assertEqual(response.status_code, 409)
+        self.todo.refresh_from_db()
+        self.assertEqual(self.todo.status, Todo.STATUS_PENDING)
+
+
+@override_settings(CACHES=LOCMEM_CACHE, TODO_RATE_LIMITS={}, TODO_RATE_LIMIT_GLOBAL=None)
+class ApiBatchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='api')
+        self.todo = Todo.objects.create(user=self.user, title='Ship it')
+        self.token, self.key = ApiToken.objects.create_token(self.user, 'cli')
+        self.client = Client(enforce_csrf_checks=True)
+
+    def batch(self, operations, **headers):
+        return self.client.post(
+            reverse('todo_app:api_todo_batch'), json.dumps({'operations': operations}),
+            content_type='application/json', headers=headers,
+        )
+
+    def test_token_auth_skips_csrf(self):
+        response = self.batch(
+            [{'op': 'toggle', 'id': self.todo.pk}], Authorization=f'Bearer {self.key}',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['status'], 200)
+        self.token.refresh_from_db()
+        self.assertIsNotNone(self.token.last_used_at)
+
+    def test_session_needs_csrf_and_bad_token_is_rejected(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.batch([{'op': 'toggle', 'id': self.todo.pk}]).status_code, 403)
+        self.assertEqual(
+            self.batch([{'op': 'toggle', 'id': self.todo.pk}], Authorization='Bearer nope').status_code, 401,
+        )
+
+    def test_delete_checks_version(self):
+        auth = {'Authorization': f'Bearer {self.key}'}
+        stale = self.batch([{'op': 'delete', 'id': self.todo.pk, 'version': self.todo.version - 1}], **auth)
+        self.assertEqual(stale.json()['results'][0]['status'], 409)
+        self.assertFalse(Todo.objects.get(pk=self.todo.pk).is_deleted)
+
+        current = self.batch([{'op': 'delete', 'id': self.todo.pk, 'version': self.todo.version}], **auth)
+        self.assertEqual(current.json()['results'][0]['status'], 200)
+        self.assertTrue(Todo.objects.get(pk=self.todo.pk).is_deleted)
+
+
+class BackfillTodoStatusTests(TestCase):
+    def test_fixes_stale_rows_and_bumps_version(self):
+        user = User.objects.create(username='backfill')
+        synced = Todo.objects.create(user=user, title='Synced')
+        done = Todo.objects.create(user=user, title='Done', completed=True)
+        reopened = Todo.objects.create(user=user, title='Reopened')
+        # Rows from before status existed: bypass save(), which keeps it in sync
+        Todo.objects.filter(pk=done.pk).update(status=Todo.STATUS_PENDING)
+        Todo.objects.filter(pk=reopened.pk).update(status=Todo.STATUS_COMPLETED)
+        before = dict(Todo.objects.values_list('pk', 'version'))
+
+        out = StringIO()
+        call_command('backfill_todo_status', batch_size=1, sleep=0, stdout=out)
+
+        rows = {todo.pk: todo for todo in Todo.objects.all()}
+        self.assertEqual(rows[done.pk].status, Todo.STATUS_COMPLETED)
+        self.assertEqual(rows[reopened.pk].status, Todo.STATUS_PENDING)
+        self.assertEqual(rows[done.pk].version, before[done.pk] + 1)
+        self.assertEqual(rows[synced.pk].version, before[synced.pk])
+        self.assertIn(f"Starting after id {synced.pk}", out.getvalue())
+        self.assertIn("rows/s", out.getvalue())
+
+        # A second run finds nothing left to do
+        out = StringIO()
+        call_command('backfill_todo_status', sleep=0, stdout=out)
+        self.assertIn("No todos need a status backfill", out.getvalue())
+
+
+@override_settings(CACHES=LOCMEM_CACHE, TODO_RATE_LIMITS={}, TODO_RATE_LIMIT_GLOBAL=None)
+class RankRebalanceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='ranks')
+        # Crowded ranks, as after many moves into the same gap
+        self.todos = [Todo.objects.create(user=self.user, title=f'T{i}', rank=i * 1e-4) for i in range(5)]
+
+    def order(self):
+        return list(Todo.objects.filter(user=self.user).order_by('rank').values_list('title', flat=True))
+
+    def test_respaces_in_order(self):
+        from .tasks import rebalance_todo_ranks
+
+        self.assertEqual(rebalance_todo_ranks(self.user.pk, batch_size=2), 5)
+        self.assertEqual(self.order(), ['T0', 'T1', 'T2', 'T3', 'T4'])
+        ranks = list(Todo.objects.filter(user=self.user).order_by('rank').values_list('rank', flat=True))
+        self.assertEqual({b - a for a, b in zip(ranks, ranks[1:])}, {Todo.RANK_STEP})
+
+    def test_move_during_the_pass_is_kept(self):
+        from . import tasks
+
+        bulk_update = Todo.objects.bulk_update
+        moved = self.todos[4]
+
+        def move_after_first_batch(*args, **kwargs):
+            result = bulk_update(*args, **kwargs)
+            if Todo.objects.filter(pk=moved.pk, rank=4e-4).exists():
+                # T4 is dragged to the top while the pass is running
+                top = Todo.objects.filter(user=self.user).order_by('rank').values_list('rank', flat=True)[0]
+                Todo.objects.filter(pk=moved.pk).update(rank=top - Todo.RANK_STEP)
+            return result
+
+        with mock.patch.object(Todo.objects, 'bulk_update', side_effect=move_after_first_batch), \
+                mock.patch.object(tasks.rebalance_todo_ranks, 'apply_async') as retry:
+            # Stops at the batch holding the moved todo
+            self.assertEqual(tasks.rebalance_todo_ranks(self.user.pk, batch_size=2), 4)
+        retry.assert_called_once()
+        self.assertEqual(self.order(), ['T4', 'T0', 'T1', 'T2', 'T3'])
+
+    def test_move_bumps_version(self):
+        self.client.force_login(self.user)
+        first, second = self.todos[0], self.todos[1]
+        response = self.client.post(reverse('todo_app:move', args=[second.pk]), {'before': first.pk})
+        self.assertEqual(response.status_code, 204)
+        moved = Todo.objects.get(pk=second.pk)
+        self.assertEqual(moved.version, second.version + 1)
+        self.assertGreater(moved.updated_at, second.updated_at)
+        self.assertEqual(self.order()[:2], ['T1', 'T0'])
+
+
+class HardDeleteTests(TestCase):
+    def test_deletes_subtree_events_in_batches(self):
+        user = User.objects.create(username='hard')
+        root = Todo.objects.create(user=user, title='Root')
+        child = Todo.objects.create(user=user, title='Child', parent=root)
+        for todo in (root, child):
+            for _ in range(3):
+                TodoEvent.objects.create(user=user, todo=todo, event_type=TodoEvent.TODO_UPDATED, details={})
+        events = TodoEvent.objects.filter(todo__in=[root, child]).count()
+
+        tombstone = root.hard_delete(batch_size=2)
+
+        self.assertEqual(tombstone.event_count, events)
+        self.assertFalse(Todo.objects.filter(pk__in=[root.pk, child.pk]).exists())
+        self.assertFalse(TodoEvent.objects.filter(todo_id__in=[root.pk, child.pk]).exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHE, TODO_RATE_LIMITS={}, TODO_RATE_LIMIT_GLOBAL=None)
+class TagTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='tagger')
+        self.work = Tag.objects.create(user=self.user, name='work')
+        self.home = Tag.objects.create(user=self.user, name='home')
+
+    def counts(self):
+        return dict(Tag.objects.values_list('name', 'todo_count'))
+
+    def test_counts_follow_adds_removes_and_clears(self):
+        first, second, third = (Todo.objects.create(user=self.user, title=f'T{i}') for i in range(3))
+
+        first.tags.add(self.work, self.home)
+        first.tags.add(self.work)
+        self.work.todos.add(second, first)
+        self.assertEqual(self.counts(), {'work': 2, 'home': 1})
+
+        # Removing what is not attached changes nothing
+        first.tags.remove(self.home)
+        first.tags.remove(self.home)
+        self.work.todos.remove(second, third)
+        self.assertEqual(self.counts(), {'work': 1, 'home': 0})
+
+        second.tags.add(self.home)
+        self.home.todos.clear()
+        first.tags.clear()
+        self.assertEqual(self.counts(), {'work': 0, 'home': 0})
+
+    def test_trashed_todos_count_until_hard_deleted(self):
+        root = Todo.objects.create(user=self.user, title='Root')
+        child = Todo.objects.create(user=self.user, title='Child', parent=root)
+        root.tags.add(self.work)
+        child.tags.add(self.work, self.home)
+
+        root.soft_delete()
+        self.assertEqual(self.counts(), {'work': 2, 'home': 1})
+        root.hard_delete()
+        self.assertEqual(self.counts(), {'work': 0, 'home': 0})
+
+    def test_list_prefetches_tags_for_the_page(self):
+        self.client.force_login(self.user)
+
+        def queries_for(count):
+            Todo.objects.all().delete()
+            for i in range(count):
+                Todo.objects.create(user=self.user, title=f'T{i}').tags.add(self.work, self.home)
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(reverse('todo_app:index'))
+            # One pill per item plus the tag filter
+            self.assertContains(response, '#home', count=count + 1)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(queries_for(1), queries_for(4))
+
+    def test_tag_filter_carries_into_load_more(self):
+        self.client.force_login(self.user)
+        for i in range(7):
+            todo = Todo.objects.create(user=self.user, title=f'Todo {i}')
+            if i % 2 == 0:
+                todo.tags.add(self.work)
+
+        response = self.client.get(reverse('todo_app:index'), {'tag': self.work.pk})
+        self.assertContains(response, f'&tag={self.work.pk}')
+        self.assertEqual(len(response.context['todos']), 4)
+
+        response = self.client.get(reverse('todo_app:load_more_todos'), {'page': 1, 'tag': self.work.pk})
+        self.assertEqual(
+            sorted(todo.title for todo in response.context['todos']),
+            ['Todo 0', 'Todo 2', 'Todo 4', 'Todo 6'],
+        )
+
+
+class KeysetPageTests(TestCase):
+    def setUp(self):
+        user = User.objects.create(username='pager')
+        # Ranks with ties, so pages have to break them by pk
+        for i, rank in enumerate([1, 2, 2, 2, 3, 4, 4]):
+            todo = Todo.objects.create(user=user, title=f'T{i}')
+            Todo.objects.filter(pk=todo.pk).update(rank=rank)
+        self.todos = Todo.objects.filter(user=user)
+
+    def walk(self, queryset, limit, **kwargs):
+        pages, cursor = [], None
+        while True:
+            rows, cursor = keyset_page(queryset, 'rank', cursor, limit, **kwargs)
+            pages.append([row['id'] if isinstance(row, dict) else row.pk for row in rows])
+            if cursor is None:
+                return pages
+
+    def test_pages_cover_every_row_once_across_ties(self):
+        ascending = list(self.todos.order_by('rank', 'pk').values_list('pk', flat=True))
+
+        for limit in (1, 2, 3, 7):
+            pages = self.walk(self.todos, limit, descending=False)
+            self.assertEqual([pk for page in pages for pk in page], ascending)
+            self.assertTrue(all(len(page) == limit for page in pages[:-1]))
+
+        pages = self.walk(self.todos.values('id', 'rank'), 2)
+        self.assertEqual([pk for page in pages for pk in page], ascending[::-1])
+
+    def test_each_page_is_one_query_and_bad_cursors_restart(self):
+        first, cursor = keyset_page(self.todos, 'rank', None, 3)
+        with self.assertNumQueries(1):
+            keyset_page(self.todos, 'rank', cursor, 3)
+
+        again, _ = keyset_page(self.todos, 'rank', 'not a cursor', 3)
+        self.assertEqual(again, first)
+        # A cursor past the last row gives an empty last page
+        rows, cursor = keyset_page(self.todos, 'rank', encode_cursor(0, 0), 3)
+        self.assertEqual((rows, cursor), ([], None))
+
+
+@override_settings(CACHES=LOCMEM_CACHE, TODO_RATE_LIMITS={}, TODO_RATE_LIMIT_GLOBAL=None)
+class TodoAdminTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='root', password='x')
+        self.client.force_login(self.admin)
+        self.url = reverse('admin:todo_app_todo_changelist')
+
+    def test_estimated_count_caps_the_count(self):
+        for i in range(5):
+            Todo.objects.create(user=self.admin, title=f'T{i}')
+
+        self.assertEqual(estimated_count(Todo.objects.all(), cap=3), (3, 'capped'))
+        self.assertEqual(estimated_count(Todo.objects.filter(title__in=['T0', 'T1']), cap=3), (2, 'exact'))
+
+    def test_changelist_pages_by_primary_key(self):
+        todos = [Todo.objects.create(user=self.admin, title=f'T{i}') for i in range(5)]
+
+        with mock.patch('todo_app.admin.TodoAdmin.list_per_page', 2):
+            response = self.client.get(self.url)
+            self.assertEqual([t.pk for t in response.context['cl'].result_list], [todos[4].pk, todos[3].pk])
+            self.assertEqual(response.context['cl'].next_page_url, f'?after={todos[3].pk}')
+
+            response = self.client.get(self.url, {'after': todos[1].pk})
+            cl = response.context['cl']
+        self.assertEqual([t.pk for t in cl.result_list], [todos[0].pk])
+        self.assertIsNone(cl.next_page_url)
+        self.assertEqual(cl.result_count_label, '5')
+
+    def test_bulk_soft_delete_and_restore_take_the_subtree(self):
+        root = Todo.objects.create(user=self.admin, title='Root')
+        child = Todo.objects.create(user=self.admin, title='Child', parent=root)
+        grandchild = Todo.objects.create(user=self.admin, title='Grandchild', parent=child)
+        # Trashed on its own earlier, so restoring the root leaves it there
+        other = Todo.objects.create(user=self.admin, title='Other', parent=root)
+        other.soft_delete()
+
+        def run(action, *todos):
+            self.client.post(self.url, {'action': action, '_selected_action': [t.pk for t in todos]})
+            return set(Todo.objects.filter(is_deleted=True).values_list('title', flat=True))
+
+        self.assertEqual(run('soft_delete_selected', root), {'Root', 'Child', 'Grandchild', 'Other'})
+        self.assertEqual(run('restore_selected', root), {'Other'})
+
+        # Restoring a subtask brings back the ancestors it needs, not siblings
+        run('soft_delete_selected', root)
+        self.assertEqual(run('restore_selected', grandchild), {'Other'})
+
+
+class Clock:
+    """A stand-in for time.time() that only moves when told to."""
+
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class TokenBucketTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.clock = Clock()
+        patch = mock.patch('todo_app.ratelimit.time.time', self.clock)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_burst_up_to_capacity_then_reject(self):
+        bucket = TokenBucket('test', capacity=3, rate=1.0)
+        self.assertEqual([bucket.consume('u')[0] for _ in range(3)], [True, True, True])
+        allowed, retry_after = bucket.consume('u')
+        self.assertFalse(allowed)
+        self.assertEqual(retry_after, 1)
+
+    def test_refill_over_time(self):
+        bucket = TokenBucket('test', capacity=2, rate=0.5)
+        bucket.consume('u')
+        bucket.consume('u')
+        self.assertFalse(bucket.consume('u')[0])
+        self.clock.now += 2
+        self.assertTrue(bucket.consume('u')[0])
+        self.assertFalse(bucket.consume('u')[0])
+
+    def test_idle_time_does_not_exceed_capacity(self):
+        bucket = TokenBucket('test', capacity=2, rate=1.0)
+        bucket.consume('u')
+        self.clock.now += 3600
+        self.assertEqual([bucket.consume('u')[0] for _ in range(3)], [True, True, False])
+
+    def test_identities_are_independent(self):
+        bucket = TokenBucket('test', capacity=1, rate=0.1)
+        self.assertTrue(bucket.consume('a')[0])
+        self.assertFalse(bucket.consume('a')[0])
+        self.assertTrue(bucket.consume('b')[0])
+
+    def test_busy_bucket_keys_do_not_expire(self):
+        bucket = TokenBucket('test', capacity=2, rate=0.1)
+        self.assertEqual(bucket.timeout, 60)
+        self.assertEqual([bucket.consume('u')[0] for _ in range(2)], [True, True])
+        # Taking each token as it refills keeps the bucket empty, well
+        # past the key timeout; it must not come back full
+        for _ in range(7):
+            self.clock.now += 10
+            self.assertTrue(bucket.consume('u')[0])
+        self.assertFalse(bucket.consume('u')[0])
+
+    def test_takes_several_tokens(self):
+        bucket = TokenBucket('test', capacity=5, rate=1.0)
+        self.assertTrue(bucket.consume('u', 4)[0])
+        allowed, retry_after = bucket.consume('u', 2)
+        self.assertFalse(allowed)
+        self.assertEqual(retry_after, 1)
+        self.assertTrue(bucket.consume('u', 1)[0])
+
+
+@override_settings(CACHES=LOCMEM_CACHE, TODO_RATE_LIMITS={'default': (100, 1.0), 'create': (2, 0.01)},
+                   TODO_RATE_LIMIT_GLOBAL=None)
+class RateLimitMiddlewareTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='limited')
+        self.client.force_login(self.user)
+
+    def create(self, title):
+        return self.client.post(reverse('todo_app:create'), {'title': title})
+
+    def test_post_is_limited_with_retry_after(self):
+        self.assertNotEqual(self.create('one').status_code, 429)
+        self.assertNotEqual(self.create('two').status_code, 429)
+        response = self.create('three')
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        self.assertEqual(Todo.objects.filter(user=self.user).count(), 2)
+
+    def test_get_is_not_limited(self):
+        for _ in range(5):
+            self.assertEqual(self.client.get(reverse('todo_app:index')).status_code, 200)
+
+    def test_users_have_their_own_buckets(self):
+        self.create('one')
+        self.create('two')
+        other = User.objects.create(username='other')
+        self.client.force_login(other)
+        self.assertNotEqual(self.create('three').status_code, 429)
+
+    @override_settings(TODO_RATE_LIMITS={'default': (1, 0.01)})
+    def test_default_bucket_is_per_endpoint(self):
+        todo = Todo.objects.create(user=self.user, title='Mine')
+        toggle = reverse('todo_app:toggle', args=[todo.pk])
+        self.assertNotEqual(self.client.post(toggle).status_code, 429)
+        self.assertEqual(self.client.post(toggle).status_code, 429)
+        self.assertNotEqual(self.create('other endpoint').status_code, 429)
+
+    @override_settings(TODO_RATE_LIMITS={'api_todo_batch': (3, 0.01)})
+    def test_batch_is_charged_per_operation(self):
+        todos = [Todo.objects.create(user=self.user, title=f'Batch {i}') for i in range(3)]
+        batch = lambda ops: self.client.post(
+            reverse('todo_app:api_todo_batch'), json.dumps({'operations': ops}), content_type='application/json',
+        )
+        self.assertEqual(batch([{'op': 'toggle', 'id': todo.pk} for todo in todos[:2]]).status_code, 200)
+        response = batch([{'op': 'toggle', 'id': todo.pk} for todo in todos])
+        self.assertEqual(response.status_code, 429)
+        self.assertFalse(Todo.objects.get(pk=todos[2].pk).completed)
+
+    @override_settings(TODO_RATE_LIMITS={}, TODO_RATE_LIMIT_GLOBAL=(1, 0.01))
+    def test_global_pressure_sheds_with_503(self):
+        self.assertNotEqual(self.create('one').status_code, 503)
+        response = self.create('two')
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+
+
+@override_settings(CACHES=LOCMEM_CACHE, TODO_RATE_LIMITS={}, TODO_RATE_LIMIT_GLOBAL=None,
+                   TODO_EVENT_LOGGING='triggers', TIME_ZONE='Pacific/Kiritimati')
+class TriggerEventLoggingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        install_event_triggers(connection)
+        self.addCleanup(remove_event_triggers, connection)
+        self.owner = User.objects.create(username='owner')
+        self.client.force_login(self.owner)
+
+    def events(self, todo):
+        return list(TodoEvent.objects.filter(todo=todo).order_by('pk').values_list('event_type', 'user__username'))
+
+    def toggle(self, todo):
+        todo.refresh_from_db()
+        return self.client.post(reverse('todo_app:toggle', args=[todo.pk]), {'version': todo.version})
+
+    def test_created_completed_deleted(self):
+        todo = Todo.objects.create(user=self.owner, title='Trigger me')
+        self.toggle(todo)
+        self.toggle(todo)
+        self.toggle(todo)
+        self.client.post(reverse('todo_app:soft_delete', args=[todo.pk]))
+
+        self.assertEqual(self.events(todo), [
+            (TodoEvent.TODO_CREATED, 'owner'),
+            (TodoEvent.TODO_CHECKED, 'owner'),
+            (TodoEvent.TODO_UNCHECKED, 'owner'),
+            (TodoEvent.TODO_CHECKED, 'owner'),
+            (TodoEvent.TODO_DELETED, 'owner'),
+        ])
+        stats = DailyTodoStats.objects.get(user=self.owner)
+        # Only the first completion counts
+        self.assertEqual((stats.created_count, stats.completed_count, stats.uncompleted_count), (1, 1, 1))
+        # Bucketed by the local date, like timezone.localdate() on the signal path
+        self.assertEqual(stats.day, timezone.localdate())
+
+    def test_signal_path_writes_nothing(self):
+        todo = Todo.objects.create(user=self.owner, title='Only once')
+        self.assertIsNone(log_todo_event(todo, TodoEvent.TODO_UPDATED, {}))
+        self.assertEqual(self.events(todo), [(TodoEvent.TODO_CREATED, 'owner')])
+        self.assertEqual(DailyTodoStats.objects.get(user=self.owner).created_count, 1)
+
+    def test_events_name_the_acting_member(self):
+        editor = User.objects.create(username='editor')
+        todo_list = TodoList.objects.create(name='Shared', owner=self.owner)
+        ListMembership.objects.create(todo_list=todo_list, user=self.owner, role=ListMembership.ROLE_OWNER)
+        ListMembership.objects.create(todo_list=todo_list, user=editor, role=ListMembership.ROLE_EDITOR)
+        todo = Todo.objects.create(user=self.owner, title='Shared todo', todo_list=todo_list)
+
+        self.client.force_login(editor)
+        self.assertEqual(self.toggle(todo).status_code, 200)
+
+        self.assertEqual(self.events(todo)[-1], (TodoEvent.TODO_CHECKED, 'editor'))
+        # The rollup still belongs to the owner
+        self.assertEqual(DailyTodoStats.objects.get(user=self.owner).completed_count, 1)
+        self.assertFalse(DailyTodoStats.objects.filter(user=editor).exists())
+
+    def test_status_due_date_and_combined_edits_are_logged(self):
+        todo = Todo.objects.create(user=self.owner, title='Plan')
+        self.client.post(reverse('todo_app:set_status', args=[todo.pk]), {'status': Todo.STATUS_IN_PROGRESS})
+        due_at = timezone.now().replace(microsecond=0) + timezone.timedelta(days=1)
+        Todo.objects.filter(pk=todo.pk).update(due_at=due_at)
+        Todo.objects.filter(pk=todo.pk).update(completed=True, status=Todo.STATUS_COMPLETED, title='Planned')
+
+        events = list(TodoEvent.objects.filter(todo=todo).order_by('pk').values_list('event_type', 'details'))
+        self.assertEqual([event_type for event_type, _ in events], [
+            TodoEvent.TODO_CREATED, TodoEvent.TODO_UPDATED, TodoEvent.TODO_UPDATED,
+            TodoEvent.TODO_CHECKED, TodoEvent.TODO_UPDATED,
+        ])
+        self.assertEqual(events[1][1]['new']['status'], Todo.STATUS_IN_PROGRESS)
+        self.assertEqual(events[2][1]['old']['due_at'], None)
+        self.assertEqual(events[2][1]['new']['due_at'], due_at.isoformat())
+        # The completion's own status change is not logged twice
+        self.assertNotIn('status', events[4][1]['new'])
+        self.assertEqual(events[4][1]['old']['title'], 'Plan')
+
+        # History replays the due date and title the log now records
+        todo.refresh_from_db()
+        event_ids = list(TodoEvent.objects.filter(todo=todo).order_by('pk').values_list('pk', flat=True))
+        self.assertEqual(state_as_of(todo, event_ids[1])['due_at'], None)
+        self.assertEqual(state_as_of(todo, event_ids[3]), {**state_as_of(todo, event_ids[4]), 'title': 'Plan'})
+
+
+@override_settings(CACHES=LOCMEM_CACHE, TODO_RATE_LIMITS={}, TODO_RATE_LIMIT_GLOBAL=None)
+class SharedListAccessTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create(username='lead')
+        self.editor = User.objects.create(username='writer')
+        self.viewer = User.objects.create(username='reader')
+        self.outsider = User.objects.create(username='stranger')
+        self.todo_list = TodoList.objects.create(name='Team', owner=self.owner)
+        for user, role in ((self.owner, ListMembership.ROLE_OWNER), (self.editor, ListMembership.ROLE_EDITOR),
+                           (self.viewer, ListMembership.ROLE_VIEWER)):
+            ListMembership.objects.create(todo_list=self.todo_list, user=user, role=role)
+        self.todo = Todo.objects.create(user=self.owner, title='Shared', todo_list=self.todo_list)
+
+    def test_visible_to_roles(self):
+        readable = lambda user: Todo.objects.visible_to(user).filter(pk=self.todo.pk).exists()
+        writable = lambda user: Todo.objects.visible_to(user, ListMembership.WRITE_ROLES).filter(pk=self.todo.pk).exists()
+        self.assertEqual([readable(u) for u in (self.owner, self.editor, self.viewer, self.outsider)],
+                         [True, True, True, False])
+        self.assertEqual([writable(u) for u in (self.owner, self.editor, self.viewer, self.outsider)],
+                         [True, True, False, False])
+
+    def test_views_enforce_roles(self):
+        list_page = reverse('todo_app:index') + f'?list={self.todo_list.pk}'
+        toggle = reverse('todo_app:toggle', args=[self.todo.pk])
+        for user, page_status, toggle_status in (
+            (self.viewer, 200, 403), (self.outsider, 404, 404), (self.editor, 200, 200),
+        ):
+            self.client.force_login(user)
+            self.todo.refresh_from_db()
+            self.assertEqual(self.client.get(list_page).status_code, page_status, user)
+            self.assertEqual(self.client.post(toggle, {'version': self.todo.version}).status_code, toggle_status, user)
+
+    def test_member_delete_and_restore_are_logged_as_the_member(self):
+        self.client.force_login(self.editor)
+        self.client.post(reverse('todo_app:soft_delete', args=[self.todo.pk]))
+        self.client.post(reverse('todo_app:restore', args=[self.todo.pk]))
+        self.assertEqual(
+            list(TodoEvent.objects.filter(todo=self.todo).order_by('pk').values_list('event_type', 'user__username')),
+            [(TodoEvent.TODO_CREATED, 'lead'), (TodoEvent.TODO_DELETED, 'writer'), (TodoEvent.TODO_RESTORED, 'writer')],
+        )
+
+    def test_role_cache_is_invalidated_on_membership_change(self):
+        self.assertEqual(cached_list_role(self.viewer.pk, self.todo_list.pk), ListMembership.ROLE_VIEWER)
+        with self.assertNumQueries(0):
+            cached_list_role(self.viewer.pk, self.todo_list.pk)
+
+        membership = ListMembership.objects.get(user=self.viewer)
+        with self.captureOnCommitCallbacks(execute=True):
+            membership.role = ListMembership.ROLE_EDITOR
+            membership.save()
+        self.assertEqual(cached_list_role(self.viewer.pk, self.todo_list.pk), ListMembership.ROLE_EDITOR)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            membership.delete()
+        self.assertIsNone(cached_list_role(self.viewer.pk, self.todo_list.pk))
+
+    def test_evicted_version_still_invalidates_cached_roles(self):
+        self.assertEqual(cached_list_role(self.viewer.pk, self.todo_list.pk), ListMembership.ROLE_VIEWER)
+        cache.delete(f'todo_app:list_roles:{self.todo_list.pk}:version')
+        with self.captureOnCommitCallbacks(execute=True):
+            ListMembership.objects.get(user=self.viewer).delete()
+        self.assertIsNone(cached_list_role(self.viewer.pk, self.todo_list.pk))
+
+
+class DueReminderTests(TestCase):
+    def test_one_email_per_user_across_batches(self):
+        from django.core import mail
+        from .tasks import send_due_reminders
+
+        soon = timezone.now() + timezone.timedelta(minutes=5)
+        alice = User.objects.create(username='alice', email='alice@example.com')
+        bob = User.objects.create(username='bob', email='bob@example.com')
+        for i in range(3):
+            for user in (alice, bob):
+                Todo.objects.create(user=user, title=f'{user.username} {i}', due_at=soon + timezone.timedelta(seconds=i))
+
+        self.assertEqual(send_due_reminders(batch_size=2), 2)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['alice@example.com', 'bob@example.com'])
+        self.assertTrue(all(message.body.count('\n- ') == 2 for message in mail.outbox))
+        self.assertFalse(Todo.objects.due_for_reminder(soon + timezone.timedelta(hours=1)).exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHE, TODO_RATE_LIMITS={}, TODO_RATE_LIMIT_GLOBAL=None)
+class SubtaskTrashTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='trash')
+        self.client.force_login(self.user)
+        self.root = Todo.objects.create(user=self.user, title='Move house')
+        self.child = Todo.objects.create(user=self.user, title='Pack books', parent=self.root)
+        self.grandchild = Todo.objects.create(user=self.user, title='Buy boxes', parent=self.child)
+
+    def test_trash_lists_only_deleted_roots(self):
+        self.root.soft_delete()
+        response = self.client.get(reverse('todo_app:deleted_todos'))
+        self.assertEqual([todo.pk for todo in response.context['todos']], [self.root.pk])
+
+    def test_restoring_a_subtask_restores_its_ancestors(self):
+        self.root.soft_delete()
+        self.grandchild.refresh_from_db()
+        self.grandchild.restore()
+        self.assertEqual(
+            set(Todo.objects.active().filter(user=self.user).values_list('title', flat=True)),
+            {'Move house', 'Pack books', 'Buy boxes'},
+        )
+
+
+class RecurrenceMaterializationTests(TestCase):
+    def test_conflicting_rule_does_not_roll_back_the_others(self):
+        from .tasks import materialize_recurring_todos
+
+        user = User.objects.create(username='recurring')
+        starts_at = timezone.now() + timezone.timedelta(hours=1)
+        taken, free = (
+            RecurrenceRule.objects.create(user=user, title=title, starts_at=starts_at)
+            for title in ('Taken', 'Free')
+        )
+        # Another run created the first occurrence but has not advanced the rule
+        Todo.objects.create(user=user, title='Taken', recurrence=taken, occurrence_at=starts_at, due_at=starts_at)
+
+        with self.assertLogs('todo_app.tasks', 'WARNING') as logs:
+            created = materialize_recurring_todos()
+
+        self.assertTrue(any(f'rule {taken.pk} ' in line for line in logs.output))
+        self.assertGreater(created, 0)
+        self.assertEqual(Todo.objects.filter(recurrence=free).count(), created)
+        free.refresh_from_db()
+        self.assertGreater(free.next_occurrence_at, starts_at)
+
+
+@override_settings(CACHES=LOCMEM_CACHE, TODO_SNAPSHOT_EVERY=5)
+class HistorySnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='history')
+        self.todo = Todo.objects.create(user=self.user, title='v0')
+        for i in range(1, 12):
+            self.todo.title = f'v{i}'
+            self.todo.save()
+        self.events = list(TodoEvent.objects.filter(todo=self.todo).order_by('pk').values_list('pk', flat=True))
+
+    def test_as_of_reads_do_not_write(self):
+        with CaptureQueriesContext(connection) as queries:
+            state = state_as_of(self.todo, self.events[3])
+        self.assertEqual(state['title'], 'v3')
+        self.assertFalse(TodoSnapshot.objects.exists())
+        self.assertFalse([q for q in queries.captured_queries if not q['sql'].lstrip().upper().startswith('SELECT')])
+        self.assertFalse([q for q in queries.captured_queries if 'FOR UPDATE' in q['sql'].upper()])
+
+    def test_writes_do_not_enqueue_anything(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.todo.title = 'v12'
+            self.todo.save()
+        self.assertEqual(callbacks, [])
+
+    def test_beat_task_snapshots_todos_with_new_events(self):
+        from .tasks import take_due_snapshots
+
+        # The first run only records where the log ends
+        cache.delete('todo_app:take_due_snapshots:last_event_id')
+        self.assertEqual(take_due_snapshots(), 0)
+        self.todo.title = 'v12'
+        self.todo.save()
+        self.assertEqual(take_due_snapshots(), 2)
+        self.assertEqual(list(TodoSnapshot.objects.filter(todo=self.todo).values_list('seq', flat=True).order_by('seq')), [5, 10])
+        self.assertEqual(state_as_of(self.todo, self.events[7])['title'], 'v7')
+        self.assertEqual(state_as_of(self.todo, self.events[1])['title'], 'v1')
+        # Nothing new since: nothing to do
+        self.assertEqual(take_due_snapshots(), 0)
+
+
+@override_settings(CACHES=LOCMEM_CACHE, TODO_ATTACHMENT_QUOTA_BYTES=100, TODO_RATE_LIMITS={}, TODO_RATE_LIMIT_GLOBAL=None)
+class AttachmentTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        storage_root = override_settings(TODO_ATTACHMENT_ROOT=root)
+        storage_root.enable()
+        self.addCleanup(storage_root.disable)
+        self.user = User.objects.create(username='files')
+        self.client.force_login(self.user)
+        self.todo = Todo.objects.create(user=self.user, title='Paperwork')
+
+    def start(self, name, size):
+        return self.client.post(reverse('todo_app:attachments', args=[self.todo.pk]), {'name': name, 'size': size})
+
+    def put_chunk(self, upload_url, data, start, size):
+        return self.client.put(
+            upload_url, data, content_type='application/octet-stream',
+            headers={'Content-Range': f'bytes {start}-{start + len(data) - 1}/{size}'},
+        )
+
+    def upload(self, name, data):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.put_chunk(self.start(name, len(data)).json()['upload_url'], data, 0, len(data))
+        return Attachment.objects.get(pk=response.json()['attachment'])
+
+    def test_unfinished_uploads_count_against_quota(self):
+        first = self.start('a.txt', 60)
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(self.start('b.txt', 60).status_code, 413)
+        # Resuming the same file is not charged twice
+        resumed = self.start('a.txt', 60)
+        self.assertEqual(resumed.status_code, 200)
+        self.assertEqual(resumed.json()['upload_url'], first.json()['upload_url'])
+
+    def test_sizes_are_reserved_once_and_refunded_on_discard(self):
+        attachment = self.upload('a.txt', b'0123456789')
+        self.assertEqual(StorageUsage.objects.used(self.user.pk), 10)
+        upload_url = self.start('b.txt', 30).json()['upload_url']
+        self.assertEqual(StorageUsage.objects.used(self.user.pk), 40)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(upload_url).status_code, 204)
+        self.assertEqual(StorageUsage.objects.used(self.user.pk), 10)
+        with self.captureOnCommitCallbacks(execute=True):
+            release_attachments(Attachment.objects.filter(pk=attachment.pk))
+        self.assertEqual(StorageUsage.objects.used(self.user.pk), 0)
+
+    def test_one_upload_per_file(self):
+        AttachmentUpload.objects.create(todo=self.todo, user=self.user, name='a.txt', size=3)
+        with self.assertRaises(IntegrityError):
+            AttachmentUpload.objects.create(todo=self.todo, user=self.user, name='a.txt', size=3)
+
+    def test_shared_blob_is_kept_until_the_last_attachment_goes(self):
+        first = self.upload('a.txt', b'same bytes')
+        second = self.upload('b.txt', b'same bytes')
+        blob_path = attachment_storage().path(first.blob_name)
+        self.assertEqual(AttachmentBlob.objects.get().sha256, first.sha256)
+        self.assertFalse(os.listdir(attachment_storage().path('uploads')))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            release_attachments(Attachment.objects.filter(pk=first.pk))
+        self.assertTrue(os.path.exists(blob_path))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            release_attachments(Attachment.objects.filter(pk=second.pk))
+        self.assertFalse(os.path.exists(blob_path))
+        self.assertFalse(AttachmentBlob.objects.exists())
+
+    def test_failed_save_keeps_the_upload_and_stores_no_blob(self):
+        upload = AttachmentUpload.objects.create(todo=self.todo, user=self.user, name='a.txt', size=3)
+        self.assertTrue(write_chunk(upload, 0, BytesIO(b'abc'), 3))
+        with mock.patch.object(Attachment, 'save', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                finalize(upload)
+        self.assertTrue(AttachmentUpload.objects.filter(pk=upload.pk).exists())
+        self.assertTrue(os.path.exists(attachment_storage().path(upload.part_name)))
+        self.assertFalse(AttachmentBlob.objects.exists())
+        self.assertFalse(os.path.exists(attachment_storage().path('blobs')))
+
+    @override_settings(TODO_RATE_LIMITS={'attachment_upload': (1, 0.001)})
+    def test_chunks_are_rate_limited(self):
+        upload_url = self.start('a.txt', 4).json()['upload_url']
+        self.assertEqual(self.put_chunk(upload_url, b'ab', 0, 4).status_code, 200)
+        response = self.put_chunk(upload_url, b'cd', 2, 4)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(self.client.delete(upload_url).status_code, 429)
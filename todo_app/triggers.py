@@ -0,0 +1,357 @@
+# todo_app/triggers.py
+"""
+Optional database-trigger event logging (TODO_EVENT_LOGGING = 'triggers').
+
+The triggers write the TodoEvent row, and bump DailyTodoStats, in the same
+statement as the INSERT/UPDATE on the todo table. That saves the pre_save
+SELECT and the separate event INSERT that the Python signals need, and it
+also logs changes made with QuerySet.update(). An UPDATE logs deleted or
+restored, else checked/unchecked for a completion change plus an updated
+event (old/new title, description, and due_at or status when they
+changed) for any other edit, as the views log them on the signal path.
+Tags are a separate table and are not logged in this mode, so history
+and undo leave them as they are.
+
+The trigger cannot see the request, so EventActorMiddleware tells it who is
+acting: set_event_actor() stores the user id in the todo_app.actor_id
+session setting on PostgreSQL, or behind the todo_app_actor_id() function
+registered on every SQLite connection. Without an actor (shell, admin
+bulk actions, Celery tasks) the event falls back to the todo owner.
+DailyTodoStats rows always belong to the owner, like on the signal path,
+and are bucketed by the local date in TIME_ZONE.
+
+PostgreSQL is the production target; the SQLite version exists so the test
+database behaves the same. The triggers are installed or dropped by the
+post_migrate hook, so run `manage.py migrate` after changing the setting.
+"""
+
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import NotSupportedError, connection as default_connection
+
+from .models import DailyTodoStats, Todo, TodoEvent
+
+TRIGGER_NAME = 'todo_app_todo_event_trg'
+FUNCTION_NAME = 'todo_app_log_todo_event'
+ACTOR_SETTING = 'todo_app.actor_id'
+SQLITE_ACTOR_FUNCTION = 'todo_app_actor_id'
+
+# SQLite connections are per thread, and so is the actor they report
+_sqlite_actor = threading.local()
+
+
+def event_triggers_enabled():
+    """True when TodoEvents are written by database triggers instead of signals."""
+    return getattr(settings, 'TODO_EVENT_LOGGING', 'signals') == 'triggers'
+
+
+def _tables():
+    return Todo._meta.db_table, TodoEvent._meta.db_table, DailyTodoStats._meta.db_table
+
+
+_PG_ACTOR = f"COALESCE(NULLIF(current_setting('{ACTOR_SETTING}', true), '')::integer, NEW.user_id)"
+
+
+def _pg_isoformat(column):
+    # Same text as datetime.isoformat() in UTC, which the signal path and
+    # history.current_state() write, so replayed states compare equal
+    utc = f"({column} AT TIME ZONE 'UTC')"
+    return (
+        f"to_char({utc}, 'YYYY-MM-DD\"T\"HH24:MI:SS') || "
+        f"CASE WHEN extract(microseconds FROM {utc})::bigint % 1000000 <> 0 "
+        f"THEN to_char({utc}, '.US') ELSE '' END || '+00:00'"
+    )
+
+
+def _postgresql_install_sql():
+    todo, event, stats = _tables()
+    return [
+        f"""
+        CREATE OR REPLACE FUNCTION {FUNCTION_NAME}() RETURNS trigger AS $$
+        DECLARE
+            evt varchar(32);
+            det jsonb;
+            first_check boolean;
+            changed boolean := false;
+            old_det jsonb;
+            new_det jsonb;
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                evt := 'created';
+                det := jsonb_build_object('title', NEW.title);
+            ELSIF NEW.is_deleted AND NOT OLD.is_deleted THEN
+                evt := 'deleted';
+                det := jsonb_build_object('title', NEW.title);
+            ELSIF NOT NEW.is_deleted AND OLD.is_deleted THEN
+                evt := 'restored';
+                det := jsonb_build_object('title', NEW.title);
+            ELSE
+                IF NEW.completed <> OLD.completed THEN
+                    evt := CASE WHEN NEW.completed THEN 'checked' ELSE 'unchecked' END;
+                    det := jsonb_build_object('completed', NEW.completed, 'title', NEW.title);
+                END IF;
+                -- Any other change is an 'updated' event of its own, so a
+                -- completion does not hide an edit made in the same UPDATE
+                old_det := jsonb_build_object('title', OLD.title, 'description', OLD.description);
+                new_det := jsonb_build_object('title', NEW.title, 'description', NEW.description);
+                changed := NEW.title <> OLD.title OR NEW.description <> OLD.description;
+                IF NEW.due_at IS DISTINCT FROM OLD.due_at THEN
+                    changed := true;
+                    old_det := old_det || jsonb_build_object('due_at', {_pg_isoformat('OLD.due_at')});
+                    new_det := new_det || jsonb_build_object('due_at', {_pg_isoformat('NEW.due_at')});
+                END IF;
+                -- Completing or reopening moves status too; that is the checked event
+                IF NEW.status <> OLD.status AND NEW.completed = OLD.completed THEN
+                    changed := true;
+                    old_det := old_det || jsonb_build_object('status', OLD.status);
+                    new_det := new_det || jsonb_build_object('status', NEW.status);
+                END IF;
+                IF evt IS NULL AND NOT changed THEN
+                    RETURN NULL;
+                END IF;
+            END IF;
+
+            IF evt IS NOT NULL THEN
+                -- Only a todo's first completion counts (see todo_stats_deltas)
+                first_check := evt = 'checked' AND NOT EXISTS (
+                    SELECT 1 FROM {event} WHERE todo_id = NEW.id AND event_type = 'checked'
+                );
+
+                INSERT INTO {event} (created_at, updated_at, user_id, todo_id, event_type, timestamp, details)
+                VALUES (now(), now(), {_PG_ACTOR}, NEW.id, evt, now(), det);
+
+                IF NEW.user_id IS NOT NULL AND (evt IN ('created', 'unchecked') OR first_check) THEN
+                    INSERT INTO {stats} AS s
+                        (user_id, day, created_count, completed_count, uncompleted_count, completion_seconds)
+                    VALUES (
+                        NEW.user_id,
+                        (now() AT TIME ZONE '{settings.TIME_ZONE}')::date,
+                        (evt = 'created')::int,
+                        first_check::int,
+                        (evt = 'unchecked')::int,
+                        CASE WHEN first_check
+                             THEN GREATEST(extract(epoch FROM now() - NEW.created_at)::bigint, 0)
+                             ELSE 0 END
+                    )
+                    ON CONFLICT (user_id, day) DO UPDATE SET
+                        created_count = s.created_count + EXCLUDED.created_count,
+                        completed_count = s.completed_count + EXCLUDED.completed_count,
+                        uncompleted_count = s.uncompleted_count + EXCLUDED.uncompleted_count,
+                        completion_seconds = s.completion_seconds + EXCLUDED.completion_seconds;
+                END IF;
+            END IF;
+
+            IF changed THEN
+                INSERT INTO {event} (created_at, updated_at, user_id, todo_id, event_type, timestamp, details)
+                VALUES (
+                    now(), now(), {_PG_ACTOR}, NEW.id, 'updated', now(),
+                    jsonb_build_object('old', old_det, 'new', new_det)
+                );
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        f"DROP TRIGGER IF EXISTS {TRIGGER_NAME} ON {todo}",
+        f"""
+        CREATE TRIGGER {TRIGGER_NAME}
+        AFTER INSERT OR UPDATE ON {todo}
+        FOR EACH ROW EXECUTE FUNCTION {FUNCTION_NAME}()
+        """,
+    ]
+
+
+def _postgresql_remove_sql():
+    todo, _, _ = _tables()
+    return [
+        f"DROP TRIGGER IF EXISTS {TRIGGER_NAME} ON {todo}",
+        f"DROP FUNCTION IF EXISTS {FUNCTION_NAME}()",
+    ]
+
+
+# SQLite has no procedural language, so the rules become CASE expressions
+_SQLITE_NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+_SQLITE_ACTOR = f"COALESCE({SQLITE_ACTOR_FUNCTION}(), NEW.user_id)"
+_SQLITE_EVENT_TYPE = """
+    CASE
+        WHEN NEW.is_deleted AND NOT OLD.is_deleted THEN 'deleted'
+        WHEN NOT NEW.is_deleted AND OLD.is_deleted THEN 'restored'
+        WHEN NEW.completed <> OLD.completed THEN
+            CASE WHEN NEW.completed THEN 'checked' ELSE 'unchecked' END
+    END
+"""
+_SQLITE_DETAILS = """
+    CASE e.evt
+        WHEN 'checked' THEN json_object('completed', json('true'), 'title', NEW.title)
+        WHEN 'unchecked' THEN json_object('completed', json('false'), 'title', NEW.title)
+        ELSE json_object('title', NEW.title)
+    END
+"""
+# Edits other than completion get an 'updated' event of their own; status
+# follows a completion change, so only a status change without one counts
+_SQLITE_DUE_CHANGED = "NEW.due_at IS NOT OLD.due_at"
+_SQLITE_STATUS_CHANGED = "(NEW.status <> OLD.status AND NEW.completed = OLD.completed)"
+_SQLITE_FIELDS_CHANGED = f"""
+    NEW.is_deleted = OLD.is_deleted AND (
+        NEW.title <> OLD.title OR NEW.description <> OLD.description
+        OR {_SQLITE_DUE_CHANGED} OR {_SQLITE_STATUS_CHANGED}
+    )
+"""
+
+
+def _sqlite_update_side(row):
+    # Django stores UTC datetimes as 'YYYY-MM-DD HH:MM:SS[.ffffff]'; this
+    # gives the datetime.isoformat() text the signal path logs
+    details = f"json_object('title', {row}.title, 'description', {row}.description)"
+    details = (
+        f"CASE WHEN {_SQLITE_DUE_CHANGED} "
+        f"THEN json_set({details}, '$.due_at', replace({row}.due_at, ' ', 'T') || '+00:00') "
+        f"ELSE {details} END"
+    )
+    details = (
+        f"CASE WHEN {_SQLITE_STATUS_CHANGED} "
+        f"THEN json_set({details}, '$.status', {row}.status) ELSE {details} END"
+    )
+    return f"json({details})"
+
+
+def _sqlite_today():
+    # Django registers django_datetime_cast_date() on its SQLite connections;
+    # it gives the same local date as timezone.localdate() on the signal path
+    return f"django_datetime_cast_date({_SQLITE_NOW}, '{settings.TIME_ZONE}', 'UTC')"
+
+
+def _sqlite_stats_upsert(stats, event, evt):
+    # Runs after the event INSERT, so a first completion is the only one
+    first_check = f"""
+        e.evt = 'checked' AND (
+            SELECT count(*) FROM {event} WHERE todo_id = NEW.id AND event_type = 'checked'
+        ) = 1
+    """
+    return f"""
+        INSERT INTO {stats}
+            (user_id, day, created_count, completed_count, uncompleted_count, completion_seconds)
+        SELECT
+            NEW.user_id,
+            {_sqlite_today()},
+            e.evt = 'created',
+            e.first_check,
+            e.evt = 'unchecked',
+            CASE WHEN e.first_check
+                 THEN max(CAST((julianday('now') - julianday(NEW.created_at)) * 86400 AS INTEGER), 0)
+                 ELSE 0 END
+        FROM (SELECT e.evt, {first_check} AS first_check FROM (SELECT {evt} AS evt) AS e) AS e
+        WHERE NEW.user_id IS NOT NULL AND (e.evt IN ('created', 'unchecked') OR e.first_check)
+        ON CONFLICT (user_id, day) DO UPDATE SET
+            created_count = created_count + excluded.created_count,
+            completed_count = completed_count + excluded.completed_count,
+            uncompleted_count = uncompleted_count + excluded.uncompleted_count,
+            completion_seconds = completion_seconds + excluded.completion_seconds;
+    """
+
+
+def _sqlite_install_sql():
+    todo, event, stats = _tables()
+    return _sqlite_remove_sql() + [
+        f"""
+        CREATE TRIGGER {TRIGGER_NAME}_ins AFTER INSERT ON {todo}
+        BEGIN
+            INSERT INTO {event} (created_at, updated_at, user_id, todo_id, event_type, timestamp, details)
+            VALUES ({_SQLITE_NOW}, {_SQLITE_NOW}, {_SQLITE_ACTOR}, NEW.id, 'created', {_SQLITE_NOW},
+                    json_object('title', NEW.title));
+            {_sqlite_stats_upsert(stats, event, "'created'")}
+        END
+        """,
+        f"""
+        CREATE TRIGGER {TRIGGER_NAME}_upd AFTER UPDATE ON {todo}
+        BEGIN
+            INSERT INTO {event} (created_at, updated_at, user_id, todo_id, event_type, timestamp, details)
+            SELECT {_SQLITE_NOW}, {_SQLITE_NOW}, {_SQLITE_ACTOR}, NEW.id, e.evt, {_SQLITE_NOW}, {_SQLITE_DETAILS}
+            FROM (SELECT {_SQLITE_EVENT_TYPE} AS evt) AS e
+            WHERE e.evt IS NOT NULL;
+            {_sqlite_stats_upsert(stats, event, _SQLITE_EVENT_TYPE)}
+            INSERT INTO {event} (created_at, updated_at, user_id, todo_id, event_type, timestamp, details)
+            SELECT {_SQLITE_NOW}, {_SQLITE_NOW}, {_SQLITE_ACTOR}, NEW.id, 'updated', {_SQLITE_NOW},
+                   json_object('old', {_sqlite_update_side('OLD')}, 'new', {_sqlite_update_side('NEW')})
+            WHERE {_SQLITE_FIELDS_CHANGED};
+        END
+        """,
+    ]
+
+
+def _sqlite_remove_sql():
+    return [
+        f"DROP TRIGGER IF EXISTS {TRIGGER_NAME}_ins",
+        f"DROP TRIGGER IF EXISTS {TRIGGER_NAME}_upd",
+    ]
+
+
+def _statements(connection, install):
+    if connection.vendor == 'postgresql':
+        return _postgresql_install_sql() if install else _postgresql_remove_sql()
+    if connection.vendor == 'sqlite':
+        return _sqlite_install_sql() if install else _sqlite_remove_sql()
+    if install:
+        raise NotSupportedError(
+            f"TODO_EVENT_LOGGING = 'triggers' is not supported on {connection.vendor}"
+        )
+    return []
+
+
+def install_event_triggers(connection):
+    with connection.cursor() as cursor:
+        for sql in _statements(connection, install=True):
+            cursor.execute(sql)
+
+
+def remove_event_triggers(connection):
+    with connection.cursor() as cursor:
+        for sql in _statements(connection, install=False):
+            cursor.execute(sql)
+
+
+def sync_event_triggers(sender, using, **kwargs):
+    """post_migrate hook: make the database match TODO_EVENT_LOGGING."""
+    from django.db import connections
+    
+    connection = connections[using]
+    if event_triggers_enabled():
+        install_event_triggers(connection)
+    else:
+        remove_event_triggers(connection)
+
+
+def register_sqlite_actor_function(sender, connection, **kwargs):
+    """connection_created hook: give SQLite triggers the current actor."""
+    if connection.vendor == 'sqlite':
+        connection.connection.create_function(
+            SQLITE_ACTOR_FUNCTION, 0, lambda: getattr(_sqlite_actor, 'user_id', None)
+        )
+
+
+@contextmanager
+def set_event_actor(user_id, connection=default_connection):
+    """
+    Attribute the events the triggers write inside the block to
+    ``user_id``. A no-op unless TODO_EVENT_LOGGING is 'triggers'.
+    """
+    if not event_triggers_enabled():
+        yield
+        return
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT set_config(%s, %s, false)", [ACTOR_SETTING, str(user_id)])
+        try:
+            yield
+        finally:
+            # Session level, so reset it before the connection is reused
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT set_config(%s, '', false)", [ACTOR_SETTING])
+    else:
+        _sqlite_actor.user_id = user_id
+        try:
+            yield
+        finally:
+            _sqlite_actor.user_id = None
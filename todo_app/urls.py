@@ -13,7 +13,10 @@ urlpatterns = [
     path('todos/', views.TodoListView.as_view(), name='index'),
     path('todos/create/', views.CreateTodoView.as_view(), name='create'),
     path('todos/<int:pk>/toggle/', views.ToggleTodoView.as_view(), name='toggle'),
+    path('todos/<int:pk>/status/', views.TodoStatusView.as_view(), name='set_status'),
     path('todos/<int:pk>/edit/', views.EditTodoView.as_view(), name='edit'),
+    path('todos/<int:pk>/stop-recurrence/', views.StopRecurrenceView.as_view(), name='stop_recurrence'),
+    path('todos/<int:pk>/move/', views.MoveTodoView.as_view(), name='move'),
     path('todos/<int:pk>/soft-delete/', views.SoftDeleteTodoView.as_view(), name='soft_delete'),
     
     # Deleted todos management
@@ -21,8 +24,37 @@ urlpatterns = [
     path('todos/<int:pk>/restore/', views.RestoreTodoView.as_view(), name='restore'),
     path('todos/<int:pk>/hard-delete/', views.HardDeleteTodoView.as_view(), name='hard_delete'),
     
+    # Subtasks
+    path('todos/<int:pk>/subtasks/', views.SubtasksView.as_view(), name='subtasks'),
+    path('todos/<int:pk>/description/', views.TodoDescriptionView.as_view(), name='description'),
+    
+    # Attachments: chunked, resumable uploads and ranged downloads
+    path('todos/<int:pk>/attachments/', views.AttachmentsView.as_view(), name='attachments'),
+    path('todos/<int:pk>/attachments/uploads/<uuid:upload_id>/', views.AttachmentUploadView.as_view(), name='attachment_upload'),
+    path('attachments/<int:pk>/', views.AttachmentDownloadView.as_view(), name='attachment'),
+    path('attachments/<int:pk>/delete/', views.DeleteAttachmentView.as_view(), name='delete_attachment'),
+    
     # History
     path('todos/<int:pk>/history/', views.TodoHistoryView.as_view(), name='history'),
+    path('todos/<int:pk>/history/<int:event_id>/', views.TodoAsOfView.as_view(), name='as_of'),
+    path('todos/<int:pk>/history/<int:event_id>/undo/', views.UndoToEventView.as_view(), name='undo_to'),
+    
+    # User-wide activity feed
+    path('todos/activity/', views.ActivityFeedView.as_view(), name='activity'),
+    path('todos/activity/load-more/', views.LoadMoreActivityView.as_view(), name='load_more_activity'),
+    
+    # Shared lists and their members
+    path('lists/', views.TodoListsView.as_view(), name='lists'),
+    path('lists/<int:pk>/members/', views.ListMembersView.as_view(), name='list_members'),
+    path('lists/<int:pk>/members/<int:user_id>/remove/', views.RemoveListMemberView.as_view(), name='remove_list_member'),
+    
+    # Productivity dashboard (reads DailyTodoStats rollups only)
+    path('todos/dashboard/', views.ProductivityDashboardView.as_view(), name='dashboard'),
+    
+    # JSON API
+    path('api/todos/', views.ApiTodosView.as_view(), name='api_todos'),
+    path('api/todos/batch/', views.ApiTodoBatchView.as_view(), name='api_todo_batch'),
+    path('api/activity/', views.ApiActivityView.as_view(), name='api_activity'),
     
     # Infinite scroll endpoints
     path('todos/load-more/', views.LoadMoreTodosView.as_view(), name='load_more_todos'),
@@ -32,6 +64,7 @@ urlpatterns = [
     # Root redirect
     path('', views.TodoListView.as_view(), name='home'),
     path("mail-todos/", views.MailTodosView.as_view(), name="mail_todos"),
+    path("mail-todos/status/", views.MailTodosStatusView.as_view(), name="mail_todos_status"),
 
 ]
 
@@ -1,16 +1,153 @@
-from django.http import JsonResponse
+import json
+import os
+import re
+from calendar import timegm
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, render, redirect
-from django.views.generic import View, TemplateView
+from django.urls import reverse
+from django.views.generic.base import View, TemplateView
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.core.paginator import Paginator
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe, quote_etag
+from django.utils.cache import get_conditional_response
+from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
+from django.db import transaction
+from django.db.models import F, Sum
 
-from todo_app.tasks import send_todos_email
 # from django.contrib.auth.mixins import LoginRequiredMixin
 # from django.contrib.auth.views import LogoutView as AuthLogoutView
-from .models import Todo, TodoEvent
+from . import api
+from .access import list_role
+from .attachments import (
+    QuotaExceeded, attachment_storage, chunk_size, discard_uploads, finalize, max_size, parse_range,
+    read_range, release_attachments, start_upload, usage_summary, write_chunk,
+)
+from .history import UNDO_FIELDS, current_state, state_as_of
+from .middleware import RateLimitMiddleware
+from .models import (
+    Attachment, AttachmentUpload, DailyTodoStats, ListMembership, RecurrenceRule, Tag, Todo, TodoEvent, TodoList,
+)
+from .pagination import keyset_page
+from .recurrence import materialize, recurrence_horizon
+from .signals import log_todo_event
+
+User = get_user_model()
+
+def _parse_due_at(request):
+    """
+    Parse the optional due_at form field (datetime-local, user's timezone).
+    Returns (due_at or None, error message or None).
+    """
+    raw = request.POST.get('due_at', '').strip()
+    if not raw:
+        return None, None
+    try:
+        due_at = parse_datetime(raw)
+    except ValueError:
+        due_at = None
+    if due_at is None:
+        return None, 'Invalid due date'
+    if timezone.is_naive(due_at):
+        due_at = timezone.make_aware(due_at)
+    return due_at, None
+
+
+def _parse_tags(request):
+    """Parse the comma-separated tags field into unique, lowercase names."""
+    names = []
+    for name in request.POST.get('tags', '').split(','):
+        name = name.strip().lower()[:50]
+        if name and name not in names:
+            names.append(name)
+    return names[:10]
+
+
+def _status_filter(request):
+    """Return the requested ?status= value if it is a valid Todo status, else None."""
+    status = request.GET.get('status')
+    if status in dict(Todo.STATUS_CHOICES):
+        return status
+    return None
+
+
+def _tag_filter(request):
+    """Return the requested ?tag= id as an int, else None."""
+    try:
+        return int(request.GET['tag'])
+    except (KeyError, ValueError):
+        return None
+
+
+def _list_filter(request):
+    """Return the requested ?list= id as an int, else None."""
+    try:
+        return int(request.GET['list'])
+    except (KeyError, ValueError):
+        return None
+
+
+def _scoped_todos(request, todo_list_id):
+    """
+    Active top-level todos of one list: the user's personal todos when
+    ``todo_list_id`` is None, else the shared list's todos.
+    
+    The list role comes from access.list_role (cached), so a whole page is
+    authorized once rather than per row, and the todo query itself needs
+    no membership join. Raises Http404 for lists the user is not on.
+    """
+    if todo_list_id is None:
+        return Todo.objects.active().top_level().filter(user=request.user, todo_list__isnull=True)
+    if list_role(request, todo_list_id) is None:
+        raise Http404("No such list")
+    return Todo.objects.active().top_level().filter(todo_list_id=todo_list_id)
+
+
+def _filtered_todos(request):
+    """
+    The active top-level todos of the requested list for the list and
+    load-more views, with the ?status= and ?tag= filters applied and tags
+    prefetched for the page. Subtasks are shown under their parent, not in
+    the list itself.
+    
+    Returns (todos, filters, filter_query) where filter_query is appended to
+    the infinite-scroll URL so later pages keep the same filters.
+    """
+    todo_list = _list_filter(request)
+    todos = _scoped_todos(request, todo_list).order_by('rank', '-created_at')
+    status = _status_filter(request)
+    if status:
+        todos = todos.with_status(status)
+    tag = _tag_filter(request)
+    if tag is not None:
+        # Joins TodoTag through its (tag, todo) index
+        todos = todos.filter(tags__id=tag)
+    
+    filters = {'list': todo_list, 'status': status, 'tag': tag}
+    filter_query = ''.join(
+        f'&{key}={value}' for key, value in filters.items() if value is not None
+    )
+    # One query for the whole page's tags instead of one per item, and
+    # only a preview of each description
+    return todos.prefetch_related('tags').with_description_preview(), filters, filter_query
+
+
+def _attach_subtask_progress(page_obj):
+    """
+    Set subtask_total/subtask_done on every todo of the page with one
+    closure-table query for the whole page.
+    """
+    todos = list(page_obj)
+    progress = Todo.objects.subtree_progress([todo.pk for todo in todos])
+    for todo in todos:
+        todo.subtask_total, todo.subtask_done = progress.get(todo.pk, (0, 0))
+    return page_obj
+
 
 class TodoListView(TemplateView):
     """
@@ -37,19 +174,34 @@ class TodoListView(TemplateView):
         print("Current User:")
         print(self.request.user)
 
-        todos = Todo.objects.active().filter(user=self.request.user).order_by('-created_at')
+        todos, filters, filter_query = _filtered_todos(self.request)
+        status_counts = _scoped_todos(self.request, filters['list']).status_counts()
         paginator = Paginator(todos, per_page)
         
         try:
             page_obj = paginator.page(page)
         except:
             page_obj = paginator.page(1)
+        _attach_subtask_progress(page_obj)
         
         context.update({
             'todos': page_obj,
             'has_next': page_obj.has_next(),
             'next_page': page_obj.next_page_number() if page_obj.has_next() else None,
             'current_page': page,
+            'status': filters['status'],
+            'tag': filters['tag'],
+            'filter_query': filter_query,
+            'todo_list': TodoList.objects.filter(pk=filters['list']).first() if filters['list'] else None,
+            'list_role': list_role(self.request, filters['list']) if filters['list'] else None,
+            # Prefix for the filter links so they stay on this list
+            'list_param': f"list={filters['list']}&" if filters['list'] else '',
+            'total_count': status_counts['all'],
+            'status_facets': [
+                (value, label, status_counts[value]) for value, label in Todo.STATUS_CHOICES
+            ],
+            # Counts are stored on the tag, no GROUP BY here
+            'tags': Tag.objects.filter(user=self.request.user, todo_count__gt=0),
         })
         return context
 
@@ -75,8 +227,34 @@ class CreateTodoView(View):
         if not title:
             return JsonResponse({'error': 'Title is required'}, status=400)
         
-        # Check for duplicate title for this user only
-        if Todo.objects.active().filter(user=request.user, title__iexact=title).exists():
+        due_at, error = _parse_due_at(request)
+        if error:
+            return JsonResponse({'error': error}, status=400)
+        
+        # Subtasks can only hang off active todos the user may edit, and
+        # live in their parent's list
+        parent = None
+        todo_list_id = _posted_pk(request, 'list')
+        if request.POST.get('parent'):
+            parent = Todo.objects.active().visible_to(
+                request.user, ListMembership.WRITE_ROLES
+            ).filter(pk=_posted_pk(request, 'parent')).first()
+            if parent is None:
+                return JsonResponse({'error': 'Parent todo not found'}, status=400)
+            todo_list_id = parent.todo_list_id
+        elif todo_list_id is not None and list_role(request, todo_list_id) not in ListMembership.WRITE_ROLES:
+            return JsonResponse({'error': 'You cannot add todos to this list'}, status=403)
+        
+        repeat = request.POST.get('repeat', '')
+        if repeat:
+            if repeat not in dict(RecurrenceRule.FREQUENCY_CHOICES) or parent is not None:
+                return JsonResponse({'error': 'Invalid repeat option'}, status=400)
+            if due_at is None:
+                return JsonResponse({'error': 'Recurring todos need a due date to start from'}, status=400)
+            return _create_recurring(request, title, description, due_at, repeat, todo_list_id)
+        
+        # Check for duplicate title in the same list only
+        if _title_taken(request, title, todo_list_id):
             return JsonResponse({'error': 'A todo with this title already exists'}, status=400)
         
         # Create todo with the current user
@@ -87,8 +265,14 @@ class CreateTodoView(View):
             title=title, 
             description=description,
             user=request.user,  # Assign the current user
-            status='pending'  # Default status
+            status='pending',  # Default status
+            due_at=due_at,
+            parent=parent,
+            todo_list_id=todo_list_id,
+            # New todos go on top of the manually ordered list
+            rank=Todo.objects.top_rank(request.user, todo_list_id) if parent is None else 0.0,
         )
+        todo.tags.set(Tag.objects.for_names(request.user, _parse_tags(request)))
         # Create event with the current user
         # TodoEvent.objects.create(
         #     user=request.user,  # Assign the current user
@@ -99,11 +283,41 @@ class CreateTodoView(View):
 
         
         if request.htmx:
+            if parent is not None:
+                # Added from a subtask panel: redraw that panel
+                return _subtasks_response(request, request.POST.get('root') or parent.pk)
             # Return the new todo item
             return render(request, 'partials/todo_item.html', {'todo': todo})
         return redirect('todo_app:index')
 
 
+def _create_recurring(request, title, description, starts_at, frequency, todo_list_id):
+    """
+    Create a RecurrenceRule and materialize its occurrences inside the
+    horizon right away (the scheduler does the rest as time moves on).
+    """
+    with transaction.atomic():
+        rule = RecurrenceRule.objects.create(
+            user=request.user, todo_list_id=todo_list_id, title=title,
+            description=description, frequency=frequency, starts_at=starts_at,
+        )
+        todos = materialize([rule], recurrence_horizon())
+    
+    if request.htmx:
+        # Same markup as an infinite-scroll page, without a next page
+        return render(request, 'partials/load_more_todos.html', {'todos': todos, 'has_next': False})
+    return redirect('todo_app:index')
+
+
+def _title_taken(request, title, todo_list_id, exclude_pk=None):
+    """Whether an active todo in the same list (or personal todos) has the title."""
+    if todo_list_id is None:
+        todos = Todo.objects.active().filter(user=request.user, todo_list__isnull=True)
+    else:
+        todos = Todo.objects.active().filter(todo_list_id=todo_list_id)
+    return todos.exclude(pk=exclude_pk).filter(title__iexact=title).exists()
+
+
 class ToggleTodoView(View):
     """
     Toggle completion status of a todo item.
@@ -115,27 +329,181 @@ class ToggleTodoView(View):
         return super().dispatch(*args, **kwargs)
     
     def post(self, request, pk):
-        # Only allow toggling todos that belong to the current user
-        todo = get_object_or_404(Todo.objects.active().filter(user=request.user), pk=pk)
-        todo.completed = not todo.completed
-        todo.save()
-        
-        # event_type = (
-        #     TodoEvent.TODO_CHECKED
-        #     if todo.completed
-        #     else TodoEvent.TODO_UNCHECKED
-        # )
-        
-        # TodoEvent.objects.create(
-        #     user=request.user,  # Assign the current user
-        #     todo=todo,
-        #     event_type=event_type,
-        #     details={'completed': todo.completed, 'title': todo.title}
-        # )
+        # Flip completed in one conditional UPDATE. Only the current user's
+        # active todo matches, and a stale version means another tab won.
+        with transaction.atomic():
+            todo = Todo.objects.compare_and_set(
+                pk, request.user, version=_posted_version(request), toggle_completed=True
+            )
+            if todo is not None:
+                event_type = (
+                    TodoEvent.TODO_CHECKED
+                    if todo.completed
+                    else TodoEvent.TODO_UNCHECKED
+                )
+                log_todo_event(
+                    todo, event_type,
+                    {'completed': todo.completed, 'title': todo.title},
+                    user=request.user,
+                )
         
+        if todo is None:
+            return _conflict_response(request, pk)
+        if request.GET.get('root'):
+            # Toggled inside a subtask panel: redraw it with fresh progress
+            return _subtasks_response(request, request.GET['root'])
         return render(request, 'partials/todo_item.html', {'todo': todo})
 
 
+class TodoStatusView(View):
+    """
+    Start or pause work on an open todo (pending <-> in progress).
+    
+    Completion still goes through the checkbox; a completed todo cannot be
+    moved to another status here.
+    """
+    
+    @method_decorator(login_required(login_url='/accounts/login/'))
+    def dispatch(self, *args, **kwargs):
+        return super().dispatch(*args, **kwargs)
+    
+    def post(self, request, pk):
+        status = request.POST.get('status')
+        if status not in (Todo.STATUS_PENDING, Todo.STATUS_IN_PROGRESS):
+            return JsonResponse({'error': 'Status must be pending or in_progress'}, status=400)
+        todo = get_object_or_404(Todo.objects.active().visible_to(request.user, ListMembership.WRITE_ROLES), pk=pk)
+        if todo.completed:
+            return JsonResponse({'error': 'Completed todos have no work status'}, status=400)
+        
+        # Pinned to the version read above, so a completion in between wins
+        version = _posted_version(request)
+        with transaction.atomic():
+            updated = Todo.objects.compare_and_set(
+                pk, request.user, version=todo.version if version is None else version, status=status
+            )
+            if updated is not None and todo.status != status:
+                log_todo_event(
+                    updated, TodoEvent.TODO_UPDATED,
+                    {'old': {'status': todo.status}, 'new': {'status': status}},
+                    user=request.user,
+                )
+        
+        if updated is None:
+            return _conflict_response(request, pk)
+        return render(request, 'partials/todo_item.html', {'todo': updated})
+
+
+class StopRecurrenceView(View):
+    """
+    Stop a todo's recurrence: no new occurrences, and the pending future
+    ones already materialized go to the trash with one UPDATE.
+    """
+    
+    @method_decorator(login_required(login_url='/accounts/login/'))
+    def dispatch(self, *args, **kwargs):
+        return super().dispatch(*args, **kwargs)
+    
+    def post(self, request, pk):
+        todo = get_object_or_404(
+            Todo.objects.active().visible_to(request.user, ListMembership.WRITE_ROLES)
+            .filter(recurrence__isnull=False),
+            pk=pk,
+        )
+        now = timezone.now()
+        with transaction.atomic():
+            RecurrenceRule.objects.filter(pk=todo.recurrence_id).update(is_active=False, next_occurrence_at=None)
+            Todo.objects.filter(
+                recurrence_id=todo.recurrence_id, occurrence_at__gt=now,
+                completed=False, is_deleted=False,
+            ).update(is_deleted=True, deleted_at=now)
+        
+        if request.htmx:
+            # Several cards may have gone; reload the list
+            return HttpResponse(headers={'HX-Refresh': 'true'})
+        return redirect('todo_app:index')
+
+
+class MoveTodoView(View):
+    """
+    Move a todo to a new place in the manually ordered list.
+    
+    The client posts the ids of its new neighbours: ``after`` (the todo now
+    above it) and/or ``before`` (the todo now below it). Only the moved row
+    is written, with a rank between the two.
+    """
+    
+    @method_decorator(login_required(login_url='/accounts/login/'))
+    def dispatch(self, *args, **kwargs):
+        return super().dispatch(*args, **kwargs)
+    
+    def post(self, request, pk):
+        after_pk, before_pk = _posted_pk(request, 'after'), _posted_pk(request, 'before')
+        # The moved todo and both neighbour ranks in one query, authorized
+        # by the same membership probe as every other write
+        rows = {
+            row_pk: (rank, todo_list_id)
+            for row_pk, rank, todo_list_id in Todo.objects.active().top_level()
+            .visible_to(request.user, ListMembership.WRITE_ROLES)
+            .filter(pk__in=[pk, after_pk, before_pk])
+            .values_list('pk', 'rank', 'todo_list_id')
+        }
+        if pk not in rows:
+            return JsonResponse({'error': 'Todo not found'}, status=404)
+        todo_list_id = rows[pk][1]
+        # Neighbours only count if they are in the same list
+        above, below = (
+            rows[key][0] if key in rows and key != pk and rows[key][1] == todo_list_id else None
+            for key in (after_pk, before_pk)
+        )
+        
+        if above is None and below is None:
+            return JsonResponse({'error': 'Unknown position'}, status=400)
+        if above is None:
+            rank = below - Todo.RANK_STEP
+        elif below is None:
+            rank = above + Todo.RANK_STEP
+        else:
+            rank = (above + below) / 2
+        
+        Todo.objects.filter(pk=pk).update(rank=rank, version=F('version') + 1, updated_at=timezone.now())
+        
+        if above is not None and below is not None and below - above < Todo.RANK_MIN_GAP:
+            from .tasks import enqueue_rank_rebalance
+            transaction.on_commit(lambda: enqueue_rank_rebalance(request.user.id, todo_list_id))
+        # Nothing to swap, the client already moved the card
+        return HttpResponse(status=204)
+
+
+def _posted_pk(request, key):
+    """Return the POSTed todo id under ``key`` as an int, else None."""
+    try:
+        return int(request.POST[key])
+    except (KeyError, ValueError):
+        return None
+
+
+def _posted_version(request):
+    """Return the todo version the client last saw, or None if not sent."""
+    try:
+        return int(request.POST['version'])
+    except (KeyError, ValueError):
+        return None
+
+
+def _conflict_response(request, pk):
+    """
+    The conditional UPDATE matched nothing: 404 if the todo is gone, 403 if
+    the user may only read it, otherwise 409 with the current item so HTMX
+    can swap in fresh state.
+    """
+    todo = get_object_or_404(Todo.objects.active().visible_to(request.user), pk=pk)
+    if not Todo.objects.visible_to(request.user, ListMembership.WRITE_ROLES).filter(pk=pk).exists():
+        return JsonResponse({'error': 'You cannot change todos in this list'}, status=403)
+    if request.htmx:
+        return render(request, 'partials/todo_item.html', {'todo': todo}, status=409)
+    return JsonResponse({'error': 'This todo was changed elsewhere, please retry'}, status=409)
+
+
 class EditTodoView(View):
     """
     Handle editing of todo items.
@@ -146,66 +514,70 @@ class EditTodoView(View):
         return super().dispatch(*args, **kwargs)
     
     def get(self, request, pk):
-        # Only allow editing todos that belong to the current user
-        todo = get_object_or_404(Todo.objects.active().filter(user=request.user), pk=pk)
+        # Only allow editing todos the current user may write to
+        todo = get_object_or_404(Todo.objects.active().visible_to(request.user, ListMembership.WRITE_ROLES), pk=pk)
         return render(request, 'partials/todo_edit_form.html', {'todo': todo})
     
     def post(self, request, pk):
-        # Only allow editing todos that belong to the current user
-        todo = get_object_or_404(Todo.objects.active().filter(user=request.user), pk=pk)
+        # Only allow editing todos the current user may write to
+        todo = get_object_or_404(Todo.objects.active().visible_to(request.user, ListMembership.WRITE_ROLES), pk=pk)
         title = request.POST.get('title', '').strip()
         description = request.POST.get('description', '').strip()
         
         if not title:
             return JsonResponse({'error': 'Title required'}, status=400)
         
-        # Check for duplicate title for this user only (excluding current todo)
-        if Todo.objects.active().filter(user=request.user).exclude(pk=todo.pk).filter(title__iexact=title).exists():
+        due_at, error = _parse_due_at(request)
+        if error:
+            return JsonResponse({'error': error}, status=400)
+        
+        # Check for duplicate title in the same list only (excluding current todo)
+        if _title_taken(request, title, todo.todo_list_id, exclude_pk=todo.pk):
             return JsonResponse({'error': 'A todo with this title already exists'}, status=400)
         
-        if todo.title.lower() == title.lower() and todo.description == description:
+        tag_names = _parse_tags(request)
+        old_tag_names = sorted(tag.name for tag in todo.tags.all())
+        tags_changed = sorted(tag_names) != old_tag_names
+        
+        if (todo.title.lower() == title.lower() and todo.description == description
+                and todo.due_at == due_at and not tags_changed):
             return JsonResponse({'error': 'No changes detected'}, status=400)
         
         old_data = {'title': todo.title, 'description': todo.description}
+        new_data = {'title': title, 'description': description}
+        extra = {}
+        if todo.due_at != due_at:
+            old_data['due_at'] = todo.due_at.isoformat() if todo.due_at else None
+            new_data['due_at'] = due_at.isoformat() if due_at else None
+            # A new deadline gets a fresh reminder
+            extra = {'due_at': due_at, 'reminder_sent_at': None}
+        if tags_changed:
+            old_data['tags'] = old_tag_names
+            new_data['tags'] = sorted(tag_names)
         
-        # Task 5: Use ORM update method for better performance instead of save()
-
-        # so 2 methods 
-        # 1] -  todo = get_object_or_404(Todo.objects.active().filter(user=request.user), pk=pk)
-        #       todo.title = title
-        #       todo.description = description
-        #       todo.save()
-        # 2] - below code
-        # Todo.objects.filter(pk=todo.pk).update(
-        #     title=title,
-        #     description=description,
-        #     updated_at=timezone.now()
-        # )
-        # Refresh the todo object from database
-        # reloads fresh values from DB into todo instance 
-        # todo.refresh_from_db()
-
-
-        # 3] - using signals as in signals.py file
-        todo._current_user = request.user  # Attach user for signal
-        todo.title = title
-        todo.description = description
-        todo.save()
-        # This will trigger the signal to log the update event
-        
-        
-        
-        # TodoEvent.objects.create(
-        #     user=request.user,  # Assign the current user
-        #     todo=todo,
-        #     event_type=TodoEvent.TODO_UPDATED,
-        #     details={
-        #         'old': old_data,
-        #         'new': {'title': title, 'description': description}
-        #     }
-        # )
+        # Write only title/description, and only if nobody changed the todo
+        # since the form was rendered (or since the SELECT above)
+        version = _posted_version(request)
+        with transaction.atomic():
+            updated = Todo.objects.compare_and_set(
+                todo.pk, request.user,
+                version=todo.version if version is None else version,
+                title=title,
+                description=description,
+                **extra,
+            )
+            if updated is not None:
+                if tags_changed:
+                    updated.tags.set(Tag.objects.for_names(request.user, tag_names))
+                log_todo_event(
+                    updated, TodoEvent.TODO_UPDATED,
+                    {'old': old_data, 'new': new_data},
+                    user=request.user,
+                )
         
-        return render(request, 'partials/todo_item.html', {'todo': todo})
+        if updated is None:
+            return _conflict_response(request, pk)
+        return render(request, 'partials/todo_item.html', {'todo': updated})
 
 
 class SoftDeleteTodoView(View):
@@ -218,9 +590,11 @@ class SoftDeleteTodoView(View):
         return super().dispatch(*args, **kwargs)
     
     def post(self, request, pk):
-        # Only allow deleting todos that belong to the current user
-        todo = get_object_or_404(Todo.objects.active().filter(user=request.user), pk=pk)
+        # Only allow deleting todos the current user may write to
+        todo = get_object_or_404(Todo.objects.active().visible_to(request.user, ListMembership.WRITE_ROLES), pk=pk)
         
+        # Log the member who deleted it, not the todo's owner
+        todo._current_user = request.user
         todo.soft_delete()
         # this have save() which will trigger signal
         
@@ -252,8 +626,8 @@ class DeletedTodosView(TemplateView):
         page = int(self.request.GET.get('page', 1))
         per_page = 5
         
-        # Only get deleted todos for the current user
-        todos = Todo.objects.deleted().filter(user=self.request.user).order_by('-deleted_at')
+        # Only get deleted todos the current user may restore
+        todos = Todo.objects.deleted_roots().visible_to(self.request.user, ListMembership.WRITE_ROLES).with_description_preview().order_by('-deleted_at')
         paginator = Paginator(todos, per_page)
         
         try:
@@ -280,9 +654,10 @@ class RestoreTodoView(View):
         return super().dispatch(*args, **kwargs)
     
     def post(self, request, pk):
-        # Only allow restoring todos that belong to the current user
-        todo = get_object_or_404(Todo.objects.deleted().filter(user=request.user), pk=pk)
+        # Only allow restoring todos the current user may write to
+        todo = get_object_or_404(Todo.objects.deleted().visible_to(request.user, ListMembership.WRITE_ROLES), pk=pk)
         
+        todo._current_user = request.user
         todo.restore()
         # this have save() which will trigger signal
         
@@ -303,7 +678,7 @@ class RestoreTodoView(View):
 
 class HardDeleteTodoView(View):
     """
-    Permanently delete a todo item and all associated events.
+    Permanently delete a todo item and all associated events, keeping a tombstone.
     """
     
     @method_decorator(login_required(login_url='/accounts/login/'))
@@ -311,18 +686,12 @@ class HardDeleteTodoView(View):
         return super().dispatch(*args, **kwargs)
     
     def post(self, request, pk):
-        # Only allow hard deleting todos that belong to the current user
-        todo = get_object_or_404(Todo.objects.deleted().filter(user=request.user), pk=pk)
-        
-        # Log event before deletion
-        TodoEvent.objects.create(
-            user=request.user,  # Assign the current user
-            todo=todo,
-            event_type=TodoEvent.TODO_PERMANENTLY_DELETED,
-            details={'title': todo.title}
-        )
+        # Only the owner of a personal todo, or a list owner, may hard delete
+        todo = get_object_or_404(Todo.objects.deleted().visible_to(request.user, ListMembership.MANAGE_ROLES), pk=pk)
         
-        todo.delete()  # This cascades to delete related events
+        # Deletes events in raw batches and records a TodoTombstone, which
+        # outlives the todo (a TodoEvent here would be cascaded away)
+        todo.hard_delete(user=request.user)
         
         if request.htmx:
             return render(request, 'partials/empty.html')
@@ -339,8 +708,8 @@ class TodoHistoryView(View):
         return super().dispatch(*args, **kwargs)
     
     def get(self, request, pk):
-        # Only allow viewing history for todos that belong to the current user
-        todo = get_object_or_404(Todo.objects.active().filter(user=request.user), pk=pk)
+        # Only allow viewing history for todos the current user can see
+        todo = get_object_or_404(Todo.objects.active().visible_to(request.user), pk=pk)
         page = int(request.GET.get('page', 1))
         per_page = 3
         
@@ -360,6 +729,248 @@ class TodoHistoryView(View):
         })
 
 
+def _subtasks_response(request, root_pk):
+    """
+    Render the subtask panel of ``root_pk``: the whole subtree from one
+    closure-table query, nested in Python, plus one query for progress.
+    """
+    root = get_object_or_404(Todo.objects.active().visible_to(request.user), pk=root_pk)
+    descendants = list(
+        Todo.objects.subtree(root).filter(is_deleted=False).order_by('depth', 'created_at')
+    )
+    progress = Todo.objects.subtree_progress([root.pk] + [todo.pk for todo in descendants])
+    
+    children = {}
+    for todo in descendants:
+        todo.subtask_total, todo.subtask_done = progress.get(todo.pk, (0, 0))
+        children.setdefault(todo.parent_id, []).append(todo)
+    
+    # Depth-first order so each subtask is listed right under its parent.
+    # A child of a deleted subtask has no visible parent and is skipped.
+    nodes, stack = [], list(reversed(children.get(root.pk, [])))
+    while stack:
+        todo = stack.pop()
+        nodes.append(todo)
+        stack.extend(reversed(children.get(todo.pk, [])))
+    
+    root.subtask_total, root.subtask_done = progress.get(root.pk, (0, 0))
+    return render(request, 'partials/subtasks.html', {'root': root, 'nodes': nodes})
+
+
+class SubtasksView(View):
+    """
+    Show a todo's subtasks at every depth, with completion progress.
+    """
+    
+    @method_decorator(login_required(login_url='/accounts/login/'))
+    def dispatch(self, *args, **kwargs):
+        return super().dispatch(*args, **kwargs)
+    
+    def get(self, request, pk):
+        return _subtasks_response(request, pk)
+
+
+def _attachments_response(request, todo, status=200):
+    """Render the attachment panel of ``todo``, with the user's quota."""
+    used, quota = usage_summary(request.user.pk)
+    return render(request, 'partials/attachments.html', {
+        'todo': todo,
+        'attachments': todo.attachments.all(),
+        'can_write': Todo.objects.visible_to(request.user, ListMembership.WRITE_ROLES).filter(pk=todo.pk).exists(),
+        'used': used,
+        'quota': quota,
+    }, status=status)
+
+
+class AttachmentsView(View):
+    """
+    GET: the attachment panel of a todo.
+    POST: start (or resume) a chunked upload; see attachments.py.
+    """
+    
+    @method_decorator(login_required(login_url='/accounts/login/'))
+    def dispatch(self, *args, **kwargs):
+        return super().dispatch(*args, **kwargs)
+    
+    def get(self, request, pk):
+        todo = get_object_or_404(Todo.objects.active().visible_to(request.user), pk=pk)
+        return _attachments_response(request, todo)
+    
+    def post(self, request, pk):
+        todo = get_object_or_404(Todo.objects.active().visible_to(request.user, ListMembership.WRITE_ROLES), pk=pk)
+        name = os.path.basename(request.POST.get('name', '').strip())[:255]
+        content_type = request.POST.get('content_type', '').strip()[:100] or 'application/octet-stream'
+        try:
+            size = int(request.POST.get('size', ''))
+        except ValueError:
+            size = 0
+        
+        if not name:
+            return JsonResponse({'error': 'File name is required'}, status=400)
+        if size <= 0:
+            return JsonResponse({'error': 'File is empty'}, status=400)
+        if size > max_size():
+            return JsonResponse({'error': 'File is too large'}, status=413)
+        
+        # Same file again (e.g. after a reload): continue where it stopped.
+        # Its size is already reserved.
+        upload = AttachmentUpload.objects.filter(todo=todo, user=request.user, name=name, size=size).first()
+        created = False
+        if upload is None:
+            try:
+                upload, created = start_upload(todo, request.user, name, size, content_type)
+            except QuotaExceeded:
+                return JsonResponse({'error': 'Not enough storage left'}, status=413)
+        return JsonResponse({
+            'upload_url': reverse('todo_app:attachment_upload', args=[todo.pk, upload.pk]),
+            'offset': upload.received,
+            'chunk_size': chunk_size(),
+        }, status=201 if created else 200)
+
+
+class AttachmentUploadView(View):
+    """
+    One resumable upload. GET reports the offset to continue from, PUT
+    appends a chunk (raw body with Content-Range: bytes start-end/size),
+    DELETE abandons the upload.
+    """
+    
+    CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+    
+    @method_decorator(login_required(login_url='/accounts/login/'))
+    def dispatch(self, *args, **kwargs):
+        return super().dispatch(*args, **kwargs)
+    
+    def _upload(self, request, pk, upload_id):
+        # Writable todos only, so losing access stops an upload mid-way
+        return get_object_or_404(
+            AttachmentUpload.objects.filter(
+                todo__in=Todo.objects.active().visible_to(request.user, ListMembership.WRITE_ROLES)
+            ),
+            pk=upload_id, todo_id=pk, user=request.user,
+        )
+    
+    def get(self, request, pk, upload_id):
+        upload = self._upload(request, pk, upload_id)
+        return JsonResponse({'offset': upload.received, 'size': upload.size})
+    
+    def put(self, request, pk, upload_id):
+        upload = self._upload(request, pk, upload_id)
+        match = self.CONTENT_RANGE.match(request.headers.get('Content-Range', ''))
+        if match is None:
+            return JsonResponse({'error': 'Content-Range is required'}, status=400)
+        start, end, total = (int(value) for value in match.groups())
+        length = end - start + 1
+        if total != upload.size or end >= total or length <= 0:
+            return JsonResponse({'error': 'Content-Range does not match the upload'}, status=400)
+        if length > chunk_size():
+            return JsonResponse({'error': 'Chunk is too large'}, status=413)
+        if request.META.get('CONTENT_LENGTH') != str(length):
+            return JsonResponse({'error': 'Content-Length does not match Content-Range'}, status=400)
+        if start != upload.received:
+            # Lost response or a parallel retry: tell the client where we are
+            return JsonResponse({'offset': upload.received}, status=409)
+        
+        if not write_chunk(upload, start, request, length):
+            upload.refresh_from_db(fields=['received'])
+            return JsonResponse({'offset': upload.received}, status=409)
+        if upload.received < upload.size:
+            return JsonResponse({'offset': upload.received})
+        
+        attachment = finalize(upload)
+        return JsonResponse({'offset': upload.size, 'complete': True, 'attachment': attachment.pk})
+    
+    def delete(self, request, pk, upload_id):
+        upload = self._upload(request, pk, upload_id)
+        with transaction.atomic():
+            discard_uploads(AttachmentUpload.objects.filter(pk=upload.pk))
+        return HttpResponse(status=204)
+
+
+class AttachmentDownloadView(View):
+    """
+    Download an attachment, with conditional requests (ETag is the content
+    hash) and single HTTP ranges.
+    
+    Whole files go out through FileResponse, which hands the open file to
+    the server's wsgi.file_wrapper (sendfile where available); ranges are
+    streamed in small reads. With TODO_ATTACHMENT_ACCEL_REDIRECT set, the
+    web server sends the file itself (and handles ranges).
+    """
+    
+    @method_decorator(login_required(login_url='/accounts/login/'))
+    def dispatch(self, *args, **kwargs):
+        return super().dispatch(*args, **kwargs)
+    
+    def get(self, request, pk):
+        attachment = get_object_or_404(
+            Attachment.objects.filter(todo__in=Todo.objects.visible_to(request.user)), pk=pk
+        )
+        etag = quote_etag(attachment.sha256)
+        last_modified = timegm(attachment.created_at.utctimetuple())
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+        
+        headers = {
+            'ETag': etag,
+            'Last-Modified': http_date(last_modified),
+            'Accept-Ranges': 'bytes',
+            'Content-Disposition': content_disposition_header(True, attachment.name),
+        }
+        accel_prefix = getattr(settings, 'TODO_ATTACHMENT_ACCEL_REDIRECT', None)
+        if accel_prefix:
+            headers['X-Accel-Redirect'] = accel_prefix + attachment.blob_name
+            return HttpResponse(content_type=attachment.content_type, headers=headers)
+        
+        path = attachment_storage().path(attachment.blob_name)
+        if not os.path.exists(path):
+            raise Http404("Attachment file is missing")
+        
+        # If-Range: only send a part of the file the client already has
+        if_range = request.headers.get('If-Range')
+        byte_range = None
+        if not if_range or if_range == etag or parse_http_date_safe(if_range) == last_modified:
+            try:
+                byte_range = parse_range(request.headers.get('Range'), attachment.size)
+            except ValueError:
+                return HttpResponse(status=416, headers={'Content-Range': f'bytes */{attachment.size}'})
+        
+        if byte_range is None:
+            response = FileResponse(open(path, 'rb'), content_type=attachment.content_type)
+        else:
+            start, end = byte_range
+            response = StreamingHttpResponse(
+                read_range(path, start, end), status=206, content_type=attachment.content_type,
+            )
+            headers['Content-Range'] = f'bytes {start}-{end}/{attachment.size}'
+            headers['Content-Length'] = str(end - start + 1)
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
+
+class DeleteAttachmentView(View):
+    """
+    Delete an attachment, refund the uploader's quota and redraw the panel.
+    """
+    
+    @method_decorator(login_required(login_url='/accounts/login/'))
+    def dispatch(self, *args, **kwargs):
+        return super().dispatch(*args, **kwargs)
+    
+    def post(self, request, pk):
+        attachment = get_object_or_404(
+            Attachment.objects.filter(
+                todo__in=Todo.objects.active().visible_to(request.user, ListMembership.WRITE_ROLES)
+            ).select_related('todo'),
+            pk=pk,
+        )
+        with transaction.atomic():
+            release_attachments(Attachment.objects.filter(pk=attachment.pk))
+        return _attachments_response(request, attachment.todo)
+
+
 class LoadMoreTodosView(View):
     """
     Load more todos with infinite scroll.
@@ -374,18 +985,20 @@ class LoadMoreTodosView(View):
         per_page = 5
         
         # Only get todos for the current user
-        todos = Todo.objects.active().filter(user=request.user).order_by('-created_at')
+        todos, filters, filter_query = _filtered_todos(request)
         paginator = Paginator(todos, per_page)
         
         try:
             page_obj = paginator.page(page)
         except:
             return render(request, 'partials/empty.html')
+        _attach_subtask_progress(page_obj)
         
         context = {
             'todos': page_obj,
             'has_next': page_obj.has_next(),
             'next_page': page_obj.next_page_number() if page_obj.has_next() else None,
+            'filter_query': filter_query,
         }
         return render(request, 'partials/load_more_todos.html', context)
 
@@ -403,8 +1016,8 @@ class LoadMoreDeletedTodosView(View):
         page = int(request.GET.get('page', 2))
         per_page = 5
         
-        # Only get deleted todos for the current user
-        todos = Todo.objects.deleted().filter(user=request.user).order_by('-deleted_at')
+        # Only get deleted todos the current user may restore
+        todos = Todo.objects.deleted_roots().visible_to(request.user, ListMembership.WRITE_ROLES).with_description_preview().order_by('-deleted_at')
         paginator = Paginator(todos, per_page)
         
         try:
@@ -430,8 +1043,8 @@ class LoadMoreHistoryView(View):
         return super().dispatch(*args, **kwargs)
     
     def get(self, request, pk):
-        # Only allow loading more history for todos that belong to the current user
-        todo = get_object_or_404(Todo.objects.active().filter(user=request.user), pk=pk)
+        # Only allow loading more history for todos the current user can see
+        todo = get_object_or_404(Todo.objects.active().visible_to(request.user), pk=pk)
         page = int(request.GET.get('page', 2))
         per_page = 3
         
@@ -452,21 +1065,557 @@ class LoadMoreHistoryView(View):
         return render(request, 'partials/history_items.html', context)
 
 
+class TodoDescriptionView(View):
+    """
+    The full description of a list item, loaded when its preview is
+    expanded (list pages only send a preview, see with_description_preview).
+    """
+    
+    @method_decorator(login_required(login_url='/accounts/login/'))
+    def dispatch(self, *args, **kwargs):
+        return super().dispatch(*args, **kwargs)
+    
+    def get(self, request, pk):
+        # Deleted todos are listed too, so no active() here
+        todo = get_object_or_404(Todo.objects.visible_to(request.user).only('id', 'description'), pk=pk)
+        return render(request, 'partials/todo_description.html', {'todo': todo})
+
+
+class TodoAsOfView(View):
+    """
+    Show a todo as it was right after one of its events ("view as of").
+    """
+    
+    @method_decorator(login_required(login_url='/accounts/login/'))
+    def dispatch(self, *args, **kwargs):
+        return super().dispatch(*args, **kwargs)
+    
+    def get(self, request, pk, event_id):
+        todo = get_object_or_404(Todo.objects.active().visible_to(request.user), pk=pk)
+        state = state_as_of(todo, event_id)
+        if state is None:
+            raise Http404("No such event for this todo")
+        event = todo.events.only('id', 'event_type', 'timestamp').get(pk=event_id)
+        return render(request, 'partials/todo_as_of.html', {
+            'todo': todo,
+            'event': event,
+            'state': state,
+            'due_at': parse_datetime(state['due_at']) if state.get('due_at') else None,
+            'can_undo': Todo.objects.visible_to(request.user, ListMembership.WRITE_ROLES).filter(pk=pk).exists(),
+        })
+
+
+class UndoToEventView(View):
+    """
+    Put a todo back the way it was right after one of its events.
+    
+    The reconstructed title, description, completion and due date are
+    written with one compare_and_set UPDATE and logged as a normal
+    TODO_UPDATED event (old/new), so the undo is itself in the history
+    and can be undone.
+    """
+    
+    @method_decorator(login_required(login_url='/accounts/login/'))
+    def dispatch(self, *args, **kwargs):
+        return super().dispatch(*args, **kwargs)
+    
+    def post(self, request, pk, event_id):
+        todo = get_object_or_404(Todo.objects.active().visible_to(request.user, ListMembership.WRITE_ROLES), pk=pk)
+        state = state_as_of(todo, event_id)
+        if state is None:
+            raise Http404("No such event for this todo")
+        
+        current = current_state(todo)
+        old_data = {name: current[name] for name in UNDO_FIELDS if state.get(name, current[name]) != current[name]}
+        new_data = {name: state[name] for name in old_data}
+        tags_changed = 'tags' in state and state['tags'] != current['tags']
+        if tags_changed:
+            old_data['tags'] = current['tags']
+            new_data['tags'] = state['tags']
+        if not new_data:
+            return JsonResponse({'error': 'No changes detected'}, status=400)
+        
+        if 'title' in new_data and _title_taken(request, new_data['title'], todo.todo_list_id, exclude_pk=todo.pk):
+            return JsonResponse({'error': 'A todo with this title already exists'}, status=400)
+        
+        values = {name: new_data[name] for name in ('title', 'description', 'completed') if name in new_data}
+        if 'due_at' in new_data:
+            values['due_at'] = parse_datetime(new_data['due_at']) if new_data['due_at'] else None
+            values['reminder_sent_at'] = None
+        
+        version = _posted_version(request)
+        with transaction.atomic():
+            updated = Todo.objects.compare_and_set(
+                todo.pk, request.user,
+                version=todo.version if version is None else version,
+                **values,
+            )
+            if updated is not None:
+                if tags_changed:
+                    updated.tags.set(Tag.objects.for_names(request.user, new_data['tags']))
+                log_todo_event(
+                    updated, TodoEvent.TODO_UPDATED,
+                    {'old': old_data, 'new': new_data, 'undo_to': event_id},
+                    user=request.user,
+                )
+        
+        if updated is None:
+            return _conflict_response(request, pk)
+        return render(request, 'partials/todo_item.html', {'todo': updated})
+
+
+class TodoListsView(TemplateView):
+    """
+    The user's shared lists, and a form to create one.
+    """
+    template_name = 'todo_lists.html'
+    
+    @method_decorator(login_required(login_url='/accounts/login/'))
+    def dispatch(self, *args, **kwargs):
+        return super().dispatch(*args, **kwargs)
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # One join on the membership index, with the user's role on each list
+        context['lists'] = TodoList.objects.for_user(self.request.user)
+        context['roles'] = ListMembership.ROLE_CHOICES
+        return context
+    
+    def post(self, request):
+        name = request.POST.get('name', '').strip()[:100]
+        if not name:
+            return JsonResponse({'error': 'Name is required'}, status=400)
+        todo_list = TodoList.objects.create_for(request.user, name)
+        return redirect(f"{reverse('todo_app:index')}?list={todo_list.pk}")
+
+
+def _members_response(request, todo_list_id, status=200):
+    """Render the member panel of a list the user is on."""
+    role = list_role(request, todo_list_id)
+    if role is None:
+        raise Http404("No such list")
+    members = (
+        ListMembership.objects.filter(todo_list_id=todo_list_id)
+        .select_related('user').order_by('user__username')
+    )
+    return render(request, 'partials/list_members.html', {
+        'todo_list': get_object_or_404(TodoList, pk=todo_list_id),
+        'members': members,
+        'can_manage': role in ListMembership.MANAGE_ROLES,
+        'roles': ListMembership.ROLE_CHOICES,
+    }, status=status)
+
+
+class ListMembersView(View):
+    """
+    Show a list's members; owners can add members or change their role.
+    """
+    
+    @method_decorator(login_required(login_url='/accounts/login/'))
+    def dispatch(self, *args, **kwargs):
+        return super().dispatch(*args, **kwargs)
+    
+    def get(self, request, pk):
+        return _members_response(request, pk)
+    
+    def post(self, request, pk):
+        if list_role(request, pk) not in ListMembership.MANAGE_ROLES:
+            return JsonResponse({'error': 'Only list owners can manage members'}, status=403)
+        
+        role = request.POST.get('role', ListMembership.ROLE_VIEWER)
+        if role not in dict(ListMembership.ROLE_CHOICES):
+            return JsonResponse({'error': 'Invalid role'}, status=400)
+        user = User.objects.filter(username=request.POST.get('username', '').strip()).first()
+        if user is None:
+            return JsonResponse({'error': 'No user with that username'}, status=400)
+        if user.pk == TodoList.objects.filter(pk=pk).values_list('owner_id', flat=True).first():
+            return JsonResponse({'error': "The list creator's role cannot be changed"}, status=400)
+        
+        # save() rather than a bulk update, so the role cache is invalidated
+        ListMembership.objects.update_or_create(todo_list_id=pk, user=user, defaults={'role': role})
+        return _members_response(request, pk)
+
+
+class RemoveListMemberView(View):
+    """
+    Remove a member from a list (owners only; not the list's creator).
+    """
+    
+    @method_decorator(login_required(login_url='/accounts/login/'))
+    def dispatch(self, *args, **kwargs):
+        return super().dispatch(*args, **kwargs)
+    
+    def post(self, request, pk, user_id):
+        if list_role(request, pk) not in ListMembership.MANAGE_ROLES:
+            return JsonResponse({'error': 'Only list owners can manage members'}, status=403)
+        membership = get_object_or_404(
+            ListMembership.objects.exclude(todo_list__owner_id=user_id), todo_list_id=pk, user_id=user_id
+        )
+        membership.delete()
+        return _members_response(request, pk)
+
+
+class ProductivityDashboardView(TemplateView):
+    """
+    Per-user productivity dashboard, read only from the DailyTodoStats rollups.
+    """
+    template_name = 'dashboard.html'
+    
+    @method_decorator(login_required(login_url='/accounts/login/'))
+    def dispatch(self, *args, **kwargs):
+        return super().dispatch(*args, **kwargs)
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        try:
+            days = min(max(int(self.request.GET.get('days', 30)), 1), 365)
+        except ValueError:
+            days = 30
+        
+        stats = DailyTodoStats.objects.for_user(self.request.user, days=days)
+        totals = stats.aggregate(
+            created=Sum('created_count'),
+            completed=Sum('completed_count'),
+            completion_seconds=Sum('completion_seconds'),
+        )
+        completed = totals['completed'] or 0
+        
+        context.update({
+            'stats': stats,
+            'days': days,
+            'total_created': totals['created'] or 0,
+            'total_completed': completed,
+            'avg_completion_hours': (
+                totals['completion_seconds'] / completed / 3600 if completed else None
+            ),
+        })
+        return context
+
+
+def _activity_page(request):
+    """
+    One keyset page of the user's events across all todos.
+    
+    The todo title is pulled in with select_related, so a page of any size
+    is a single query against the (user, -timestamp, -id) index.
+    """
+    events = (
+        TodoEvent.objects.filter(user=request.user)
+        .select_related('todo')
+        .only('id', 'event_type', 'timestamp', 'details', 'todo_id', 'todo__title', 'todo__is_deleted')
+    )
+    event_types = [t for t in request.GET.getlist('type') if t in dict(TodoEvent.EVENT_CHOICES)]
+    if event_types:
+        events = events.filter(event_type__in=event_types)
+    
+    try:
+        limit = min(max(int(request.GET.get('limit', 20)), 1), 100)
+    except ValueError:
+        limit = 20
+    
+    rows, next_cursor = keyset_page(events, 'timestamp', request.GET.get('cursor'), limit)
+    return {
+        'events': rows,
+        'event_types': event_types,
+        'event_choices': TodoEvent.EVENT_CHOICES,
+        'has_next': next_cursor is not None,
+        'next_cursor': next_cursor,
+        'filter_query': ''.join(f'&type={t}' for t in event_types),
+    }
+
+
+class ActivityFeedView(TemplateView):
+    """
+    Recent activity across all of the user's todos.
+    """
+    template_name = 'activity_feed.html'
+    
+    @method_decorator(login_required(login_url='/accounts/login/'))
+    def dispatch(self, *args, **kwargs):
+        return super().dispatch(*args, **kwargs)
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update(_activity_page(self.request))
+        return context
+
+
+class LoadMoreActivityView(View):
+    """
+    Load the next page of the activity feed with infinite scroll.
+    """
+    
+    @method_decorator(login_required(login_url='/accounts/login/'))
+    def dispatch(self, *args, **kwargs):
+        return super().dispatch(*args, **kwargs)
+    
+    def get(self, request):
+        return render(request, 'partials/activity_items.html', _activity_page(request))
+
+
 # class LogoutView(AuthLogoutView):
 #     """Custom logout view"""
 #     next_page = '/'
 
 @method_decorator(login_required(login_url='/accounts/login/'), name='dispatch')
 class MailTodosView(View):
+    """
+    Queue the todo digest email, coalescing repeated clicks onto one task.
+    """
 
     def post(self, request):
+        # Imported here so Celery is only loaded by the first mail request
+        from .tasks import enqueue_todos_email
 
-        send_todos_email.delay(request.user.id)
+        task_id, status, created = enqueue_todos_email(request.user.id)
 
         # without celery, for testing
         # send_todos_email(request.user.id)
 
-        return JsonResponse({
-            "status": "Email is being sent 📧"
+        return _mail_status_response(request, task_id, status, created)
+
+
+@method_decorator(login_required(login_url='/accounts/login/'), name='dispatch')
+class MailTodosStatusView(View):
+    """
+    Polled by the mail status fragment until the digest is sent or failed.
+    """
+
+    def get(self, request):
+        from .tasks import get_todos_email_task
+
+        task_id, status = get_todos_email_task(request.user.id)
+        if task_id is None:
+            if request.htmx:
+                return render(request, 'partials/empty.html')
+            return JsonResponse({'status': None})
+        return _mail_status_response(request, task_id, status, created=False)
+
+
+def _mail_status_response(request, task_id, status, created):
+    from .tasks import MAIL_STATUS_QUEUED, MAIL_STATUS_RUNNING
+
+    if request.htmx:
+        return render(request, 'partials/mail_status.html', {
+            'status': status,
+            'created': created,
+            'polling': status in (MAIL_STATUS_QUEUED, MAIL_STATUS_RUNNING),
         })
+    return JsonResponse({
+        'task_id': task_id,
+        'status': status,
+        'created': created,
+    })
+
+
+# JSON API for non-HTML clients (mobile, CLI). Reads go through values()
+# with sparse ?fields= and keyset cursors; see api.py for the encoding.
+
+class ApiView(View):
+    """
+    Base for the JSON API views: 401 instead of a login redirect, and
+    client errors as {"error": ...} instead of HTML error pages.
+    
+    Browser clients use their session, and writes need the CSRF token as
+    for the HTML views. Other clients send "Authorization: Bearer <key>"
+    with a key from the create_api_token command; such requests are
+    authenticated by ApiTokenMiddleware and are not CSRF checked.
+    """
+    
+    @method_decorator(api.api_login_required)
+    def dispatch(self, *args, **kwargs):
+        try:
+            return super().dispatch(*args, **kwargs)
+        except api.ApiError as error:
+            return api.json_response({'error': error.message}, status=error.status)
+        except Http404:
+            return api.json_response({'error': 'Not found'}, status=404)
+
+
+class ApiTodosView(ApiView):
+    """
+    GET: one page of the active top-level todos of a list (?list=, default
+    the personal todos), in manual order, with the ?status= and ?tag=
+    filters of the HTML list. Pages by (rank, id) with ?cursor=.
+    """
+    
+    def get(self, request):
+        fields = api.parse_fields(request, api.TODO_FIELDS)
+        todos = _scoped_todos(request, _list_filter(request))
+        status = _status_filter(request)
+        if status:
+            todos = todos.with_status(status)
+        tag = _tag_filter(request)
+        if tag is not None:
+            todos = todos.filter(tags__id=tag)
+        
+        rows, next_cursor = keyset_page(
+            api.todo_values(todos, fields), 'rank', request.GET.get('cursor'),
+            api.parse_limit(request), descending=False,
+        )
+        etag = api.todo_etag(rows, fields, extra=next_cursor or '')
+        not_modified = api.conditional(request, etag)
+        if not_modified is not None:
+            return not_modified
+        api.attach_tags(rows, fields)
+        return api.json_response(
+            {'results': api.trim(rows, fields), 'next_cursor': next_cursor}, etag=etag,
+        )
+
 
+class ApiTodoBatchView(ApiView):
+    """
+    GET ?ids=1,2,3: the visible active todos among those ids, in the order
+    asked, plus the ids that were not found.
+    
+    POST {"operations": [...]}: apply up to api.MAX_BATCH operations, each
+    {"op": "toggle" | "update" | "delete", "id": ..., "version": ...}
+    (with a version, any op on a todo changed since gives 409;
+    "update" also takes title, description, due_at and status, which may
+    be pending or in_progress on an open todo). The todos are
+    loaded with one query; every operation then runs on its own, as the
+    matching HTML view would, so one conflict does not fail the others.
+    """
+    
+    def get(self, request):
+        ids = api.parse_ids(request.GET.get('ids', ''))
+        fields = api.parse_fields(request, api.TODO_FIELDS)
+        found = {
+            row['id']: row for row in
+            api.todo_values(Todo.objects.active().visible_to(request.user).filter(pk__in=ids), fields).order_by()
+        }
+        rows = [found[pk] for pk in ids if pk in found]
+        missing = [pk for pk in ids if pk not in found]
+        
+        etag = api.todo_etag(rows, fields, extra=missing)
+        not_modified = api.conditional(request, etag)
+        if not_modified is not None:
+            return not_modified
+        api.attach_tags(rows, fields)
+        return api.json_response({'results': api.trim(rows, fields), 'missing': missing}, etag=etag)
+    
+    def post(self, request):
+        try:
+            operations = json.loads(request.body)['operations']
+        except (ValueError, KeyError, TypeError):
+            raise api.ApiError('Expected {"operations": [...]}')
+        if not isinstance(operations, list) or not all(isinstance(op, dict) for op in operations):
+            raise api.ApiError('operations must be a list of objects')
+        if len(operations) > api.MAX_BATCH:
+            raise api.ApiError(f"At most {api.MAX_BATCH} operations per request")
+        # The middleware took one token for the request; each operation is a write
+        rejected = RateLimitMiddleware.charge(request, len(operations) - 1)
+        if rejected is not None:
+            return rejected
+        
+        ids = [op.get('id') for op in operations if isinstance(op.get('id'), int)]
+        todos = Todo.objects.active().visible_to(request.user, ListMembership.WRITE_ROLES).in_bulk(ids)
+        return api.json_response({'results': [self._apply(request, op, todos) for op in operations]})
+    
+    def _apply(self, request, op, todos):
+        todo = todos.get(op.get('id'))
+        if todo is None:
+            return {'id': op.get('id'), 'status': 404, 'error': 'Not found'}
+        kind = op.get('op')
+        version = op.get('version')
+        if version is not None and not isinstance(version, int):
+            return {'id': todo.pk, 'status': 400, 'error': 'version must be an integer'}
+        
+        if kind == 'delete':
+            with transaction.atomic():
+                # Lock the row so a concurrent edit cannot slip in between
+                # the version check and the delete
+                locked = Todo.objects.select_for_update().filter(pk=todo.pk, is_deleted=False)
+                if version is not None:
+                    locked = locked.filter(version=version)
+                locked = locked.first()
+                if locked is None:
+                    return {'id': todo.pk, 'status': 409, 'error': 'This todo was changed elsewhere, please retry'}
+                locked._current_user = request.user
+                locked.soft_delete()
+            del todos[todo.pk]
+            return {'id': todo.pk, 'status': 200}
+        
+        if kind == 'toggle':
+            with transaction.atomic():
+                updated = Todo.objects.compare_and_set(todo.pk, request.user, version=version, toggle_completed=True)
+                if updated is not None:
+                    log_todo_event(
+                        updated,
+                        TodoEvent.TODO_CHECKED if updated.completed else TodoEvent.TODO_UNCHECKED,
+                        {'completed': updated.completed, 'title': updated.title},
+                        user=request.user,
+                    )
+        elif kind == 'update':
+            title = op.get('title', todo.title)
+            description = op.get('description', todo.description)
+            if not isinstance(title, str) or not title.strip() or not isinstance(description, str):
+                return {'id': todo.pk, 'status': 400, 'error': 'Title required'}
+            title, description = title.strip(), description.strip()
+            status = op.get('status', todo.status)
+            if status != todo.status and (
+                status not in (Todo.STATUS_PENDING, Todo.STATUS_IN_PROGRESS) or todo.completed
+            ):
+                return {'id': todo.pk, 'status': 400, 'error': 'status must be pending or in_progress on an open todo'}
+            due_at = todo.due_at
+            if 'due_at' in op:
+                due_at = parse_datetime(op['due_at']) if isinstance(op['due_at'], str) else None
+                if op['due_at'] is not None and due_at is None:
+                    return {'id': todo.pk, 'status': 400, 'error': 'Invalid due date'}
+                if due_at is not None and timezone.is_naive(due_at):
+                    due_at = timezone.make_aware(due_at)
+            if _title_taken(request, title, todo.todo_list_id, exclude_pk=todo.pk):
+                return {'id': todo.pk, 'status': 400, 'error': 'A todo with this title already exists'}
+            
+            old_data = {'title': todo.title, 'description': todo.description}
+            new_data = {'title': title, 'description': description}
+            extra = {}
+            if todo.due_at != due_at:
+                old_data['due_at'] = todo.due_at.isoformat() if todo.due_at else None
+                new_data['due_at'] = due_at.isoformat() if due_at else None
+                extra = {'due_at': due_at, 'reminder_sent_at': None}
+            if todo.status != status:
+                old_data['status'], new_data['status'] = todo.status, status
+                extra['status'] = status
+            with transaction.atomic():
+                updated = Todo.objects.compare_and_set(
+                    todo.pk, request.user, version=version,
+                    title=title, description=description, **extra,
+                )
+                if updated is not None:
+                    log_todo_event(updated, TodoEvent.TODO_UPDATED, {'old': old_data, 'new': new_data}, user=request.user)
+        else:
+            return {'id': todo.pk, 'status': 400, 'error': 'op must be toggle, update or delete'}
+        
+        if updated is None:
+            return {'id': todo.pk, 'status': 409, 'error': 'This todo was changed elsewhere, please retry'}
+        # A later operation on the same todo starts from this state
+        todos[todo.pk] = updated
+        return {'id': todo.pk, 'status': 200, 'version': updated.version, 'updated_at': updated.updated_at}
+
+
+class ApiActivityView(ApiView):
+    """
+    GET: one keyset page of the user's events across all todos, newest
+    first, optionally filtered by ?type=. Same index as the HTML feed.
+    """
+    
+    def get(self, request):
+        fields = api.parse_fields(request, api.EVENT_FIELDS)
+        events = TodoEvent.objects.filter(user=request.user)
+        event_types = [t for t in request.GET.getlist('type') if t in dict(TodoEvent.EVENT_CHOICES)]
+        if event_types:
+            events = events.filter(event_type__in=event_types)
+        
+        rows, next_cursor = keyset_page(
+            events.values(*dict.fromkeys(fields + ['timestamp'])), 'timestamp',
+            request.GET.get('cursor'), api.parse_limit(request),
+        )
+        etag = api.event_etag(rows, fields, extra=next_cursor or '')
+        not_modified = api.conditional(request, etag)
+        if not_modified is not None:
+            return not_modified
+        if 'timestamp' not in fields:
+            for row in rows:
+                del row['timestamp']
+        return api.json_response({'results': rows, 'next_cursor': next_cursor}, etag=etag)